@@ -1,10 +1,22 @@
+import argparse
 import ast
 import asyncio
+import contextvars
 import json
+import os
 import re
+import time
+
+from ollama import Message
 
 import mcp_client
-from llm_utils import OLLAMA_MODEL, OLLAMA_BASE_URL, get_client
+from llm_pool import Backend, close_pool, get_pool
+from agent_session import AgentSession, list_sessions
+from llm_utils import DEFAULT_OPTIONS, OLLAMA_MODEL, OLLAMA_BASE_URL
+from query_cache import QueryCache
+from schema_catalog import SchemaCatalog
+from sql_guard import QueryRejected, guard_query, query_lock, table_sizes
+from tool_results import AGENT_RESULT_MAX_ROWS, compact_result, export_csv
 
 # --------------------------------------------------------------------------
 # --- 1. CONFIGURATION ---
@@ -24,6 +36,8 @@ SYSTEM_PROMPT = (
     "T2Online.dbo.InventQuantities — Trakker qty view per part+location.\n"
     "  Key columns: IqtPartNumber, IqtLocationCode, IqtQtyOnHand, IqtQtyConsume,\n"
     "  IqtQtyTransferIn, IqtQtyTransferOut, IqtQtyAllocate.\n\n"
+    "Each question may come with the columns of the tables it refers to, from a local schema catalog; "
+    "use them instead of calling describe_table.\n"
     "Before calling any tool, write one sentence starting with 'Plan: '. Then call the tool.\n"
     "When answering directly, respond normally."
 )
@@ -120,8 +134,61 @@ TOOLS = [
 # Maps Ollama tool names to mcp_client calls.
 # --------------------------------------------------------------------------
 
+# Record of the question being answered (run_agent): whether to echo progress,
+# LLM turn stats, tool timings and the SQL executed. A contextvar so questions
+# run concurrently by run_batch() each fill their own.
+_RUN: contextvars.ContextVar[dict] = contextvars.ContextVar("agent_run")
+
+
+def _say(*args, **kwargs):
+    """print() unless the current question runs quietly (batch mode)."""
+    run = _RUN.get(None)
+    if run is None or run["echo"]:
+        print(*args, **kwargs)
+
+
+def _note(key: str, entry: dict):
+    run = _RUN.get(None)
+    if run is not None:
+        run[key].append(entry)
+
+
+# Local schema catalog (schema_catalog.py); loaded and refreshed in main()
+CATALOG: SchemaCatalog | None = None
+# Question -> SQL template cache (query_cache.py); None with --no-query-cache
+QUERY_CACHE: QueryCache | None = None
+# Table row counts for the SQL guard (sql_guard.py); catalog counts plus SQL_GUARD_TABLE_SIZES
+TABLE_SIZES: dict[str, int] = table_sizes()
+
+
 async def dispatch_tool(name: str, args: dict) -> str:
-    """Routes an Ollama tool call to the appropriate MCP tool."""
+    """
+    Routes an Ollama tool call to the appropriate MCP tool. describe_table and
+    list_tables are answered from the schema catalog when it has the table/database.
+    execute_query goes through the SQL guard first; a rejected query comes back
+    as an error with a hint so the model can rewrite it.
+    """
+    if name == "execute_query":
+        # With the cost pre-check on, no other query may run between its SHOWPLAN calls
+        async with query_lock():
+            try:
+                query, notes = await guard_query(args.get("query", ""), args.get("database", "Inventory"), TABLE_SIZES)
+            except QueryRejected as e:
+                _say(f"[Guard] Rejected: {e}")
+                return json.dumps({"error": "Query rejected by guard", "hint": str(e)})
+            if notes:
+                _say(f"[Guard] {'; '.join(notes)}")
+            args = {**args, "query": query}
+            _note("sql", {"database": args.get("database", "Inventory"), "query": query})
+            return await mcp_client.call_tool(name, args)
+    if CATALOG is not None:
+        local = None
+        if name == "describe_table":
+            local = CATALOG.describe(args.get("tableName", ""), args.get("database"), args.get("schema"))
+        elif name == "list_tables":
+            local = CATALOG.list_tables(args.get("database", "Inventory"))
+        if local is not None:
+            return local
     if name in ("execute_query", "list_tables", "describe_table"):
         return await mcp_client.call_tool(name, args)
     return json.dumps({"error": f"Unknown tool: {name}"})
@@ -153,6 +220,20 @@ def _try_parse_func_call(text: str) -> tuple[str, dict] | None:
     return None
 
 
+def _calls_from_json(items) -> list[tuple[str, dict]]:
+    """[(name, args)] from a JSON tool-call array ([{"name", "arguments"}] or [{"function": {...}}])."""
+    calls = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        func = item.get("function", {})
+        name = func.get("name") or item.get("name")
+        args = item.get("arguments") or func.get("arguments") or {}
+        if name and isinstance(args, dict):
+            calls.append((name, args))
+    return calls
+
+
 def _parse_turn1(msg) -> tuple[str, list[tuple[str, dict]]]:
     """
     Returns (reasoning_text, [(fn_name, fn_args), ...]).
@@ -177,14 +258,7 @@ def _parse_turn1(msg) -> tuple[str, list[tuple[str, dict]]]:
         reasoning = body[:json_start].strip() if json_start > 0 else ""
         json_str = body[json_start: body.rfind("]") + 1]
         try:
-            items = json.loads(json_str)
-            calls = []
-            for item in items:
-                func = item.get("function", {})
-                name = func.get("name") or item.get("name")
-                args = item.get("arguments") or func.get("arguments") or {}
-                if name and isinstance(args, dict):
-                    calls.append((name, args))
+            calls = _calls_from_json(json.loads(json_str))
             if calls:
                 return reasoning, calls
         except json.JSONDecodeError:
@@ -203,76 +277,507 @@ def _parse_turn1(msg) -> tuple[str, list[tuple[str, dict]]]:
     return "", []
 
 
-async def _stream_response(client, messages: list):
-    """Stream Turn 2 (summary), printing content tokens as they arrive."""
-    async for chunk in await client.chat(
-        model=OLLAMA_MODEL, messages=messages, stream=True
-    ):
-        content = chunk.message.content or ""
-        if content:
-            print(content, end="", flush=True)
-    print()  # trailing newline
+def _balanced_end(text: str, start: int, open_ch: str, close_ch: str) -> int | None:
+    """
+    Index just past the bracket matching text[start] (== open_ch), skipping
+    quoted strings; None while the bracket is still open.
+    """
+    depth, quote, i = 0, "", start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = ""
+        elif ch in "\"'":
+            quote = ch
+        elif ch == open_ch:
+            depth += 1
+        elif ch == close_ch:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return None
+
 
+# Text that may open a tool call; streamed prose is held back from here on
+_CALL_MARKERS = ("[", "<|", *(f"{t}(" for t in _KNOWN_TOOLS))
 
-async def run_agent(user_request: str):
+
+class TurnStream:
+    """
+    Incremental _parse_turn1 over a streamed turn. feed() each chunk's message;
+    it returns the tool calls as soon as one of the three forms is complete
+    (native tool_calls, a JSON array that parses, or a closed execute_query(...)
+    call), so the caller can dispatch without waiting for trailing tokens.
+    printable() returns prose that can't be part of a tool call.
     """
-    Async agent loop. Sends the user request to Ollama, executes any
-    tool calls via the MCP server, then streams the final summary.
+
+    def __init__(self):
+        self.content = ""
+        self.tool_calls: list = []
+        self.call_start: int | None = None
+        self._printed = 0
+
+    def feed(self, chunk_msg) -> list[tuple[str, dict]] | None:
+        self.content += chunk_msg.content or ""
+        if chunk_msg.tool_calls:
+            self.tool_calls.extend(chunk_msg.tool_calls)
+            json_start = self._body().find("[")
+            self.call_start = json_start if json_start != -1 else len(self._body())
+            return [(tc.function.name, tc.function.arguments) for tc in self.tool_calls]
+        return self._complete_call()
+
+    def _body(self) -> str:
+        # Strip the <|/tool_call|> suffix phi4-mini may append
+        marker = self.content.find("<|/tool_call|>")
+        return self.content[:marker] if marker != -1 else self.content
+
+    def _complete_call(self) -> list[tuple[str, dict]] | None:
+        body = self._body()
+        json_start = body.find("[")
+        if json_start != -1:
+            end = _balanced_end(body, json_start, "[", "]")
+            if end is not None:
+                try:
+                    calls = _calls_from_json(json.loads(body[json_start:end]))
+                except json.JSONDecodeError:
+                    calls = []
+                if calls:
+                    self.call_start = json_start
+                    return calls
+        for tool_name in _KNOWN_TOOLS:
+            idx = body.find(f"{tool_name}(")
+            if idx == -1:
+                continue
+            end = _balanced_end(body, idx + len(tool_name), "(", ")")
+            parsed = _try_parse_func_call(body[idx:end]) if end is not None else None
+            if parsed:
+                self.call_start = idx
+                return [parsed]
+        return None
+
+    def _hold_from(self) -> int:
+        """Where a tool call could be starting: the first marker, or a partial marker at the end."""
+        text = self.content
+        hold = min((i for i in (text.find(m) for m in _CALL_MARKERS) if i != -1), default=len(text))
+        for marker in _CALL_MARKERS:
+            for n in range(min(len(marker) - 1, len(text)), 0, -1):
+                if text.endswith(marker[:n]):
+                    hold = min(hold, len(text) - n)
+                    break
+        return hold
+
+    def printable(self, final: bool = False) -> str:
+        """
+        Prose not printed yet. Once a call is found that is everything before
+        it; with final=True (the turn ended without a call) everything left.
+        """
+        if final:
+            end = len(self.content)
+        elif self.call_start is not None:
+            end = self.call_start
+        else:
+            end = self._hold_from()
+        end = max(self._printed, end)
+        text, self._printed = self.content[self._printed:end], end
+        return text
+
+    def message(self) -> Message:
+        return Message(role="assistant", content=self.content, tool_calls=self.tool_calls or None)
+
+
+async def _stream_turn(backend: Backend | None, messages: list) -> tuple[Message, list[tuple[str, dict]]]:
     """
-    print("==============================================")
-    print(f"USER: {user_request}")
-    print("==============================================\n")
+    Stream one tool-deciding turn through the pool (preferring `backend`),
+    printing prose live. Returns (assistant message, tool calls). The stream
+    is closed as soon as a tool call is complete, which also stops Ollama
+    generating the rest of the turn.
+    """
+    turn = TurnStream()
+    start = time.perf_counter()
+    stream = get_pool().chat_stream(OLLAMA_MODEL, prefer=backend, messages=messages, tools=TOOLS,
+                                    options=DEFAULT_OPTIONS)
+    calls, chunks, last = None, 0, None
+    try:
+        async for chunk in stream:
+            chunks, last = chunks + 1, chunk
+            calls = turn.feed(chunk.message)
+            _say(turn.printable(), end="", flush=True)
+            if calls:
+                break
+    finally:
+        await stream.aclose()
+
+    if not calls:
+        # Stream ended: the whole-message parser catches anything incremental parsing missed
+        _, calls = _parse_turn1(turn.message())
+        if not calls:
+            _say(turn.printable(final=True), end="")
+    _say(flush=True)
+    _note_llm("tool" if calls else "answer", start, chunks, last)
+    return turn.message(), calls
 
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": user_request},
-    ]
-    client = get_client()
+
+def _note_llm(kind: str, start: float, chunks: int, last):
+    """
+    Record one streamed LLM turn. Ollama reports token counts on the final
+    chunk; a stream closed early at a tool call has no final chunk, so its
+    eval tokens are counted as streamed chunks (one token each) and its
+    prompt tokens are unknown.
+    """
+    done = last is not None and getattr(last, "done", False)
+    _note("llm", {
+        "kind": kind,
+        "ms": round((time.perf_counter() - start) * 1000),
+        "prompt_tokens": getattr(last, "prompt_eval_count", None) if done else None,
+        "eval_tokens": (getattr(last, "eval_count", None) or chunks) if done else chunks,
+    })
+
+
+async def _stream_response(backend: Backend | None, messages: list) -> str:
+    """Stream Turn 2 (summary), printing content tokens as they arrive. Returns the text."""
+    start = time.perf_counter()
+    text, chunks, last = [], 0, None
+    stream = get_pool().chat_stream(OLLAMA_MODEL, prefer=backend, messages=messages, options=DEFAULT_OPTIONS)
+    try:
+        async for chunk in stream:
+            chunks, last = chunks + 1, chunk
+            content = chunk.message.content or ""
+            if content:
+                text.append(content)
+                _say(content, end="", flush=True)
+    finally:
+        await stream.aclose()
+    _say()  # trailing newline
+    _note_llm("summary", start, chunks, last)
+    return "".join(text)
+
+
+async def _timed_dispatch(name: str, args: dict) -> tuple[str, float]:
+    """dispatch_tool with wall time in ms; a failing call becomes an error result instead of raising."""
+    start = time.perf_counter()
+    try:
+        result = await dispatch_tool(name, args)
+    except Exception as e:
+        result = json.dumps({"error": f"{name} failed: {e}"})
+    ms = (time.perf_counter() - start) * 1000
+    _note("tools", {"tool": name, "ms": round(ms), "error": _is_error(result)})
+    return result, ms
+
+
+async def _run_tool_calls(tool_calls: list[tuple[str, dict]]) -> list[tuple[str, float]]:
+    """Dispatch every call of a turn concurrently. Returns [(result, ms)] in call order."""
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_timed_dispatch(name, args) for name, args in tool_calls))
+    if len(tool_calls) > 1:
+        wall = (time.perf_counter() - start) * 1000
+        _say(f"--- {len(tool_calls)} tool calls: {wall:.0f} ms wall, "
+              f"{sum(ms for _, ms in results):.0f} ms summed ---")
+    return list(results)
+
+
+def _is_error(result: str) -> bool:
+    try:
+        data = json.loads(result)
+    except (json.JSONDecodeError, ValueError):
+        return False
+    return isinstance(data, dict) and (bool(data.get("error")) or data.get("success") is False)
+
+
+async def _execute_calls(messages: list, tool_calls: list[tuple[str, dict]]) -> bool:
+    """
+    Run one turn's tool calls and append their compacted results to messages.
+    Returns True when every call succeeded.
+    """
+    for fn_name, fn_args in tool_calls:
+        _say(f"--- TOOL CALL: {fn_name}({fn_args}) ---")
+    # Independent calls (e.g. GP vs Trakker qty) run concurrently; results keep call order
+    results = await _run_tool_calls(tool_calls)
+    for (fn_name, _), (result, ms) in zip(tool_calls, results):
+        # Row cap + column stats instead of raw JSON; the full result is stored for :export
+        content, info = compact_result(result)
+        if info["truncated"]:
+            _say(f"--- TOOL RESULT: {fn_name} {ms:.0f} ms, {info['rows']} rows, {info['raw_chars']} chars -> "
+                  f"~{info['tokens']} tokens to model ({info['rows'] - AGENT_RESULT_MAX_ROWS} rows cut; "
+                  f":export {info['result_id']}) ---\n")
+        else:
+            _say(f"--- TOOL RESULT: {fn_name} {ms:.0f} ms, {info['raw_chars']} chars, ~{info['tokens']} tokens to model"
+                  + (f" (:export {info['result_id']})" if info["result_id"] else "") + " ---\n")
+        messages.append({"role": "tool", "content": content})
+    return not any(_is_error(result) for result, _ in results)
+
+
+def _message_dict(msg: Message) -> dict:
+    """Plain-dict copy of a streamed assistant turn, so session history is JSON and re-renders identically."""
+    message = {"role": "assistant", "content": msg.content or ""}
+    if msg.tool_calls:
+        message["tool_calls"] = [{"function": {"name": tc.function.name, "arguments": dict(tc.function.arguments)}}
+                                 for tc in msg.tool_calls]
+    return message
+
+
+def _call_message(tool_calls: list[tuple[str, dict]]) -> dict:
+    """Assistant turn carrying tool calls in the JSON-array form phi4-mini writes itself."""
+    return {"role": "assistant",
+            "content": json.dumps([{"name": name, "arguments": args} for name, args in tool_calls])}
+
+
+async def _answer_from_cache(cache: QueryCache, backend: Backend | None, messages: list,
+                             user_request: str) -> tuple[str, list[dict]] | None:
+    """
+    Answer from a cached SQL template: run its queries with this question's
+    values, then stream the summary. Returns (answer, the call and result
+    messages), or None (and drops the entry) if there was no hit or a query
+    failed, so the normal loop takes over.
+    """
+    run = _RUN.get()
+    hit = cache.lookup(user_request)
+    if hit is None:
+        run["cache"] = "miss"
+        _say(f"[QueryCache] Miss (hit rate {cache.hit_rate()})")
+        return None
+    _say(f"[QueryCache] Hit, same question as \"{hit['question']}\" — "
+          f"skipping SQL generation (hit rate {cache.hit_rate()})\n")
+    attempt = messages + [_call_message(hit["calls"])]
+    if not await _execute_calls(attempt, hit["calls"]):
+        run["cache"] = "stale"
+        _say("[QueryCache] Cached SQL failed; dropped the entry, asking the model.\n")
+        cache.invalidate(hit["template"])
+        return None
+    run["cache"] = "hit"
+    _say("[Response]")
+    return await _stream_response(backend, attempt), attempt[len(messages):]
+
+
+async def _answer(user_request: str, cache: QueryCache | None, backend: Backend | None,
+                  session: AgentSession | None = None) -> tuple[str, list[dict]]:
+    """
+    The agent loop proper. Returns (final answer, this question's messages
+    from the user turn through the answer) for the session history.
+    """
+    # Inline the schema of the tables the question mentions, so the model
+    # doesn't spend turns on describe_table
+    schema = CATALOG.context_for(user_request) if CATALOG is not None else ""
+    if schema:
+        _say(f"[Schema] {len(schema.splitlines())} table(s) from the catalog\n")
+    content = f"Relevant schema:\n{schema}\n\nQuestion: {user_request}" if schema else user_request
+    if session is not None:
+        messages = session.messages(content)
+    else:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ]
+    first = len(messages) - 1
+
+    if cache is not None:
+        cached = await _answer_from_cache(cache, backend, messages, user_request)
+        if cached is not None:
+            answer, calls = cached
+            return answer, messages[first:] + calls + [{"role": "assistant", "content": answer}]
 
     # --- Agentic loop: up to 4 turns to handle tool calls and retries ---
     MAX_TURNS = 4
+    last_calls, last_ok, answer = [], False, None
     for turn in range(MAX_TURNS):
         is_first_turn = turn == 0
         if is_first_turn:
-            print("Thinking...", flush=True)
+            _say("Thinking...", flush=True)
 
-        response = await client.chat(model=OLLAMA_MODEL, messages=messages, tools=TOOLS)
-        msg = response.message
-
-        reasoning, tool_calls = _parse_turn1(msg)
-        if reasoning:
-            print(f"[Thinking] {reasoning}\n")
+        # Prose (the "Plan: " sentence, or a direct answer) prints as it streams
+        msg, tool_calls = await _stream_turn(backend, messages)
 
         if not tool_calls:
-            # Model answered directly — print and stop
-            print("[Response]")
-            print(msg.content)
+            # Model answered directly — already printed, stop
+            answer = msg.content or ""
             break
 
-        messages.append(msg)
-        for fn_name, fn_args in tool_calls:
-            print(f"--- TOOL CALL: {fn_name}({fn_args}) ---")
-            result = await dispatch_tool(fn_name, fn_args)
-            print(f"--- TOOL RESULT: {len(result)} chars ---\n")
-            messages.append({"role": "tool", "content": result})
+        messages.append(_message_dict(msg))
+        last_calls = tool_calls
+        last_ok = await _execute_calls(messages, tool_calls)
 
         # If this was the last allowed turn, force a final summary
         if turn == MAX_TURNS - 1:
-            print("[Response]")
-            await _stream_response(client, messages)
+            _say("[Response]")
+            answer = await _stream_response(backend, messages)
             break
 
-    print("\n==========================")
-    print("= DONE                   =")
-    print("==========================\n")
+    # The calls that produced the answer become a reusable template
+    if cache is not None and answer is not None and last_ok and cache.put(user_request, last_calls):
+        _say(f"[QueryCache] Saved SQL template ({len(cache)} cached)")
+    answer = answer or ""
+    return answer, messages[first:] + [{"role": "assistant", "content": answer}]
+
+
+async def run_agent(user_request: str, use_cache: bool = True, echo: bool = True,
+                    session: AgentSession | None = None) -> dict:
+    """
+    Async agent loop. Streams each turn from Ollama, executes tool calls via
+    the MCP server as soon as they are complete, and stops at the first turn
+    without a tool call (or forces a streamed summary after MAX_TURNS).
+    A question matching the query cache skips the tool-deciding turns; a
+    question answered through execute_query calls is added to the cache.
+
+    Returns the run record: question, answer, sql (executed), tools and llm
+    (per-call timings and token counts), cache outcome, totals, and error if
+    the question failed. echo=False answers without printing (batch mode).
+
+    With a session the question is asked after the session's summary and
+    recent exchanges, and its exchange is added to the session afterwards.
+    The query cache is only used for a session's first question: a follow-up's
+    SQL can depend on earlier context that its wording doesn't carry.
+    """
+    run = {"question": user_request, "echo": echo, "answer": "", "cache": None,
+           "sql": [], "tools": [], "llm": [], "error": None}
+    token = _RUN.set(run)
+    start = time.perf_counter()
+    # Turns prefer one backend per question, so follow-up turns reuse its KV cache;
+    # the pool counts outstanding streams, fails over and applies LLM_CALL_TIMEOUT
+    backend = get_pool().pick(OLLAMA_MODEL)
+    try:
+        _say("==============================================")
+        _say(f"USER: {user_request}")
+        _say("==============================================\n")
+        if session is not None and len(session):
+            use_cache = False
+            _say(f"[Session] {len(session)} recent exchange(s) (~{session.tokens()} tokens)"
+                 + (f" + {len(session.summary)} summarized" if session.summary else "") + "\n")
+        run["answer"], exchange = await _answer(
+            user_request, QUERY_CACHE if use_cache else None, backend, session,
+        )
+        if session is not None:
+            folded = session.add(user_request, exchange, run["answer"], [q["query"] for q in run["sql"]])
+            if folded:
+                _say(f"[Session] Folded {folded} older exchange(s) into the running summary")
+        _print_done()
+    except Exception as e:
+        run["error"] = f"{type(e).__name__}: {e}"
+        if echo:
+            raise
+    finally:
+        _RUN.reset(token)
+    run.pop("echo")
+    run["total_ms"] = round((time.perf_counter() - start) * 1000)
+    run["llm_ms"] = sum(c["ms"] for c in run["llm"])
+    run["tool_ms"] = sum(c["ms"] for c in run["tools"])
+    run["prompt_tokens"] = sum(c["prompt_tokens"] or 0 for c in run["llm"])
+    run["eval_tokens"] = sum(c["eval_tokens"] or 0 for c in run["llm"])
+    return run
+
+
+def _print_done():
+    _say("\n==========================")
+    _say("= DONE                   =")
+    _say("==========================\n")
 
 
 # --------------------------------------------------------------------------
 # --- 5. ENTRY POINT ---
 # --------------------------------------------------------------------------
 
-async def main():
-    print("Inventory Agent — type 'exit' or 'quit' to stop.\n")
+async def load_catalog(force: bool = False):
+    """Load the schema catalog and rebuild stale databases; keep the cached copy if MCP is down."""
+    global CATALOG, TABLE_SIZES
+    CATALOG = SchemaCatalog.load()
+    try:
+        rebuilt = await CATALOG.refresh(force=force)
+    except Exception as e:
+        print(f"[Schema] Catalog refresh failed ({e}); using the cached copy.")
+        rebuilt = None
+    TABLE_SIZES = table_sizes(CATALOG)
+    if rebuilt is None:
+        return
+    if rebuilt:
+        print(f"[Schema] Rebuilt catalog for {', '.join(rebuilt)}.")
+    print(f"[Schema] {len(CATALOG)} table(s)/view(s) cataloged.\n")
+
+
+# Questions answered at once by --batch (default: the Ollama pool's total weight)
+AGENT_BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "0")) or get_pool().total_weight(OLLAMA_MODEL)
+
+
+def read_questions(path: str) -> list[str]:
+    """One question per line; blank lines and '#' comments are skipped."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def run_batch(path: str, out_path: str | None = None, concurrency: int = AGENT_BATCH_CONCURRENCY,
+                    use_query_cache: bool = True) -> str:
+    """
+    Answer every question in `path` without prompting, up to `concurrency` at
+    a time over the shared MCP session and Ollama pool. Each run record is
+    appended to a JSONL file as it finishes (with its line number in the
+    questions file as "index"). Returns the output path.
+    """
+    global QUERY_CACHE
+    questions = read_questions(path)
+    out_path = out_path or f"agent_batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"
+    print(f"[Batch] {len(questions)} question(s) from {path}, concurrency {concurrency} -> {out_path}")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    records = []
+    start = time.perf_counter()
+
+    async def one(index: int, question: str, out):
+        async with semaphore:
+            record = await run_agent(question, echo=False)
+        record = {"index": index, **record}
+        records.append(record)
+        out.write(json.dumps(record, default=str) + "\n")
+        out.flush()
+        status = f"ERROR {record['error']}" if record["error"] else (
+            f"{len(record['sql'])} SQL, {len(record['llm'])} LLM call(s), "
+            f"{record['prompt_tokens']}+{record['eval_tokens']} tokens"
+            + (f", cache {record['cache']}" if record["cache"] else ""))
+        print(f"[Batch] {len(records)}/{len(questions)} #{index} {record['total_ms'] / 1000:.1f}s — {status}")
+
+    try:
+        # The one shared MCP server is up, and the catalog loaded, before the questions fan out
+        await mcp_client.get_session()
+        await load_catalog()
+        QUERY_CACHE = QueryCache() if use_query_cache else None
+        with open(out_path, "w", encoding="utf-8") as out:
+            await asyncio.gather(*(one(i, q, out) for i, q in enumerate(questions, 1)))
+    finally:
+        await mcp_client.close_session()
+        await close_pool()
+
+    wall = time.perf_counter() - start
+    latencies = [r["total_ms"] / 1000 for r in records]
+    print(f"[Batch] {len(records)} question(s) in {wall:.1f}s "
+          f"({len(records) / wall * 60 if wall else 0:.1f}/min); latency p50 {_percentile(latencies, 50):.1f}s, "
+          f"p90 {_percentile(latencies, 90):.1f}s, max {max(latencies, default=0):.1f}s")
+    print(f"[Batch] LLM calls {sum(len(r['llm']) for r in records)}, tokens "
+          f"{sum(r['prompt_tokens'] for r in records)} prompt + {sum(r['eval_tokens'] for r in records)} eval, "
+          f"errors {sum(1 for r in records if r['error'])}"
+          + (f", query cache hit rate {QUERY_CACHE.hit_rate()}" if QUERY_CACHE is not None else ""))
+    if QUERY_CACHE is not None:
+        QUERY_CACHE.close()
+    return out_path
+
+
+async def main(use_query_cache: bool = True, session_name: str | None = "default", autosave: bool = False):
+    global QUERY_CACHE
+    print("Inventory Agent — type 'exit' or 'quit' to stop, ':refresh-schema' to rebuild the schema catalog, "
+          "':export <id> [file.csv]' to save a full query result, ':fresh <question>' to bypass the query cache, "
+          "':reset' to start a new conversation, ':save [name]' / ':load <name>' / ':sessions' for saved sessions.\n")
+    await load_catalog()
+    QUERY_CACHE = QueryCache() if use_query_cache else None
+    if QUERY_CACHE is not None:
+        print(f"[QueryCache] {len(QUERY_CACHE)} cached SQL template(s).\n")
+    session = None
+    if session_name is not None:
+        session = AgentSession.load(SYSTEM_PROMPT, session_name) if autosave else AgentSession(SYSTEM_PROMPT)
+        if len(session):
+            print(f"[Session] Resumed '{session.name}': {len(session)} exchange(s), {len(session.summary)} summarized.\n")
     while True:
         try:
             user_request = input("Query: ").strip()
@@ -284,7 +789,70 @@ async def main():
         if user_request.lower() in ("exit", "quit", "q"):
             print("Exiting.")
             break
-        await run_agent(user_request)
+        if user_request.lower() == ":refresh-schema":
+            await load_catalog(force=True)
+            continue
+        if user_request.lower().startswith(":export"):
+            parts = user_request.split()
+            if len(parts) < 2:
+                print("Usage: :export <result id> [file.csv]")
+                continue
+            try:
+                print(f"Exported -> {export_csv(parts[1], parts[2] if len(parts) > 2 else None)}")
+            except OSError as e:
+                print(f"[Export] {e}")
+            continue
+        if user_request.lower() in (":reset", ":save", ":sessions") or \
+                user_request.lower().startswith((":save ", ":load ")):
+            if session is None:
+                print("[Session] Sessions are off (--no-session).")
+                continue
+            command, _, name = user_request.partition(" ")
+            command, name = command.lower(), name.strip()
+            try:
+                if command == ":reset":
+                    session.reset()
+                    print("[Session] Cleared; the next question starts a new conversation.")
+                elif command == ":save":
+                    print(f"[Session] Saved -> {session.save(name or None)}")
+                elif command == ":load":
+                    session = AgentSession.load(SYSTEM_PROMPT, name)
+                    print(f"[Session] Loaded '{session.name}': {len(session)} exchange(s), "
+                          f"{len(session.summary)} summarized.")
+                else:
+                    print("[Session] Saved: " + (", ".join(list_sessions()) or "none"))
+            except (OSError, ValueError) as e:
+                print(f"[Session] {e}")
+            continue
+        if user_request.lower().startswith(":fresh "):
+            await run_agent(user_request[len(":fresh "):].strip(), use_cache=False, session=session)
+        else:
+            await run_agent(user_request, session=session)
+        if session is not None and autosave:
+            session.save()
+    if QUERY_CACHE is not None:
+        print(f"[QueryCache] Hit rate this run {QUERY_CACHE.hit_rate()}")
+        QUERY_CACHE.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Interactive inventory investigation agent.")
+    parser.add_argument("--no-query-cache", action="store_true",
+                        help="Always generate SQL with the model (don't read or write the question -> SQL cache)")
+    parser.add_argument("--session", metavar="NAME",
+                        help="Resume the saved session NAME (if any) and save it after every question")
+    parser.add_argument("--no-session", action="store_true",
+                        help="Answer every question independently (no conversation context)")
+    parser.add_argument("--batch", metavar="QUESTIONS",
+                        help="Answer every question in this file (one per line) without prompting; write JSONL results")
+    parser.add_argument("--out", help="JSONL output path for --batch (default: agent_batch_YYYYMMDD_HHMMSS.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=AGENT_BATCH_CONCURRENCY,
+                        help=f"Questions answered at once in --batch mode (default: {AGENT_BATCH_CONCURRENCY})")
+    args = parser.parse_args()
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.out, args.concurrency, use_query_cache=not args.no_query_cache))
+    else:
+        asyncio.run(main(
+            use_query_cache=not args.no_query_cache,
+            session_name=None if args.no_session else (args.session or "default"),
+            autosave=bool(args.session),
+        ))
@@ -0,0 +1,142 @@
+"""
+agent_session.py — Conversation state carried across agent questions.
+
+Without a session every question starts from [system, user], so a follow-up
+("now show the RINVs for that part") has no context and Ollama prefills the
+system prompt from zero each time. A session keeps the messages of earlier
+exchanges (question, tool calls, compacted tool results, answer) and sends
+    [system prompt] [running summary] [recent exchanges...] [new question]
+The front of that list only ever grows by appending, so consecutive prompts
+share a byte-identical prefix that Ollama serves from its KV cache.
+
+When the recent exchanges exceed AGENT_SESSION_TOKEN_BUDGET (estimated), the
+oldest half is folded into the running summary: one line per exchange with
+its question, the SQL it ran and the start of its answer. Folding in halves
+keeps the prefix stable between compactions. The summary keeps its newest
+lines within AGENT_SESSION_SUMMARY_TOKENS.
+
+Sessions are saved as JSON under .cache/agent_sessions/.
+"""
+
+import json
+import os
+import re
+
+from dotenv import load_dotenv
+
+from tool_results import estimate_tokens
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AGENT_SESSION_DIR = os.getenv("AGENT_SESSION_DIR", os.path.join(PROJECT_DIR, ".cache", "agent_sessions"))
+AGENT_SESSION_TOKEN_BUDGET = int(os.getenv("AGENT_SESSION_TOKEN_BUDGET", "1500"))
+AGENT_SESSION_SUMMARY_TOKENS = int(os.getenv("AGENT_SESSION_SUMMARY_TOKENS", "400"))
+
+# Characters of SQL / answer kept per exchange in the summary
+_SUMMARY_SQL_CHARS = 300
+_SUMMARY_ANSWER_CHARS = 200
+
+
+def _short(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def session_path(name: str) -> str:
+    safe = re.sub(r"[^\w\-]", "_", name) or "default"
+    return os.path.join(AGENT_SESSION_DIR, f"{safe}.json")
+
+
+def list_sessions() -> list[str]:
+    try:
+        return sorted(n[:-5] for n in os.listdir(AGENT_SESSION_DIR) if n.endswith(".json"))
+    except OSError:
+        return []
+
+
+class AgentSession:
+    """Running summary plus recent exchanges; see the module docstring."""
+
+    def __init__(self, system_prompt: str, name: str = "default",
+                 budget: int = AGENT_SESSION_TOKEN_BUDGET,
+                 summary_budget: int = AGENT_SESSION_SUMMARY_TOKENS):
+        self.system_prompt = system_prompt
+        self.name = name
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.summary: list[str] = []
+        # [{"question", "sql": [...], "answer", "messages": [...]}], oldest first
+        self.exchanges: list[dict] = []
+
+    def __len__(self) -> int:
+        return len(self.exchanges)
+
+    def prefix(self) -> list[dict]:
+        """Messages before the next question: system prompt, summary, recent exchanges."""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({"role": "system", "content": "Earlier in this session:\n" + "\n".join(self.summary)})
+        for exchange in self.exchanges:
+            messages.extend(exchange["messages"])
+        return messages
+
+    def messages(self, user_content: str) -> list[dict]:
+        return self.prefix() + [{"role": "user", "content": user_content}]
+
+    def tokens(self) -> int:
+        """Estimated tokens of the recent exchanges (what the budget bounds)."""
+        return sum(estimate_tokens(m.get("content") or "") for e in self.exchanges for m in e["messages"])
+
+    def add(self, question: str, messages: list[dict], answer: str, sql: list[str]) -> int:
+        """
+        Record one exchange (messages from the user turn through the final
+        answer) and compact. Returns the number of exchanges folded into the summary.
+        """
+        self.exchanges.append({"question": question, "sql": sql, "answer": answer, "messages": messages})
+        return self.compact()
+
+    def compact(self) -> int:
+        folded = 0
+        while len(self.exchanges) > 1 and self.tokens() > self.budget:
+            half = max(1, len(self.exchanges) // 2)
+            for exchange in self.exchanges[:half]:
+                line = f"- Q: {_short(exchange['question'], _SUMMARY_ANSWER_CHARS)}"
+                if exchange["sql"]:
+                    line += " | SQL: " + " ; ".join(_short(q, _SUMMARY_SQL_CHARS) for q in exchange["sql"])
+                line += f" | A: {_short(exchange['answer'], _SUMMARY_ANSWER_CHARS)}"
+                self.summary.append(line)
+            del self.exchanges[:half]
+            folded += half
+        while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > self.summary_budget:
+            self.summary.pop(0)
+        return folded
+
+    def reset(self):
+        self.summary, self.exchanges = [], []
+
+    def save(self, name: str | None = None) -> str:
+        """Write the session to AGENT_SESSION_DIR/<name>.json. Returns the path."""
+        self.name = name or self.name
+        path = session_path(self.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary, "exchanges": self.exchanges}, f)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, system_prompt: str, name: str) -> "AgentSession":
+        """The saved session `name`, or a new empty one if there is none. Raises ValueError if unreadable."""
+        session = cls(system_prompt, name)
+        try:
+            with open(session_path(name), encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return session
+        session.summary = data.get("summary", [])
+        session.exchanges = data.get("exchanges", [])
+        session.compact()
+        return session
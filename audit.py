@@ -8,8 +8,10 @@ and writes findings to Excel with Summary + Detail tabs.
 
 Usage:
     python audit.py
+    python audit.py --trace [--profile]
 """
 
+import argparse
 import asyncio
 import os
 import textwrap
@@ -21,6 +23,8 @@ from openpyxl.styles import Font, PatternFill, Alignment
 from dotenv import load_dotenv
 
 import mcp_client
+import tracing
+from history import HistoryStore
 
 load_dotenv()
 
@@ -417,6 +421,19 @@ def write_excel(detail_rows: list[dict], filename: str):
     log(f"\n[DONE] Report written -> {filename}")
 
 
+def record_history(filename: str, detail_rows: list[dict]):
+    """Add this run to the history store (history.py); a failure there doesn't fail the audit."""
+    try:
+        store = HistoryStore()
+        try:
+            run_id = store.record_run("audit", filename, detail_rows)
+        finally:
+            store.close()
+        log(f"[HISTORY] Recorded as run {run_id} in {store.path}")
+    except Exception as e:
+        log(f"[HISTORY] Not recorded: {e}")
+
+
 # ---------------------------------------------------------------------------
 # Main audit loop
 # ---------------------------------------------------------------------------
@@ -429,7 +446,8 @@ async def main():
         # Step 0: Connectivity check
         # ------------------------------------------------------------------
         log("Step 0: Testing MCP server connectivity...")
-        ping = await run_query("Connectivity ping", QUERY_PING, database="Inventory")
+        with tracing.span("connectivity ping"):
+            ping = await run_query("Connectivity ping", QUERY_PING, database="Inventory")
         log_result(ping)
         if not ping:
             log("\n[ERROR] MCP server returned no response to SELECT 1. Check MCP_SERVER_PATH and DB credentials.")
@@ -440,7 +458,9 @@ async def main():
         # Step 1a: Failed/stuck TMIN records from IntegrationTransactions.
         # ------------------------------------------------------------------
         log("Step 1a: Pulling failed/stuck TMIN records...")
-        failed_tickets = await run_query("Failed/stuck TMIN records", QUERY_FAILED_TMIN, database="Inventory")
+        with tracing.span("Step 1a") as s:
+            failed_tickets = await run_query("Failed/stuck TMIN records", QUERY_FAILED_TMIN, database="Inventory")
+            s["rows"] = len(failed_tickets)
         log_result(failed_tickets, preview_cols=["Company", "TicketID", "PartNumber", "Location"])
         log(f"  Found {len(failed_tickets)} failed/stuck ticket part(s).")
 
@@ -450,30 +470,33 @@ async def main():
         #   1b-ii: Batch-check which ones already have TMIN records.
         # ------------------------------------------------------------------
         log("\nStep 1b: Pulling NOT_INTEGRATED candidates (closed tickets, 30 days)...")
-        candidates = await run_query(
-            "NOT_INTEGRATED candidates", QUERY_NOT_INTEGRATED_CANDIDATES, database="T2Online"
-        )
-        log(f"  Found {len(candidates)} candidate part(s) from closed tickets.")
-
-        not_integrated = []
-        if candidates:
-            # Batch check: which candidates already have a TMIN record?
-            pkey_list = [str(c["PartLineID"]) for c in candidates if c.get("PartLineID")]
-            # Process in batches of 500 to stay under SQL parameter limits
-            has_tmin_set = set()
-            for batch_start in range(0, len(pkey_list), 500):
-                batch = pkey_list[batch_start:batch_start + 500]
-                ids_str = ",".join(batch)
-                tmin_rows = await run_query(
-                    f"TMIN batch check ({batch_start+1}-{batch_start+len(batch)})",
-                    QUERY_HAS_TMIN.format(ids=ids_str),
-                    database="Inventory",
-                )
-                for r in tmin_rows:
-                    has_tmin_set.add(r.get("TicketLineItemID"))
-
-            not_integrated = [c for c in candidates if c.get("PartLineID") not in has_tmin_set]
-            log(f"  {len(has_tmin_set)} candidates already have TMIN records (excluded).")
+        with tracing.span("Step 1b") as s1b:
+            candidates = await run_query(
+                "NOT_INTEGRATED candidates", QUERY_NOT_INTEGRATED_CANDIDATES, database="T2Online"
+            )
+            log(f"  Found {len(candidates)} candidate part(s) from closed tickets.")
+
+            not_integrated = []
+            if candidates:
+                # Batch check: which candidates already have a TMIN record?
+                pkey_list = [str(c["PartLineID"]) for c in candidates if c.get("PartLineID")]
+                # Process in batches of 500 to stay under SQL parameter limits
+                has_tmin_set = set()
+                for batch_start in range(0, len(pkey_list), 500):
+                    batch = pkey_list[batch_start:batch_start + 500]
+                    ids_str = ",".join(batch)
+                    tmin_rows = await run_query(
+                        f"TMIN batch check ({batch_start+1}-{batch_start+len(batch)})",
+                        QUERY_HAS_TMIN.format(ids=ids_str),
+                        database="Inventory",
+                    )
+                    for r in tmin_rows:
+                        has_tmin_set.add(r.get("TicketLineItemID"))
+
+                not_integrated = [c for c in candidates if c.get("PartLineID") not in has_tmin_set]
+                log(f"  {len(has_tmin_set)} candidates already have TMIN records (excluded).")
+            s1b["candidates"] = len(candidates)
+            s1b["not_integrated"] = len(not_integrated)
 
         log(f"  Found {len(not_integrated)} truly not-integrated ticket part(s).\n")
 
@@ -507,25 +530,27 @@ async def main():
             # 2a+b: GP qty + RINV check in parallel (independent queries)
             part_esc = part.replace("'", "''")
             loc_esc  = location.replace("'", "''")
-            gp_rows, rinv_rows = await asyncio.gather(
-                run_query(
-                    f"GP qty — {part} @ {location}",
-                    QUERY_GP_QTY.format(part=part_esc, location=loc_esc),
-                    database="IntegrationDB",
-                ),
-                run_query(
-                    f"RINV check — {part} @ {location}",
-                    QUERY_RINV.format(part=part_esc, location=loc_esc),
-                    database="Inventory",
-                ),
-            )
-            log_result(gp_rows, preview_cols=["ITEMNMBR", "LOCNCODE", "QTYONHND", "ATYALLOC"])
-            log_result(rinv_rows, preview_cols=["ItGPDocID", "ItQty", "ItProcessDate"])
-            gp_qty = gp_rows[0] if gp_rows else {}
-
-            # 3: Classify
-            classification = classify(row, gp_qty, rinv_rows)
-            category = classification["category"]
+            with tracing.span("diagnose", row=i, part=part, location=location) as s:
+                gp_rows, rinv_rows = await asyncio.gather(
+                    run_query(
+                        f"GP qty — {part} @ {location}",
+                        QUERY_GP_QTY.format(part=part_esc, location=loc_esc),
+                        database="IntegrationDB",
+                    ),
+                    run_query(
+                        f"RINV check — {part} @ {location}",
+                        QUERY_RINV.format(part=part_esc, location=loc_esc),
+                        database="Inventory",
+                    ),
+                )
+                log_result(gp_rows, preview_cols=["ITEMNMBR", "LOCNCODE", "QTYONHND", "ATYALLOC"])
+                log_result(rinv_rows, preview_cols=["ItGPDocID", "ItQty", "ItProcessDate"])
+                gp_qty = gp_rows[0] if gp_rows else {}
+
+                # 3: Classify
+                classification = classify(row, gp_qty, rinv_rows)
+                category = classification["category"]
+                s["category"] = category
             fix_type = get_fix_type(category)
             log(f"  [CLASSIFY] category={category}  fix_type={fix_type}")
             log(f"             action={classification['action']}")
@@ -579,7 +604,10 @@ async def main():
         log("Step 4: Writing Excel report...")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"audit_{timestamp}.xlsx")
-        write_excel(detail_rows, filename)
+        with tracing.span("write workbook", rows=len(detail_rows)):
+            write_excel(detail_rows, filename)
+        with tracing.span("record history", rows=len(detail_rows)):
+            record_history(filename, detail_rows)
 
     finally:
         log("\n[MCP] Closing server connection...")
@@ -587,5 +615,19 @@ async def main():
         log("[MCP] Connection closed.")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inventory reconciliation audit")
+    parser.add_argument("--trace", action="store_true", default=None,
+                        help="Record span timings to traces/audit_<time>.json (Chrome trace; or TRACE=1)")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="Also run under cProfile and dump traces/audit_<time>.prof (or TRACE_PROFILE=1)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli = parse_args()
+    tracing.start("audit", cli.trace, cli.profile)
+    try:
+        asyncio.run(main())
+    finally:
+        tracing.stop(log)
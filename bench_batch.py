@@ -0,0 +1,109 @@
+"""
+bench_batch.py — Compare single-row vs batched LLM verdicts on real evidence.
+
+Reads an audit Excel, gathers evidence once for rows that need the LLM (fast-path
+and no-playbook rows are skipped), then runs the same evidence packets through
+both paths back to back:
+    single  — one call_llm_with_stats per row (investigate.py default)
+    batch   — K same-category rows per call (investigate.py --batch-size K)
+Reports rows/minute for each path, batch fallbacks, and per-row verdict
+agreement between the two. The verdict cache is not used. Run once with and
+once without --free-text to compare JSON-schema decoding against free text.
+
+Usage:
+    python bench_batch.py
+    python bench_batch.py path/to/audit_YYYYMMDD_HHMMSS.xlsx --rows 40 --batch-size 4
+    python bench_batch.py --free-text
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import investigate
+import mcp_client
+from investigate import (
+    _evidence_stage, _llm_batch_stage, _llm_stage,
+    find_latest_audit, log, read_staged_fixes, schedule_by_category,
+)
+
+
+def _key(result: dict) -> tuple[str, str]:
+    return result["LLMVerdict"], result.get("LLMNewCategory", "")
+
+
+async def collect_jobs(staged: list[dict], limit: int) -> list[dict]:
+    """Gather evidence in category-grouped order until `limit` LLM jobs are collected."""
+    jobs = []
+    for i in schedule_by_category(staged):
+        _, job = await _evidence_stage(f"[{i + 1}/{len(staged)}]", staged[i], None)
+        if job is not None:
+            jobs.append(job)
+            if len(jobs) >= limit:
+                break
+    return jobs
+
+
+async def run_single(jobs: list[dict]) -> tuple[list[dict], float]:
+    start = time.perf_counter()
+    results = [await _llm_stage(job, None) for job in jobs]
+    return results, time.perf_counter() - start
+
+
+async def run_batched(jobs: list[dict], batch_size: int) -> tuple[list[dict], float]:
+    start = time.perf_counter()
+    results: list[dict] = []
+    batch: list[dict] = []
+    for job in jobs + [None]:
+        if batch and (job is None or len(batch) >= batch_size or job["category"] != batch[0]["category"]):
+            results.extend(await _llm_batch_stage(batch, None) if len(batch) > 1 else [await _llm_stage(batch[0], None)])
+            batch = []
+        if job is not None:
+            batch.append(job)
+    return results, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Single-row vs batched LLM verdict benchmark.")
+    parser.add_argument("audit_path", nargs="?", help="Audit workbook (default: newest audit_*.xlsx)")
+    parser.add_argument("--rows", type=int, default=24, help="LLM rows to benchmark (default 24)")
+    parser.add_argument("--batch-size", type=int, default=4, metavar="K")
+    parser.add_argument("--free-text", action="store_true",
+                        help="Benchmark the 3-line free-text format instead of JSON-schema decoding")
+    args = parser.parse_args()
+    investigate.STRUCTURED_OUTPUT = not args.free_text
+
+    audit_path = find_latest_audit(args.audit_path)
+    staged = read_staged_fixes(audit_path)
+    log(f"[BENCH] {audit_path}: {len(staged)} staged row(s)")
+
+    try:
+        jobs = await collect_jobs(staged, args.rows)
+        if not jobs:
+            log("[BENCH] No rows need the LLM — nothing to compare.")
+            return
+        log(f"[BENCH] {len(jobs)} LLM row(s) across {len({j['category'] for j in jobs})} category(ies)\n")
+
+        single, single_s = await run_single(jobs)
+        batched, batch_s = await run_batched(jobs, args.batch_size)
+    finally:
+        await mcp_client.close_session()
+
+    agree = sum(_key(a) == _key(b) for a, b in zip(single, batched))
+    methods = Counter(r["InvestigationMethod"] for r in batched)
+    unknown_single = sum(r["LLMVerdict"] == "UNKNOWN" for r in single)
+    unknown_batch = sum(r["LLMVerdict"] == "UNKNOWN" for r in batched)
+
+    log(f"\n{'='*50}")
+    log(f"Rows:                 {len(jobs)}")
+    log(f"Single-row:           {single_s:.1f}s  {len(jobs) / single_s * 60:.1f} rows/min  UNKNOWN={unknown_single}")
+    log(f"Batch (K={args.batch_size}):          {batch_s:.1f}s  {len(jobs) / batch_s * 60:.1f} rows/min  UNKNOWN={unknown_batch}")
+    log(f"Batch fallbacks:      {methods.get('llm', 0)} row(s) answered by single-row calls (fallbacks + singleton batches)")
+    log(f"Verdict agreement:    {agree}/{len(jobs)} ({agree / len(jobs):.0%})")
+    log(f"Speedup:              {single_s / batch_s:.2f}x")
+    log(f"{'='*50}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
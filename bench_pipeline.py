@@ -0,0 +1,406 @@
+"""
+bench_pipeline.py — Offline throughput benchmark for the investigation pipeline.
+
+Runs investigate.investigate_rows end to end without SQL Server or Ollama:
+    - a synthetic Staged Fixes backlog spread across all ten error categories
+    - an evidence stand-in in place of mcp_client.call_tool, answering each
+      evidence query with deterministic per-row data after --sql-ms
+    - a stub Ollama HTTP server (/api/chat, /api/generate, /api/tags) that
+      returns valid verdicts and sleeps per prompt and generated token. It has
+      --stub-parallel slots, each keeping the last prompt, so a shared prefix
+      is only "prefilled" once, as with Ollama's KV cache.
+
+The real evidence tiers, fast-path/playbook/learned rules, verdict cache,
+batching, warm-up and LLM pool all run unchanged, so the numbers move when any
+of them change. Reports rows/min, time to first LLM verdict, p50/p90/p99
+latency per stage (evidence, LLM call, prefill, row completion) and LLM calls
+avoided by rules, cache and batching.
+
+Usage:
+    python bench_pipeline.py
+    python bench_pipeline.py --rows 200 --batch-size 4 --llm-concurrency 2 --stub-parallel 2
+    python bench_pipeline.py --cache --repeat 2
+    python bench_pipeline.py --prefill-ms 15 --decode-ms 100   # CPU-class phi4-mini
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import investigate
+import mcp_client
+from investigate import _warm_up, investigate_rows, load_playbook, log, schedule_by_category
+from llm_cache import VerdictCache
+from llm_pool import Backend, close_pool, use_backends
+from llm_utils import CATEGORIES, OLLAMA_MODEL, release_models
+
+RULE_METHODS = ("fast-path", "playbook", "learned-rule")
+
+ERRORS = {
+    "QTYFULFI_STALE": "QTYFULFI: quantity fulfilled exceeds available quantity",
+    "STUCK_PROCESSING": "Transaction stuck in Processing status",
+    "QTY_SHORTAGE": "Insufficient quantity available for item",
+    "QTY_SHORTAGE_RINV": "Insufficient quantity available; RINV removal pending",
+    "TICKET_OPEN": "Ticket is still open; cannot consume parts",
+    "NOT_SAFE": "Integration state is not safe to process",
+    "QTYFULFI": "QTYFULFI: quantity fulfilled cannot be greater than quantity",
+    "CONTRACT_LOCATION": "Location is a contract stock location",
+    "NOT_INTEGRATED": "Part line was never integrated",
+    "OTHER": "Unexpected integration error",
+}
+
+
+# ---------------------------------------------------------------------------
+# Synthetic backlog
+# ---------------------------------------------------------------------------
+
+def _fix_type(category: str) -> str:
+    match = re.search(r"^FIX_TYPE:\s*(\S+)", load_playbook(category) or "", re.MULTILINE)
+    return match.group(1) if match else ""
+
+
+def synthetic_backlog(n_rows: int, seed: int, duplicate_rate: float) -> list[dict]:
+    """
+    n_rows Staged Fixes rows cycling through all ten categories. A
+    duplicate_rate share reuse an earlier row's part/location (same evidence on
+    another ticket), which is what the verdict cache is for.
+    """
+    rng = random.Random(seed)
+    rows: list[dict] = []
+    for i in range(n_rows):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        same = [r for r in rows if r["ErrorCategory"] == category]
+        if same and rng.random() < duplicate_rate:
+            base = rng.choice(same)
+            part, location, needed = base["PartNumber"], base["Location"], base["QuantityNeeded"]
+        else:
+            part, location, needed = f"P{rng.randint(10000, 99999)}", f"W{rng.randint(100, 140)}", rng.randint(1, 6)
+        rows.append({
+            "PartLineID": 500000 + i,
+            "PartNumber": part,
+            "Location": location,
+            "Company": f"CO{rng.randint(1, 4)}",
+            "ErrorCategory": category,
+            "FixType": _fix_type(category),
+            "IntegrationError": ERRORS[category],
+            "QuantityNeeded": needed,
+            "DaysOpen": rng.randint(1, 120),
+            "RetryCount": rng.randint(0, 6),
+            "Deficit": -rng.randint(0, needed),
+        })
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Evidence stand-in (replaces mcp_client.call_tool)
+# ---------------------------------------------------------------------------
+
+def _date(rng: random.Random) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - rng.randint(1, 120) * 86400))
+
+
+def _synthetic_rows(sql: str, rng: random.Random, empty_rate: float) -> list[dict]:
+    """Result rows shaped like the evidence query's table; deterministic for a given rng."""
+    if "SELECT 1 AS ping" in sql:
+        return [{"ping": 1}]
+    if rng.random() < empty_rate:
+        return []
+    if "IV00102" in sql:
+        return [{"QTYONHND": rng.randint(0, 8), "ATYALLOC": rng.choice([0, 0, 0, 1, 2]), "QTYCOMTD": 0}]
+    if "InventQuantities" in sql:
+        return [{"IqtQtyOnHand": rng.randint(0, 8), "IqtQtyConsume": rng.randint(0, 3)}]
+    if "SOP10200" in sql:
+        return [{"SOPNUMBE": f"SO{rng.randint(1000, 9999)}", "QUANTITY": rng.randint(1, 4), "ATYALLOC": rng.randint(0, 2)}
+                for _ in range(rng.choice([0, 0, 1, 2]))]
+    if "GROUP BY ItIntegrationStatusID" in sql:
+        return [{"ItIntegrationStatusID": s, "cnt": rng.randint(1, 3)} for s in rng.sample([1, 3, 5], rng.randint(1, 2))]
+    if "IntegrationTransactions" in sql:
+        prefix = next((p for p in ("TINV", "RINV", "PINV", "TMIN") if f"'{p}%'" in sql), "TMIN")
+        return [{"ItPKey": rng.randint(1, 10**6), "ItGPDocID": f"{prefix}{rng.randint(1000, 9999)}",
+                 "ItQty": rng.randint(1, 4), "ItIntegrationStatusID": rng.choice([1, 3, 5]),
+                 "ItLongError": "", "ItProcessDate": _date(rng)}
+                for _ in range(rng.randint(1, 3))]
+    if "TicketCallMain" in sql:
+        return [{"TcaPKey": rng.randint(1, 10**6), "TcaCallDate": _date(rng), "TcpConsumed": rng.choice([0, 0, 1])}]
+    if "AcqAcquisitionLookup" in sql:
+        return [{"AcqName": "Acme", "DbName": "CO1", "AcqHWSStockLocation": rng.choice(["", "W101"])}]
+    return []
+
+
+def evidence_stand_in(sql_ms: float, empty_rate: float, seed: int):
+    """An async call_tool(name, arguments) serving synthetic evidence after ~sql_ms per query."""
+    async def call_tool(name: str, arguments: dict) -> str:
+        sql = arguments.get("query", "")
+        # Seeded by the query text, so the same part/location always gets the same evidence
+        rng = random.Random(zlib.crc32(f"{seed}|{sql}".encode("utf-8")))
+        await asyncio.sleep(sql_ms * random.uniform(0.5, 1.5) / 1000)
+        return json.dumps(_synthetic_rows(sql, rng, empty_rate), default=str)
+    return call_tool
+
+
+# ---------------------------------------------------------------------------
+# Stub Ollama server
+# ---------------------------------------------------------------------------
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubOllama:
+    """
+    Minimal Ollama look-alike: answers /api/chat with a schema-valid verdict
+    (or a free-text one, or a batch), sleeping prefill_ms per uncached prompt
+    token plus decode_ms per generated token. The first request for a model
+    pays load_ms. keep_alive=0 unloads it.
+    """
+
+    def __init__(self, prefill_ms: float, decode_ms: float, load_ms: float, parallel: int):
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.load_ms = load_ms
+        self.slots = [""] * max(1, parallel)
+        self.free = threading.Semaphore(len(self.slots))
+        self.lock = threading.Lock()
+        self.loaded: dict[str, float] = {}  # model -> monotonic time its load finishes
+        self.requests = Counter()
+        self.prompt_tokens = self.evaluated_tokens = 0
+        self.server: ThreadingHTTPServer | None = None
+
+    def _load(self, model: str, keep_alive) -> float:
+        """ms this request waits for the model: the full load if unloaded, the remainder if loading."""
+        with self.lock:
+            now = time.monotonic()
+            if keep_alive == 0:
+                self.loaded.pop(model, None)
+                return 0.0
+            if model not in self.loaded:
+                self.loaded[model] = now + self.load_ms / 1000
+            return max(0.0, (self.loaded[model] - now) * 1000)
+
+    def _prefill(self, prompt: str) -> tuple[int, int]:
+        """(prompt tokens, tokens actually evaluated) — the longest shared prefix with any slot is free."""
+        with self.lock:
+            shared = [len(os.path.commonprefix([prompt, cached])) for cached in self.slots]
+            slot = max(range(len(self.slots)), key=lambda i: shared[i])
+            self.slots[slot] = prompt
+            total, evaluated = _tokens(prompt), _tokens(prompt[shared[slot]:])
+            self.prompt_tokens += total
+            self.evaluated_tokens += evaluated
+            return total, evaluated
+
+    @staticmethod
+    def _verdict(seed: str) -> dict:
+        rng = random.Random(zlib.crc32(seed.encode("utf-8")))
+        verdict = rng.choice(["CONFIRM", "CONFIRM", "CONFIRM", "ESCALATE"])
+        return {"verdict": verdict, "reason": "Stub verdict for benchmarking.", "new_category": ""}
+
+    def _answer(self, body: dict) -> str:
+        user = body["messages"][-1]["content"]
+        fmt = body.get("format")
+        if isinstance(fmt, dict) and "rows" in fmt.get("properties", {}):
+            n = fmt["properties"]["rows"]["minItems"]
+            return json.dumps({"rows": [{"row": i + 1, **self._verdict(f"{user}|{i}")} for i in range(n)]})
+        verdict = self._verdict(user)
+        if fmt:
+            return json.dumps(verdict)
+        n = user.count("=== ROW ")
+        if n > 1:
+            return "\n".join(f"row: {i + 1}\nverdict: {self._verdict(f'{user}|{i}')['verdict']}\n"
+                             f"reason: Stub verdict for benchmarking." for i in range(n))
+        return f"verdict: {verdict['verdict']}\nreason: {verdict['reason']}"
+
+    def handle(self, path: str, body: dict) -> dict:
+        self.requests[path] += 1
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        model = body.get("model", OLLAMA_MODEL)
+        if path == "/api/tags":
+            return {"models": [{"name": m, "model": m} for m in sorted(self.loaded) or [OLLAMA_MODEL]]}
+        load_ms = self._load(model, body.get("keep_alive"))
+        if path == "/api/generate":
+            time.sleep(load_ms / 1000)
+            return {"model": model, "created_at": now, "response": "", "done": True,
+                    "load_duration": int(load_ms * 1e6), "total_duration": int(load_ms * 1e6)}
+        with self.free:
+            prompt = "\n".join(m["content"] for m in body["messages"])
+            prompt_tokens, evaluated = self._prefill(prompt)
+            content = self._answer(body)
+            eval_tokens = _tokens(content)
+            prefill_ms, eval_ms = evaluated * self.prefill_ms, eval_tokens * self.decode_ms
+            time.sleep((load_ms + prefill_ms + eval_ms) / 1000)
+        return {
+            "model": model, "created_at": now, "done": True, "done_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+            "prompt_eval_count": evaluated, "prompt_eval_duration": int(prefill_ms * 1e6),
+            "eval_count": eval_tokens, "eval_duration": int(eval_ms * 1e6),
+            "load_duration": int(load_ms * 1e6), "total_duration": int((load_ms + prefill_ms + eval_ms) * 1e6),
+        }
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, path: str, body: dict):
+                data = json.dumps(stub.handle(path, body)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply(self.path, {})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self._reply(self.path, json.loads(self.rfile.read(length) or b"{}"))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "n/a"
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return (f"p50 {pick(0.5):>8.0f}  p90 {pick(0.9):>8.0f}  p99 {pick(0.99):>8.0f}  "
+            f"max {ordered[-1]:>8.0f}  (n={len(ordered)})")
+
+
+def report(label: str, results: list[dict], elapsed: float, finished_ms: list[float], stub: StubOllama):
+    methods = Counter(r["InvestigationMethod"] for r in results)
+    calls = [c for r in results for c in r.get("LLMCalls") or []]
+    llm_rows = sum(methods[m] for m in ("llm", "llm-batch"))
+    by_rules = sum(methods[m] for m in RULE_METHODS)
+    first = min((ms for r, ms in zip(results, finished_ms) if r.get("LLMCalls")), default=None)
+
+    log(f"\n=== {label} ===")
+    log(f"Rows:                 {len(results)} in {elapsed:.1f}s — {len(results) / elapsed * 60:.1f} rows/min")
+    log("Methods:              " + ", ".join(f"{m}={n}" for m, n in methods.most_common()))
+    log(f"LLM calls:            {len(calls)} for {len(results)} row(s) — {len(results) - len(calls)} avoided "
+        f"(rules {by_rules}, cache {methods['llm-cache']}, batching {max(0, llm_rows - len(calls))}, "
+        f"other {methods['no-playbook'] + methods['error']})")
+    if first is not None:
+        log(f"First LLM verdict:    {first / 1000:.1f}s")
+    log("Latency (ms):")
+    log(f"  evidence stage      {percentiles([r['EvidenceMs'] for r in results if r.get('EvidenceMs') is not None])}")
+    log(f"  LLM call (wall)     {percentiles([c['wall_ms'] for c in calls if c.get('wall_ms') is not None])}")
+    log(f"  LLM prefill         {percentiles([c['prefill_ms'] for c in calls if c.get('prefill_ms') is not None])}")
+    log(f"  LLM eval            {percentiles([c['eval_ms'] for c in calls if c.get('eval_ms') is not None])}")
+    log(f"  row completion      {percentiles(finished_ms)}")
+    if stub.prompt_tokens:
+        reused = 1 - stub.evaluated_tokens / stub.prompt_tokens
+        log(f"Stub prompt tokens:   {stub.prompt_tokens} sent, {stub.evaluated_tokens} prefilled "
+            f"({reused:.0%} served from the prefix cache)")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+async def run_once(rows: list[dict], cache: VerdictCache | None, args) -> tuple[list[dict], float, list[float]]:
+    start = time.perf_counter()
+    finished = [0.0] * len(rows)
+
+    def on_result(index: int, result: dict):
+        finished[index] = (time.perf_counter() - start) * 1000
+
+    warmup = None if args.no_warmup else asyncio.create_task(_warm_up())
+    order = None if args.no_group else schedule_by_category(rows)
+    try:
+        results = await investigate_rows(rows, cache, on_result=on_result, order=order,
+                                         batch_size=args.batch_size, warmup=warmup)
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+    return results, time.perf_counter() - start, finished
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline investigation pipeline benchmark (synthetic rows, stub Ollama).")
+    parser.add_argument("--rows", type=int, default=100, help="Synthetic Staged Fixes rows (default 100)")
+    parser.add_argument("--seed", type=int, default=1, help="Backlog and evidence seed (default 1)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.2,
+                        help="Share of rows repeating an earlier part/location (default 0.2)")
+    parser.add_argument("--empty-rate", type=float, default=0.3,
+                        help="Share of evidence queries returning no rows; missing data sends rows to the LLM (default 0.3)")
+    parser.add_argument("--sql-ms", type=float, default=25, help="Mean latency per evidence query (default 25)")
+    parser.add_argument("--prefill-ms", type=float, default=2, help="Stub prefill ms per uncached prompt token (default 2)")
+    parser.add_argument("--decode-ms", type=float, default=20, help="Stub decode ms per generated token (default 20)")
+    parser.add_argument("--load-ms", type=float, default=2000, help="Stub model load time (default 2000)")
+    parser.add_argument("--stub-parallel", type=int, default=1, help="Stub server parallel slots (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--evidence-concurrency", type=int, default=investigate.EVIDENCE_CONCURRENCY)
+    parser.add_argument("--llm-concurrency", type=int, help="LLM workers (default: --stub-parallel)")
+    parser.add_argument("--batch-size", type=int, default=1, metavar="K")
+    parser.add_argument("--cache", action="store_true", help="Use a fresh verdict cache (temp file)")
+    parser.add_argument("--repeat", type=int, default=1, help="Run the backlog N times against the same cache")
+    parser.add_argument("--no-group", action="store_true", help="Process rows in input order")
+    parser.add_argument("--no-rules", action="store_true", help="Skip the compiled playbook RULES")
+    parser.add_argument("--no-warmup", action="store_true", help="Don't preload the model")
+    parser.add_argument("--free-text", action="store_true", help="3-line free-text verdicts instead of JSON schema")
+    parser.add_argument("--verbose", action="store_true", help="Keep investigate.py's per-row log lines")
+    args = parser.parse_args()
+
+    stub = StubOllama(args.prefill_ms, args.decode_ms, args.load_ms, args.stub_parallel)
+    url = stub.start()
+    use_backends([Backend(url, None, args.stub_parallel)])
+    mcp_client.call_tool = evidence_stand_in(args.sql_ms, args.empty_rate, args.seed)
+    investigate.STRUCTURED_OUTPUT = not args.free_text
+    investigate.PLAYBOOK_RULES = not args.no_rules
+    investigate.EVIDENCE_CONCURRENCY = args.evidence_concurrency
+    investigate.LLM_CONCURRENCY = args.llm_concurrency or args.stub_parallel
+    investigate.LLM_QUEUE_SIZE = investigate.LLM_CONCURRENCY * 4
+    if not args.verbose:
+        investigate.log = lambda msg: None
+
+    rows = synthetic_backlog(args.rows, args.seed, args.duplicate_rate)
+    log(f"[BENCH] {len(rows)} synthetic row(s) across {len({r['ErrorCategory'] for r in rows})} categories; "
+        f"stub Ollama at {url} (prefill {args.prefill_ms:g} ms/tok, decode {args.decode_ms:g} ms/tok, "
+        f"load {args.load_ms:g} ms, {args.stub_parallel} slot(s))")
+    log(f"[BENCH] evidence concurrency={investigate.EVIDENCE_CONCURRENCY}, LLM concurrency={investigate.LLM_CONCURRENCY}, "
+        f"batch size={args.batch_size}, grouped={not args.no_group}, rules={not args.no_rules}, "
+        f"cache={args.cache}, warm-up={not args.no_warmup}")
+
+    cache_dir = tempfile.TemporaryDirectory() if args.cache else None
+    cache = VerdictCache(os.path.join(cache_dir.name, "bench.sqlite")) if cache_dir else None
+    try:
+        for n in range(1, args.repeat + 1):
+            stub.prompt_tokens = stub.evaluated_tokens = 0
+            results, elapsed, finished = await run_once(rows, cache, args)
+            report(f"Run {n}/{args.repeat}", results, elapsed, finished, stub)
+        log("\nStub requests: " + ", ".join(f"{p} {c}" for p, c in sorted(stub.requests.items())))
+    finally:
+        if cache is not None:
+            cache.close()
+            cache_dir.cleanup()
+        if not args.no_warmup:
+            await release_models()
+        await close_pool()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -7,9 +7,19 @@ that fits within phi4-mini's context window.
 """
 
 import asyncio
-from typing import Any
+import json
+import os
+import re
+from typing import Any, Callable
 
 import mcp_client
+import tracing
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fast-path rules learned offline from past LLM verdicts (learn_rules.py).
+# Empty path disables them.
+LEARNED_RULES_PATH = os.getenv("LEARNED_RULES_PATH", os.path.join(PROJECT_DIR, "learned_rules.json"))
 
 
 # ---------------------------------------------------------------------------
@@ -19,6 +29,7 @@ import mcp_client
 _GP_QTY = {
     "label": "gp_qty",
     "database": "IntegrationDB",
+    "tier": 1,
     "sql": (
         "SELECT QTYONHND, ATYALLOC, QTYCOMTD "
         "FROM dbo.IV00102 "
@@ -39,7 +50,9 @@ _TRAKKER_QTY = {
 # ---------------------------------------------------------------------------
 # Evidence query definitions — one list per error category.
 # Each entry: label, database, sql (with {part}, {location}, {company_db} placeholders),
-# and a format hint for compression.
+# and a tier. Tier 1 holds the cheap, decisive queries the fast-path rules read
+# first; higher tiers only run if no deterministic verdict exists yet. Specs
+# without a tier default to 1.
 # ---------------------------------------------------------------------------
 
 EVIDENCE_QUERIES: dict[str, list[dict]] = {
@@ -48,6 +61,7 @@ EVIDENCE_QUERIES: dict[str, list[dict]] = {
         {
             "label": "open_orders",
             "database": "IntegrationDB",
+            "tier": 2,
             "sql": (
                 "SELECT TOP 5 SOPNUMBE, QUANTITY, ATYALLOC "
                 "FROM dbo.SOP10200 "
@@ -55,7 +69,7 @@ EVIDENCE_QUERIES: dict[str, list[dict]] = {
                 "AND QUANTITY > 0"
             ),
         },
-        _TRAKKER_QTY,
+        {**_TRAKKER_QTY, "tier": 3},
     ],
 
     "STUCK_PROCESSING": [
@@ -74,6 +88,7 @@ EVIDENCE_QUERIES: dict[str, list[dict]] = {
         {
             "label": "other_statuses",
             "database": "Inventory",
+            "tier": 2,
             "sql": (
                 "SELECT ItIntegrationStatusID, COUNT(*) AS cnt "
                 "FROM dbo.IntegrationTransactions "
@@ -231,11 +246,25 @@ EVIDENCE_QUERIES: dict[str, list[dict]] = {
 # Returns a verdict dict or None if LLM investigation is needed.
 # ---------------------------------------------------------------------------
 
-def check_fast_path(category: str, evidence: dict[str, Any], row: dict) -> dict | None:
+def check_fast_path(category: str, evidence: dict[str, Any], row: dict,
+                    learned: bool = True) -> dict | None:
     """
     Deterministic confirmation rules. Returns a verdict dict if the evidence
     is unambiguous, or None if the LLM should investigate.
+    With learned=True, rules exported by learn_rules.py are tried after the
+    hand-written ones (see check_learned_rules).
+
+    Safe to call with partial evidence (only some tiers gathered): a rule that
+    depends on a label not yet in `evidence` never fires.
     """
+    verdict = _check_builtin_rules(category, evidence, row)
+    if verdict is None and learned:
+        verdict = check_learned_rules(category, evidence, row)
+    return verdict
+
+
+def _check_builtin_rules(category: str, evidence: dict[str, Any], row: dict) -> dict | None:
+    """The hand-written fast-path rules."""
     needed = row.get("QuantityNeeded") or 0
 
     if category == "QTYFULFI_STALE":
@@ -246,7 +275,7 @@ def check_fast_path(category: str, evidence: dict[str, Any], row: dict) -> dict
             on_hand = _num(gp_row.get("QTYONHND", 0))
             alloc = _num(gp_row.get("ATYALLOC", 0))
             available = on_hand - alloc
-            if available >= needed and alloc == 0 and len(sop) == 0:
+            if available >= needed and alloc == 0 and "open_orders" in evidence and len(sop) == 0:
                 return {
                     "verdict": "CONFIRM",
                     "reason": f"GP has {on_hand} on hand, 0 allocated, no open SOP orders. Safe to reset.",
@@ -275,7 +304,7 @@ def check_fast_path(category: str, evidence: dict[str, Any], row: dict) -> dict
             on_hand = _num(gp_row.get("QTYONHND", 0))
             alloc = _num(gp_row.get("ATYALLOC", 0))
             intercompany = evidence.get("intercompany", [])
-            if on_hand >= needed and alloc == 0 and len(intercompany) == 0:
+            if on_hand >= needed and alloc == 0 and "intercompany" in evidence and len(intercompany) == 0:
                 return {
                     "verdict": "CONFIRM",
                     "reason": f"GP has {on_hand} on hand, 0 allocated, no intercompany transfers. Safe to reset.",
@@ -295,45 +324,215 @@ def _num(val) -> float:
         return 0.0
 
 
+# ---------------------------------------------------------------------------
+# Evidence features + learned fast-path rules.
+# evidence_features() flattens gathered evidence into numeric features; they
+# are journaled with every LLM verdict, learn_rules.py fits rule lists on them
+# offline, and check_learned_rules() applies the exported rules.
+# ---------------------------------------------------------------------------
+
+# Surrogate keys and document numbers carry no signal — leave them out
+_ID_FIELD = re.compile(r"(?i)(pkey|sopnumbe|docid)$")
+
+
+def _maybe_num(val) -> float | None:
+    if isinstance(val, bool):
+        return float(val)
+    if isinstance(val, (int, float)):
+        return float(val)
+    try:
+        return float(str(val).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def evidence_features(evidence: dict[str, list[dict]], row: dict) -> dict[str, float]:
+    """
+    Flat numeric features for one row:
+        needed, days_open, retry_count          — from the staged row
+        <label>.count                           — rows each evidence query returned
+        <label>.<FIELD>                         — numeric fields of its first row
+        <label>.status<N>                       — rows per ItIntegrationStatusID
+        gp_qty.surplus                          — QTYONHND - ATYALLOC - needed
+    A label that wasn't gathered contributes no features.
+    """
+    needed = _num(row.get("QuantityNeeded"))
+    features = {
+        "needed": needed,
+        "days_open": _num(row.get("DaysOpen")),
+        "retry_count": _num(row.get("RetryCount")),
+    }
+    for label, rows in evidence.items():
+        features[f"{label}.count"] = float(len(rows))
+        if rows:
+            for field, value in rows[0].items():
+                num = _maybe_num(value)
+                if num is not None and not _ID_FIELD.search(field):
+                    features[f"{label}.{field}"] = num
+        for r in rows:
+            status = _maybe_num(r.get("ItIntegrationStatusID"))
+            if status is not None and "cnt" not in r:
+                key = f"{label}.status{int(status)}"
+                features[key] = features.get(key, 0.0) + 1
+    if "gp_qty.QTYONHND" in features:
+        features["gp_qty.surplus"] = features["gp_qty.QTYONHND"] - features.get("gp_qty.ATYALLOC", 0.0) - needed
+    return features
+
+
+_OPS = {
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    "==": lambda a, b: a == b,
+}
+
+
+def load_learned_rules(path: str = LEARNED_RULES_PATH) -> dict[str, list[dict]]:
+    """
+    Read learned_rules.json: {"rules": [{"category", "conditions": [[feature, op, value], ...],
+    "verdict", "new_category", "precision", "support", ...}]}. Returns {category: [rule, ...]};
+    {} when the file is absent or unreadable.
+    """
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    by_category: dict[str, list[dict]] = {}
+    for rule in data.get("rules", []):
+        if all(op in _OPS for _, op, _ in rule.get("conditions", [])) and rule.get("conditions"):
+            by_category.setdefault(rule["category"], []).append(rule)
+    return by_category
+
+
+LEARNED_RULES = load_learned_rules()
+
+
+def describe_conditions(conditions: list) -> str:
+    return " and ".join(f"{feature} {op} {value:g}" for feature, op, value in conditions)
+
+
+def check_learned_rules(category: str, evidence: dict[str, Any], row: dict) -> dict | None:
+    """
+    First learned rule of the category whose conditions all hold. A condition on
+    a feature that isn't available (label not gathered yet, or no rows) fails,
+    so this is safe with partial evidence.
+    """
+    rules = LEARNED_RULES.get(category)
+    if not rules:
+        return None
+    features = evidence_features(evidence, row)
+    for rule in rules:
+        if all(f in features and _OPS[op](features[f], v) for f, op, v in rule["conditions"]):
+            return {
+                "verdict": rule["verdict"],
+                "reason": (f"Learned rule ({describe_conditions(rule['conditions'])}; held-out precision "
+                           f"{rule['precision']:.0%} over {rule['support']} row(s))"),
+                "new_category": rule.get("new_category", ""),
+                "method": "learned-rule",
+            }
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Evidence gathering — runs queries in parallel via MCP, returns results dict.
 # ---------------------------------------------------------------------------
 
-async def _run_query(label: str, sql: str, database: str) -> tuple[str, list[dict]]:
-    """Execute a single query via MCP and return (label, rows)."""
+async def _run_query(label: str, sql: str, database: str) -> tuple[str, list[dict] | None]:
+    """
+    Execute a single query via MCP and return (label, rows). rows is None when
+    the query failed or timed out: that is "unknown", not "no rows", and must
+    never let a rule conclude that nothing exists.
+    """
     try:
         raw = await mcp_client.call_tool("execute_query", {"query": sql, "database": database})
         return label, mcp_client.parse_rows(raw)
     except Exception:
-        return label, []
+        return label, None
+
+
+def _query_params(row: dict) -> dict:
+    """SQL-escaped placeholder values for the evidence query templates."""
+    return {
+        "part": (row.get("PartNumber") or "").replace("'", "''"),
+        "location": (row.get("Location") or "").replace("'", "''"),
+        "company_db": (row.get("Company") or "").replace("'", "''"),
+        "part_line_id": row.get("PartLineID") or 0,
+    }
+
+
+async def _run_specs(specs: list[dict], params: dict) -> dict[str, list[dict]]:
+    """
+    Run a list of query specs in parallel and return {label: rows}. Failed
+    queries are left out, so every rule treats them as not gathered.
+    """
+    tasks = [
+        _run_query(spec["label"], spec["sql"].format(**params), spec["database"])
+        for spec in specs
+    ]
+    results = await asyncio.gather(*tasks)
+    return {label: rows for label, rows in results if rows is not None}
+
+
+def evidence_tiers(category: str) -> list[tuple[int, list[dict]]]:
+    """Group a category's evidence specs by tier. Returns [(tier, specs)], lowest tier first."""
+    by_tier: dict[int, list[dict]] = {}
+    for spec in EVIDENCE_QUERIES.get(category, []):
+        by_tier.setdefault(spec.get("tier", 1), []).append(spec)
+    return sorted(by_tier.items())
 
 
 async def gather_evidence(row: dict, category: str) -> dict[str, list[dict]]:
     """
-    Run all evidence queries for the given category in parallel.
-    Returns {label: [row_dicts]} for each query.
+    Run all evidence queries for the given category in parallel, ignoring tiers.
+    Returns {label: [row_dicts]} for each query that succeeded.
     """
     specs = EVIDENCE_QUERIES.get(category, [])
     if not specs:
         return {}
+    return await _run_specs(specs, _query_params(row))
 
-    part = (row.get("PartNumber") or "").replace("'", "''")
-    location = (row.get("Location") or "").replace("'", "''")
-    company_db = (row.get("Company") or "").replace("'", "''")
-    part_line_id = row.get("PartLineID") or 0
-
-    tasks = []
-    for spec in specs:
-        sql = spec["sql"].format(
-            part=part,
-            location=location,
-            company_db=company_db,
-            part_line_id=part_line_id,
-        )
-        tasks.append(_run_query(spec["label"], sql, spec["database"]))
 
-    results = await asyncio.gather(*tasks)
-    return dict(results)
+async def gather_evidence_tiered(
+    row: dict,
+    category: str,
+    decide: Callable[[dict[str, list[dict]]], dict | None] | None = None,
+) -> tuple[dict[str, list[dict]], dict | None, list[int]]:
+    """
+    Run evidence queries tier by tier, evaluating the fast-path rules after each
+    tier. Queries within a tier run in parallel; later tiers are skipped as soon
+    as check_fast_path returns a verdict.
+
+    `decide(evidence)` is an optional second deterministic check (the compiled
+    playbook rules) tried after the hand-written fast-path at each tier; it
+    returns a verdict dict or None and must, like check_fast_path, be safe with
+    partial evidence. Learned rules run last: they were fitted on rows neither
+    of the others decided.
+
+    Returns (evidence, fast_result, tiers_run) where fast_result is the
+    deterministic verdict dict (or None) and tiers_run lists the tier numbers
+    that were executed.
+    """
+    params = _query_params(row)
+    evidence: dict[str, list[dict]] = {}
+    tiers_run: list[int] = []
+
+    for tier_num, specs in evidence_tiers(category):
+        with tracing.span("evidence tier", tier=tier_num, queries=len(specs)):
+            evidence.update(await _run_specs(specs, params))
+        tiers_run.append(tier_num)
+        with tracing.span("fast-path", tier=tier_num) as s:
+            fast_result = check_fast_path(category, evidence, row, learned=False)
+            if fast_result is None and decide is not None:
+                fast_result = decide(evidence)
+            if fast_result is None:
+                fast_result = check_learned_rules(category, evidence, row)
+            s["verdict"] = fast_result["verdict"] if fast_result else None
+        if fast_result:
+            return evidence, fast_result, tiers_run
+
+    return evidence, None, tiers_run
 
 
 # ---------------------------------------------------------------------------
@@ -362,6 +561,10 @@ def format_evidence(row: dict, evidence: dict[str, list[dict]]) -> str:
     lines.append("")
     lines.append("EVIDENCE:")
 
+    # Queries that errored or timed out aren't in evidence; say so rather than "(no data)"
+    failed = [spec["label"] for spec in EVIDENCE_QUERIES.get(row.get("ErrorCategory", ""), [])
+              if spec["label"] not in evidence]
+
     for label, rows in evidence.items():
         if not rows:
             lines.append(f"  {label}: (no data)")
@@ -442,4 +645,7 @@ def format_evidence(row: dict, evidence: dict[str, list[dict]]) -> str:
             if rows:
                 lines.append(f"    {rows[0]}")
 
+    for label in failed:
+        lines.append(f"  {label}: (query failed — result unknown, not empty)")
+
     return "\n".join(lines)
@@ -0,0 +1,337 @@
+"""
+history.py — Local analytical store of audit and investigation runs.
+
+Every audit.py and investigate.py run is recorded in a SQLite file
+(HISTORY_DB_PATH, default history.sqlite in the project directory): one row
+per run, and one row per finding (audit Detail row or investigation Detail
+row) with its identifiers, category, fix type, DaysOpen, verdict and method,
+plus the full row as JSON. Findings are indexed on PartLineID,
+(PartNumber, Location), (ErrorCategory, run time) and run time, so cross-run
+questions are single indexed queries instead of opening dozens of workbooks.
+investigate.find_latest_audit() compares this store's newest audit with the
+newest audit_*.xlsx on disk and takes the more recent one.
+
+Usage:
+    python history.py ingest [files...]       # backfill existing audit_/investigation_ workbooks
+    python history.py runs
+    python history.py part-line 512345        # how long has this part line been failing?
+    python history.py part P12345 --location W101
+    python history.py backlog --days 30 --csv history.csv   # audit backlog by category per run
+    python history.py oldest --min-runs 3     # part lines still open across the most audits
+    python history.py sql "SELECT category, COUNT(*) FROM findings GROUP BY category"
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import openpyxl
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(PROJECT_DIR, "history.sqlite"))
+
+# Workbook sheet holding one row per finding, by run kind
+DETAIL_SHEETS = {"audit": "Detail", "investigation": "Investigation Detail"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     INTEGER PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    path       TEXT NOT NULL UNIQUE,
+    run_time   TEXT NOT NULL,
+    audit_path TEXT,
+    rows       INTEGER NOT NULL,
+    ingested   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS findings (
+    run_id       INTEGER NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    kind         TEXT NOT NULL,
+    run_time     TEXT NOT NULL,
+    company      TEXT,
+    ticket_id    TEXT,
+    part_line_id TEXT,
+    part_number  TEXT,
+    location     TEXT,
+    category     TEXT,
+    fix_type     TEXT,
+    days_open    INTEGER,
+    verdict      TEXT,
+    method       TEXT,
+    data         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_runs_kind_time ON runs(kind, run_time);
+CREATE INDEX IF NOT EXISTS ix_findings_part_line ON findings(part_line_id, run_time);
+CREATE INDEX IF NOT EXISTS ix_findings_part_location ON findings(part_number, location, run_time);
+CREATE INDEX IF NOT EXISTS ix_findings_category_time ON findings(category, run_time);
+CREATE INDEX IF NOT EXISTS ix_findings_run_time ON findings(run_time);
+"""
+
+
+def log(msg: str):
+    print(msg.encode("ascii", "replace").decode("ascii"), flush=True)
+
+
+def _text(value) -> str | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _int(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def run_time_of(path: str) -> str:
+    """Run time from an audit_/investigation_YYYYMMDD_HHMMSS name, else the file's mtime."""
+    match = re.search(r"(\d{8})_(\d{6})", os.path.basename(path))
+    if match:
+        return datetime.strptime("".join(match.groups()), "%Y%m%d%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+    return datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def read_detail(path: str) -> tuple[str, list[dict]] | None:
+    """(kind, rows) from an audit or investigation workbook's Detail sheet; None if it has neither."""
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for kind, sheet in DETAIL_SHEETS.items():
+            if sheet in wb.sheetnames:
+                rows = wb[sheet].iter_rows(values_only=True)
+                header = [str(h) for h in next(rows, ())]
+                return kind, [dict(zip(header, r)) for r in rows if any(v not in (None, "") for v in r)]
+        return None
+    finally:
+        wb.close()
+
+
+class HistoryStore:
+    """SQLite store of runs and their findings; see the module docstring."""
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def record_run(self, kind: str, path: str, rows: list[dict], run_time: str | None = None,
+                   audit_path: str | None = None) -> int:
+        """
+        Store one run and its findings, replacing an earlier ingest of the same
+        file. Returns the run_id.
+        """
+        path = os.path.abspath(path)
+        run_time = run_time or run_time_of(path)
+        with self._conn:
+            self._conn.execute("DELETE FROM runs WHERE path = ?", (path,))
+            cur = self._conn.execute(
+                "INSERT INTO runs (kind, path, run_time, audit_path, rows, ingested) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, path, run_time, audit_path and os.path.abspath(audit_path), len(rows), time.time()),
+            )
+            run_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO findings (run_id, kind, run_time, company, ticket_id, part_line_id, part_number, "
+                "location, category, fix_type, days_open, verdict, method, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id, kind, run_time, _text(r.get("Company")), _text(r.get("TicketID")),
+                        _text(r.get("PartLineID")), _text(r.get("PartNumber")), _text(r.get("Location")),
+                        _text(r.get("ErrorCategory")), _text(r.get("FixType")), _int(r.get("DaysOpen")),
+                        _text(r.get("LLMVerdict")), _text(r.get("InvestigationMethod")),
+                        json.dumps(r, default=str),
+                    )
+                    for r in rows
+                ],
+            )
+        return run_id
+
+    def ingest_workbook(self, path: str) -> int | None:
+        """Record an existing audit or investigation workbook. Returns the run_id, or None if not recognized."""
+        detail = read_detail(path)
+        if detail is None:
+            return None
+        kind, rows = detail
+        return self.record_run(kind, path, rows)
+
+    def latest_audit(self) -> str | None:
+        """Path of the most recent recorded audit whose workbook is still on disk."""
+        for (path,) in self._conn.execute("SELECT path FROM runs WHERE kind = 'audit' ORDER BY run_time DESC"):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def query(self, sql: str, params: tuple = ()) -> tuple[list[str], list[tuple]]:
+        cur = self._conn.execute(sql, params)
+        return [d[0] for d in cur.description or ()], cur.fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Canned cross-run queries
+# ---------------------------------------------------------------------------
+
+def part_line_history(store: HistoryStore, part_line_id: str) -> tuple[list[str], list[tuple]]:
+    return store.query(
+        "SELECT run_time, kind, category, fix_type, days_open, verdict, method, ticket_id, part_number, location "
+        "FROM findings WHERE part_line_id = ? ORDER BY run_time",
+        (part_line_id,),
+    )
+
+
+def part_history(store: HistoryStore, part_number: str, location: str | None = None) -> tuple[list[str], list[tuple]]:
+    sql = ("SELECT run_time, kind, location, part_line_id, ticket_id, category, fix_type, days_open, verdict "
+           "FROM findings WHERE part_number = ?")
+    params: tuple = (part_number,)
+    if location:
+        sql += " AND location = ?"
+        params += (location,)
+    return store.query(sql + " ORDER BY run_time, location", params)
+
+
+def backlog_trend(store: HistoryStore, days: int = 30) -> tuple[list[str], list[tuple]]:
+    """One row per audit run in the window: run id, run time, total, then a count per category."""
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    _, counts = store.query(
+        "SELECT run_id, run_time, category, COUNT(*) FROM findings "
+        "WHERE kind = 'audit' AND run_time >= ? GROUP BY run_id, category ORDER BY run_time, run_id",
+        (since,),
+    )
+    categories = sorted({c or "" for _, _, c, _ in counts})
+    # Keyed on run_id: two runs can share a timestamp
+    by_run: dict[int, tuple[str, dict[str, int]]] = {}
+    for run_id, run_time, category, n in counts:
+        by_run.setdefault(run_id, (run_time, {}))[1][category or ""] = n
+    rows = [(run_id, run_time, sum(c.values()), *(c.get(cat, 0) for cat in categories))
+            for run_id, (run_time, c) in by_run.items()]
+    return ["run_id", "run_time", "total", *categories], rows
+
+
+def oldest_open(store: HistoryStore, min_runs: int = 2, limit: int = 50) -> tuple[list[str], list[tuple]]:
+    """Part lines that appear in the most audit runs, with first/last seen and current category."""
+    return store.query(
+        "SELECT part_line_id, part_number, location, COUNT(*) AS audits, MIN(run_time) AS first_seen, "
+        "MAX(run_time) AS last_seen, MAX(days_open) AS days_open, "
+        "(SELECT f2.category FROM findings f2 WHERE f2.part_line_id = f.part_line_id AND f2.kind = 'audit' "
+        " ORDER BY f2.run_time DESC LIMIT 1) AS category "
+        "FROM findings f WHERE kind = 'audit' AND part_line_id IS NOT NULL "
+        "GROUP BY part_line_id HAVING COUNT(*) >= ? ORDER BY audits DESC, first_seen LIMIT ?",
+        (min_runs, limit),
+    )
+
+
+def print_table(columns: list[str], rows: list[tuple], max_width: int = 40):
+    cells = [[("" if v is None else str(v))[:max_width] for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    log("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    log("  ".join("-" * w for w in widths))
+    for row in cells:
+        log("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def write_csv(path: str, columns: list[str], rows: list[tuple]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Query the audit / investigation history store.")
+    parser.add_argument("--db", default=HISTORY_DB_PATH, help=f"History database (default: {HISTORY_DB_PATH})")
+    parser.add_argument("--csv", metavar="PATH", help="Also write the result to a CSV file")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ingest", help="Record existing workbooks (default: every audit_/investigation_*.xlsx here)")
+    p.add_argument("files", nargs="*")
+    sub.add_parser("runs", help="List recorded runs")
+    p = sub.add_parser("part-line", help="Every finding for one PartLineID across runs")
+    p.add_argument("part_line_id")
+    p = sub.add_parser("part", help="Every finding for a part number (optionally one location) across runs")
+    p.add_argument("part_number")
+    p.add_argument("--location")
+    p = sub.add_parser("backlog", help="Audit backlog by category per run")
+    p.add_argument("--days", type=int, default=30)
+    p = sub.add_parser("oldest", help="Part lines present in the most audit runs")
+    p.add_argument("--min-runs", type=int, default=2)
+    p.add_argument("--limit", type=int, default=50)
+    p = sub.add_parser("sql", help="Run a read-only SQL query against the store")
+    p.add_argument("query")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    try:
+        if args.command == "ingest":
+            files = args.files or sorted(
+                glob.glob(os.path.join(PROJECT_DIR, "audit_*.xlsx"))
+                + glob.glob(os.path.join(PROJECT_DIR, "investigation_*.xlsx"))
+            )
+            for path in files:
+                try:
+                    run_id = store.ingest_workbook(path)
+                except Exception as e:
+                    log(f"[HISTORY] {path}: FAILED ({e})")
+                    continue
+                log(f"[HISTORY] {path}: " + (f"run {run_id}" if run_id else "no Detail sheet, skipped"))
+            return
+
+        start = time.perf_counter()
+        if args.command == "runs":
+            columns, rows = store.query(
+                "SELECT run_id, kind, run_time, rows, path FROM runs ORDER BY run_time DESC"
+            )
+        elif args.command == "part-line":
+            columns, rows = part_line_history(store, args.part_line_id)
+        elif args.command == "part":
+            columns, rows = part_history(store, args.part_number, args.location)
+        elif args.command == "backlog":
+            columns, rows = backlog_trend(store, args.days)
+        elif args.command == "oldest":
+            columns, rows = oldest_open(store, args.min_runs, args.limit)
+        else:
+            # Separate read-only connection, so an ad-hoc query can't modify the store
+            conn = sqlite3.connect(f"file:{os.path.abspath(args.db)}?mode=ro", uri=True)
+            try:
+                cur = conn.execute(args.query)
+                columns, rows = [d[0] for d in cur.description or ()], cur.fetchall()
+            except sqlite3.Error as e:
+                log(f"[HISTORY] {e}")
+                return
+            finally:
+                conn.close()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        print_table(columns, rows)
+        log(f"\n{len(rows)} row(s) in {elapsed_ms:.1f} ms")
+        if args.command == "part-line" and rows:
+            audits = [r for r in rows if r[1] == "audit"]
+            if audits:
+                first, last = audits[0][0], audits[-1][0]
+                span = (datetime.fromisoformat(last) - datetime.fromisoformat(first)).days
+                log(f"In {len(audits)} audit run(s) from {first} to {last} ({span} day(s)); "
+                    f"latest category {audits[-1][2]}")
+        if args.csv:
+            write_csv(args.csv, columns, rows)
+            log(f"Written -> {args.csv}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,25 +6,66 @@ via MCP (parallel SQL), checks deterministic fast-path rules, and falls back to
 LLM investigation via phi4-mini for ambiguous cases. Writes investigation output
 to investigation_YYYYMMDD_HHMMSS.xlsx.
 
+Playbooks are executable: each playbooks/*.txt ends with a RULES section
+(playbook_rules.py) that decides rows deterministically from the gathered
+evidence. Only steps marked JUDGMENT — or rows the rules can't settle — go to
+the LLM.
+
+Parsed LLM verdicts are cached on disk (llm_cache.py) keyed by prompt hash and
+model, so unchanged evidence packets skip inference on later runs.
+
+Each finished row is appended to a crash-safe journal (journal.py); --resume
+skips rows already journaled for the same audit input.
+
+--time-budget caps the run's wall time: rows are processed highest priority
+first (DaysOpen, Deficit, RetryCount, weighted by --priority) and whatever is
+unfinished when the budget runs out is written as DEFERRED. Every MCP and LLM
+call has its own deadline (MCP_CALL_TIMEOUT, LLM_CALL_TIMEOUT) regardless.
+
+The model is loaded (warm-up) while the MCP check and evidence gathering run,
+held resident for the run, and unloaded at shutdown; --no-warmup skips this.
+
 Usage:
     python investigate.py
     python investigate.py path/to/audit_YYYYMMDD_HHMMSS.xlsx
+    python investigate.py --no-cache
+    python investigate.py --resume
+    python investigate.py --batch-size 4
+    python investigate.py --free-text
+    python investigate.py --no-rules
+    python investigate.py --no-warmup
+    python investigate.py --time-budget 20m [--priority days=1,deficit=2,retry=5]
+    python investigate.py --render-journal [--journal journals/<file>.jsonl]
+    python investigate.py --trace [--profile]
 """
 
+import argparse
 import asyncio
 import glob
 import os
-import sys
+import time
 from collections import Counter
 from datetime import datetime
+from typing import Callable
 
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 from dotenv import load_dotenv
 
 import mcp_client
-from evidence import gather_evidence, format_evidence, check_fast_path, EVIDENCE_QUERIES
-from llm_utils import call_llm_single_turn, parse_verdict
+import tracing
+from evidence import LEARNED_RULES, evidence_features, evidence_tiers, format_evidence, gather_evidence_tiered
+from history import HistoryStore
+from journal import RunJournal, audit_fingerprint, journal_path_for, load_journal, row_keys
+from llm_cache import VerdictCache, cache_key
+from llm_pool import close_pool, get_pool
+from playbook_rules import PlaybookRuleError, compile_all, describe_outcome, evaluate_playbook, read_playbook
+from llm_utils import (
+    DEFAULT_OPTIONS, LLM_NUM_PREDICT, OLLAMA_ESCALATION_MODEL, OLLAMA_MODEL, OLLAMA_NUM_CTX, OLLAMA_WARMUP,
+    VERDICT_SCHEMA, VERDICT_STOP, batch_verdict_schema, call_llm_with_stats, consistency_problem,
+    parse_batch_verdicts, parse_batch_verdicts_json, parse_verdict, parse_verdict_json,
+    release_models, warm_up,
+)
 
 load_dotenv()
 
@@ -51,21 +92,85 @@ SYSTEM_PROMPT = (
     "new_category: <only if RECLASSIFY>"
 )
 
+# Batch mode (--batch-size K): one playbook + K labelled evidence packets per call.
+BATCH_SYSTEM_PROMPT = (
+    "You are an inventory reconciliation analyst. "
+    "You will be given a playbook with a decision tree, followed by several evidence "
+    "packets labelled ROW 1, ROW 2, and so on. "
+    "Follow the decision tree step by step for each row independently. "
+    "For every row, in order, output exactly 4 lines:\n"
+    "row: <n>\n"
+    "verdict: CONFIRM|ESCALATE|RECLASSIFY\n"
+    "reason: <one sentence>\n"
+    "new_category: <only if RECLASSIFY>"
+)
+
+# Structured-output variants (default). Ollama constrains decoding to
+# VERDICT_SCHEMA / batch_verdict_schema, so the answer is JSON with no filler.
+SYSTEM_PROMPT_JSON = (
+    "You are an inventory reconciliation analyst. "
+    "You will be given a playbook with a decision tree, evidence from database queries, "
+    "and details about a failed inventory transaction. "
+    "Follow the decision tree step by step using the evidence provided. "
+    "Answer with a JSON object: "
+    '{"verdict": "CONFIRM|ESCALATE|RECLASSIFY", "reason": "<one sentence>", '
+    '"new_category": "<category if RECLASSIFY, else empty>"}'
+)
+
+BATCH_SYSTEM_PROMPT_JSON = (
+    "You are an inventory reconciliation analyst. "
+    "You will be given a playbook with a decision tree, followed by several evidence "
+    "packets labelled ROW 1, ROW 2, and so on. "
+    "Follow the decision tree step by step for each row independently. "
+    'Answer with a JSON object {"rows": [...]} holding one entry per row, in order: '
+    '{"row": <n>, "verdict": "CONFIRM|ESCALATE|RECLASSIFY", "reason": "<one sentence>", '
+    '"new_category": "<category if RECLASSIFY, else empty>"}'
+)
+
+# Ollama model options for verdict calls (pinned num_ctx from llm_utils).
+# Part of the verdict cache key.
+LLM_OPTIONS: dict = dict(DEFAULT_OPTIONS)
+
+# JSON-schema constrained verdicts; --free-text switches back to the 3-line
+# format + regex parser.
+STRUCTURED_OUTPUT = True
+
+# Decide rows with the compiled playbook RULES before the LLM; --no-rules
+# sends every non-fast-path row to the LLM.
+PLAYBOOK_RULES = True
+
+
+def _system_prompt(batch: bool) -> str:
+    if STRUCTURED_OUTPUT:
+        return BATCH_SYSTEM_PROMPT_JSON if batch else SYSTEM_PROMPT_JSON
+    return BATCH_SYSTEM_PROMPT if batch else SYSTEM_PROMPT
+
+
+def _call_options(n_rows: int = 1) -> dict:
+    """Per-call Ollama options: pinned options + output cap (+ stop sequences in free-text mode)."""
+    options = {**LLM_OPTIONS, "num_predict": LLM_NUM_PREDICT * n_rows}
+    if not STRUCTURED_OUTPUT:
+        options["stop"] = VERDICT_STOP
+    return options
+
+
+def _call_format(n_rows: int = 1) -> dict | None:
+    if not STRUCTURED_OUTPUT:
+        return None
+    return VERDICT_SCHEMA if n_rows == 1 else batch_verdict_schema(n_rows)
+
 
 # ---------------------------------------------------------------------------
 # Playbook loading
 # ---------------------------------------------------------------------------
 
-PLAYBOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "playbooks")
-
-
 def load_playbook(category: str) -> str | None:
-    """Load a playbook text file for the given category. Returns None if not found."""
-    path = os.path.join(PLAYBOOK_DIR, f"{category}.txt")
-    if os.path.isfile(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-    return None
+    """
+    Load the prose of a category's playbook (RULES section stripped) for the
+    LLM prompt. Returns None if not found.
+    """
+    playbook = read_playbook(category)
+    return playbook[0] if playbook else None
 
 
 # ---------------------------------------------------------------------------
@@ -73,13 +178,23 @@ def load_playbook(category: str) -> str | None:
 # ---------------------------------------------------------------------------
 
 def find_latest_audit(explicit_path: str | None = None) -> str:
-    """Find the most recent audit_*.xlsx file, or use the explicitly provided path."""
+    """
+    The explicitly provided path, else the newer of the most recent audit
+    recorded in the history store and the newest audit_*.xlsx on disk (a run
+    whose history record failed, or a copied-in workbook, is only on disk).
+    """
     if explicit_path and os.path.isfile(explicit_path):
         return explicit_path
 
+    store = HistoryStore()
+    try:
+        latest = store.latest_audit()
+    finally:
+        store.close()
+
     project_dir = os.path.dirname(os.path.abspath(__file__))
     pattern = os.path.join(project_dir, "audit_*.xlsx")
-    files = glob.glob(pattern)
+    files = glob.glob(pattern) + ([latest] if latest else [])
     if not files:
         raise FileNotFoundError(
             "No audit_*.xlsx files found. Run audit.py first."
@@ -150,6 +265,7 @@ VERDICT_COLORS = {
     "ESCALATE":    "FCE4D6",  # orange
     "RECLASSIFY":  "DDEBF7",  # blue
     "UNKNOWN":     "EEEEEE",  # grey
+    "DEFERRED":    "FFF2CC",  # yellow
 }
 
 
@@ -161,6 +277,44 @@ def _header_row(ws, columns: list[str]):
         cell.alignment = Alignment(horizontal="center")
 
 
+def decided_by(results: list[dict]) -> list[tuple[str, int]]:
+    """Rows decided by compiled rules (fast-path, playbook, learned) vs the LLM (incl. cache) vs neither."""
+    methods = Counter(r["InvestigationMethod"] for r in results)
+    compiled = methods.get("fast-path", 0) + methods.get("playbook", 0) + methods.get("learned-rule", 0)
+    llm = methods.get("llm", 0) + methods.get("llm-batch", 0) + methods.get("llm-cache", 0)
+    return [
+        ("Compiled rules", compiled),
+        ("LLM", llm),
+        ("Other", len(results) - compiled - llm),
+    ]
+
+
+def llm_accounting(results: list[dict]) -> list[dict]:
+    """
+    Aggregate every Ollama call recorded in the results' LLMCalls lists per
+    (category, model): calls, rows answered, token counts, prefill/eval/load
+    time, and cold loads.
+    """
+    totals: dict[tuple[str, str], dict] = {}
+    for r in results:
+        for call in r.get("LLMCalls") or []:
+            key = (r.get("ErrorCategory", "OTHER"), call.get("model") or OLLAMA_MODEL)
+            t = totals.setdefault(key, {
+                "category": key[0], "model": key[1], "calls": 0, "rows": 0, "prompt_tokens": 0,
+                "prefill_ms": 0.0, "eval_tokens": 0, "eval_ms": 0.0, "load_ms": 0.0, "cold_loads": 0,
+            })
+            t["calls"] += 1
+            t["rows"] += call.get("rows") or 1
+            for field in ("prompt_tokens", "prefill_ms", "eval_tokens", "eval_ms", "load_ms"):
+                t[field] += call.get(field) or 0
+            t["cold_loads"] += bool(call.get("cold"))
+    return [totals[k] for k in sorted(totals)]
+
+
+def _tok_per_s(tokens: float, ms: float) -> float:
+    return round(tokens / (ms / 1000), 1) if ms else 0.0
+
+
 def write_investigation_excel(results: list[dict], filename: str):
     """Write investigation results to Excel with Summary + Detail tabs."""
     log(f"\n[EXCEL] Building investigation workbook with {len(results)} row(s)...")
@@ -172,7 +326,7 @@ def write_investigation_excel(results: list[dict], filename: str):
 
     _header_row(ws_sum, ["Verdict", "Count"])
     verdict_counts = Counter(r["LLMVerdict"] for r in results)
-    for verdict in ("CONFIRM", "ESCALATE", "RECLASSIFY", "UNKNOWN"):
+    for verdict in ("CONFIRM", "ESCALATE", "RECLASSIFY", "UNKNOWN", "DEFERRED"):
         count = verdict_counts.get(verdict, 0)
         ws_sum.append([verdict, count])
         fill = PatternFill("solid", fgColor=VERDICT_COLORS.get(verdict, "FFFFFF"))
@@ -182,9 +336,75 @@ def write_investigation_excel(results: list[dict], filename: str):
     ws_sum.append([])
     _header_row(ws_sum, ["Method", "Count"])
     method_counts = Counter(r["InvestigationMethod"] for r in results)
-    for method in ("fast-path", "llm", "no-playbook"):
+    for method in ("fast-path", "playbook", "learned-rule", "llm", "llm-batch", "llm-cache", "no-playbook", "error", "deferred"):
         ws_sum.append([method, method_counts.get(method, 0)])
 
+    ws_sum.append([])
+    _header_row(ws_sum, ["Decided By", "Count", "Share"])
+    for label, count in decided_by(results):
+        ws_sum.append([label, count, f"{count / len(results):.0%}" if results else "n/a"])
+
+    ws_sum.append([])
+    _header_row(ws_sum, ["LLM Cache", "Count"])
+    hits = method_counts.get("llm-cache", 0)
+    misses = method_counts.get("llm", 0) + method_counts.get("llm-batch", 0)
+    ws_sum.append(["Hits", hits])
+    ws_sum.append(["Misses", misses])
+    ws_sum.append(["Hit Rate", f"{hits / (hits + misses):.0%}" if hits + misses else "n/a"])
+
+    ws_sum.append([])
+    _header_row(ws_sum, ["Evidence Tiers Run", "Count"])
+    tier_counts = Counter(r.get("EvidenceTiers", "") for r in results)
+    for tiers, count in sorted(tier_counts.items()):
+        ws_sum.append([tiers, count])
+    ws_sum.append(["Total Queries", sum(r.get("EvidenceQueries") or 0 for r in results)])
+    for cell in ws_sum[ws_sum.max_row]:
+        cell.font = Font(bold=True)
+
+    fast_calls = [r for r in results if r.get("LLMFastMs") is not None and r.get("LLMBatchRow", 1) == 1]
+    strong_calls = [r for r in results if r.get("LLMStrongMs") is not None]
+    if fast_calls:
+        ws_sum.append([])
+        _header_row(ws_sum, ["LLM Tier", "Rows Decided", "Calls", "Avg ms"])
+        tier_counts = Counter(r.get("LLMTier") for r in results)
+        for tier, calls, col in (("fast", fast_calls, "LLMFastMs"), ("strong", strong_calls, "LLMStrongMs")):
+            avg_ms = round(sum(r[col] for r in calls) / len(calls)) if calls else 0
+            ws_sum.append([tier, tier_counts.get(tier, 0), len(calls), avg_ms])
+        ws_sum.append(["Escalated", sum(1 for r in results if r.get("LLMEscalation"))])
+
+    accounting = llm_accounting(results)
+    if accounting:
+        ws_sum.append([])
+        columns = ["LLM Accounting", "Model", "Calls", "Rows", "Prompt Tok", "Prefill ms",
+                   "Prefill tok/s", "Eval Tok", "Eval ms", "Eval tok/s", "Load ms", "Cold Loads"]
+        _header_row(ws_sum, columns)
+        for a in accounting:
+            ws_sum.append([
+                a["category"], a["model"], a["calls"], a["rows"],
+                a["prompt_tokens"], round(a["prefill_ms"]), _tok_per_s(a["prompt_tokens"], a["prefill_ms"]),
+                a["eval_tokens"], round(a["eval_ms"]), _tok_per_s(a["eval_tokens"], a["eval_ms"]),
+                round(a["load_ms"]), a["cold_loads"],
+            ])
+            if a["cold_loads"]:
+                ws_sum.cell(ws_sum.max_row, len(columns)).fill = PatternFill("solid", fgColor=VERDICT_COLORS["ESCALATE"])
+        ws_sum.append([
+            "Total", "", *(sum(a[f] for a in accounting) for f in ("calls", "rows", "prompt_tokens")),
+            round(sum(a["prefill_ms"] for a in accounting)), "",
+            sum(a["eval_tokens"] for a in accounting), round(sum(a["eval_ms"] for a in accounting)), "",
+            round(sum(a["load_ms"] for a in accounting)), sum(a["cold_loads"] for a in accounting),
+        ])
+        for cell in ws_sum[ws_sum.max_row]:
+            cell.font = Font(bold=True)
+
+    backend_counts = Counter(
+        r["LLMBackend"] for r in results if r.get("LLMBackend") and r.get("LLMBatchRow", 1) == 1
+    )
+    if backend_counts:
+        ws_sum.append([])
+        _header_row(ws_sum, ["LLM Backend", "Calls"])
+        for backend, count in sorted(backend_counts.items()):
+            ws_sum.append([backend, count])
+
     ws_sum.append([])
     _header_row(ws_sum, ["Reclassified To", "Count"])
     reclass = [r for r in results if r["LLMVerdict"] == "RECLASSIFY"]
@@ -200,7 +420,9 @@ def write_investigation_excel(results: list[dict], filename: str):
     columns = [
         "Company", "TicketID", "PartLineID", "PartNumber", "Location",
         "ErrorCategory", "FixType", "DaysOpen",
-        "LLMVerdict", "LLMReason", "LLMNewCategory", "InvestigationMethod",
+        "LLMVerdict", "LLMReason", "LLMNewCategory", "InvestigationMethod", "PlaybookStep",
+        "EvidenceTiers", "EvidenceQueries", "LLMBackend", "LLMTier", "LLMEscalation",
+        "LLMModel", "LLMPromptTokens", "LLMPrefillMs", "LLMEvalTokens", "LLMEvalMs", "LLMLoadMs", "LLMColdLoad",
         "QuantityNeeded", "IntegrationError", "IntegrationID",
     ]
     _header_row(ws_det, columns)
@@ -216,7 +438,10 @@ def write_investigation_excel(results: list[dict], filename: str):
         "Company": 14, "TicketID": 14, "PartLineID": 12, "PartNumber": 18,
         "Location": 12, "ErrorCategory": 20, "FixType": 18, "DaysOpen": 10,
         "LLMVerdict": 14, "LLMReason": 50, "LLMNewCategory": 20,
-        "InvestigationMethod": 16, "QuantityNeeded": 14,
+        "InvestigationMethod": 16, "PlaybookStep": 22, "EvidenceTiers": 14, "EvidenceQueries": 16,
+        "LLMBackend": 26, "LLMTier": 10, "LLMEscalation": 30, "LLMModel": 16,
+        "LLMPromptTokens": 16, "LLMPrefillMs": 13, "LLMEvalTokens": 14, "LLMEvalMs": 11, "LLMLoadMs": 11,
+        "LLMColdLoad": 12, "QuantityNeeded": 14,
         "IntegrationError": 40, "IntegrationID": 16,
     }
     for i, col in enumerate(columns, 1):
@@ -229,20 +454,685 @@ def write_investigation_excel(results: list[dict], filename: str):
     log(f"[DONE] Investigation report written -> {filename}")
 
 
+# ---------------------------------------------------------------------------
+# Investigation pipeline
+#
+# Two bounded stages connected by a queue:
+#   evidence stage — up to EVIDENCE_CONCURRENCY rows gathering SQL evidence at
+#                    once; fast-path and playbook lookup run inline.
+#   LLM stage      — LLM_CONCURRENCY workers draining the queue, sized to the
+#                    total weight (parallel slots) of the Ollama backend pool.
+# Evidence gathering runs ahead while the LLM is busy, so total runtime tends
+# toward max(SQL, LLM) instead of their sum. Results are slotted back by row
+# index, so output order always matches the Staged Fixes order.
+#
+# In batch mode a batcher sits between the stages and packs up to K queued
+# rows of the same category into one LLM call.
+# ---------------------------------------------------------------------------
+
+EVIDENCE_CONCURRENCY = int(os.getenv("EVIDENCE_CONCURRENCY", "4"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", str(get_pool().total_weight(OLLAMA_MODEL))))
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", str(LLM_CONCURRENCY * 4)))
+
+
+def _result(row: dict, verdict: dict, method: str, extra: dict) -> dict:
+    """Build an output row from the input row, a verdict dict and the method used."""
+    return {
+        **row,
+        **extra,
+        "LLMVerdict": verdict["verdict"],
+        "LLMReason": verdict["reason"],
+        "LLMNewCategory": verdict.get("new_category", ""),
+        "InvestigationMethod": method,
+    }
+
+
+async def _evidence_stage(tag: str, row: dict, cache: VerdictCache | None,
+                          batch: bool = False) -> tuple[dict | None, dict | None]:
+    """
+    Gather evidence for one row and try to decide it without the LLM — by
+    fast-path rule or verdict cache hit. Returns (result, None) when decided,
+    or (None, llm_job) when the row needs an LLM call.
+    """
+    category = row.get("ErrorCategory", "OTHER")
+    part = row.get("PartNumber", "?")
+    location = row.get("Location", "?")
+    log(f"{tag} {category} — Part={part} Location={location}")
+    start = time.perf_counter()
+
+    def decide(evidence: dict) -> dict | None:
+        outcome = evaluate_playbook(category, evidence, row)
+        if outcome["status"] != "decided":
+            return None
+        return {**outcome["verdict"], "method": "playbook", "PlaybookStep": describe_outcome(outcome)}
+
+    # 1+2. Gather evidence tier by tier (parallel SQL within a tier),
+    # checking fast-path and compiled playbook rules between tiers
+    evidence, fast_result, tiers_run = await gather_evidence_tiered(
+        row, category, decide if PLAYBOOK_RULES else None,
+    )
+    total_tiers = len(evidence_tiers(category))
+    tier_info = {
+        "EvidenceTiers": f"{len(tiers_run)}/{total_tiers}",
+        "EvidenceQueries": len(evidence),
+        "EvidenceMs": round((time.perf_counter() - start) * 1000, 1),
+    }
+    evidence_labels = [f"{k}({len(v)})" for k, v in evidence.items()]
+    log(f"{tag}   Evidence (tiers {tier_info['EvidenceTiers']}): {', '.join(evidence_labels)}")
+
+    if fast_result:
+        method = fast_result.pop("method", "fast-path")
+        tier_info["PlaybookStep"] = fast_result.pop("PlaybookStep", "")
+        label = "PLAYBOOK " + tier_info["PlaybookStep"] if method == "playbook" else method.upper()
+        log(f"{tag}   {label}: {fast_result['verdict']} — {fast_result['reason']}")
+        return _result(row, fast_result, method, tier_info), None
+
+    # Training data for learn_rules.py — journaled with the LLM's verdict
+    tier_info["EvidenceFeatures"] = evidence_features(evidence, row)
+
+    if PLAYBOOK_RULES:
+        # Why the compiled rules handed this row to the LLM
+        tier_info["PlaybookStep"] = describe_outcome(evaluate_playbook(category, evidence, row))
+        log(f"{tag}   Playbook rules: {tier_info['PlaybookStep']} — LLM decides")
+
+    # 3. Load playbook
+    playbook = load_playbook(category)
+    if not playbook:
+        log(f"{tag}   NO PLAYBOOK for {category} — marking UNKNOWN")
+        verdict = {"verdict": "UNKNOWN", "reason": f"No playbook for category {category}", "new_category": ""}
+        return _result(row, verdict, "no-playbook", tier_info), None
+
+    # 4. Format evidence packet
+    evidence_text = format_evidence(row, evidence)
+
+    # 5. Verdict cache — identical prompt + model answered before
+    key = _verdict_key(playbook, evidence_text, batch)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached:
+            log(f"{tag}   LLM-CACHE: {cached['verdict']} — {cached['reason']}")
+            return _result(row, cached, "llm-cache", tier_info), None
+
+    job = {
+        "tag": tag,
+        "row": row,
+        "extra": tier_info,
+        "category": category,
+        "cache_key": key,
+        "playbook": playbook,
+        "evidence_text": evidence_text,
+        "user_prompt": f"{playbook}\n\n---\n\n{evidence_text}",
+    }
+    return None, job
+
+
+def _stats_columns(stats: dict) -> dict:
+    return {
+        "LLMPromptTokens": stats["prompt_tokens"],
+        "LLMPrefillMs": stats["prefill_ms"],
+        "LLMEvalTokens": stats["eval_tokens"],
+        "LLMEvalMs": stats["eval_ms"],
+        "LLMLoadMs": stats.get("load_ms", 0.0),
+        "LLMColdLoad": "COLD" if stats.get("cold") else "",
+        "LLMBackend": stats.get("backend", ""),
+        "LLMTier": "fast",
+        "LLMModel": stats.get("model", OLLAMA_MODEL),
+        "LLMFastMs": stats.get("wall_ms"),
+    }
+
+
+_CALL_FIELDS = ("model", "backend", "prompt_tokens", "prefill_ms", "eval_tokens", "eval_ms",
+                "load_ms", "wall_ms", "cold")
+
+
+def _call_record(stats: dict, rows: int = 1) -> dict:
+    """One entry of a result's LLMCalls list — the accounting for a single Ollama call."""
+    return {**{k: stats.get(k) for k in _CALL_FIELDS}, "rows": rows}
+
+
+def _timing(stats: dict) -> str:
+    text = (f"prefill {stats['prefill_ms']:.0f} ms ({stats['prompt_tokens']} tok), "
+            f"eval {stats['eval_ms']:.0f} ms ({stats['eval_tokens']} tok)")
+    if stats.get("cold"):
+        text += f" — COLD LOAD {stats['load_ms']:.0f} ms"
+    return text
+
+
+def _model_route() -> str:
+    """Model identity for cache keys: the fast model, plus the escalation model when cascading."""
+    return f"{OLLAMA_MODEL}>{OLLAMA_ESCALATION_MODEL}" if OLLAMA_ESCALATION_MODEL else OLLAMA_MODEL
+
+
+def _verdict_key(playbook: str, evidence_text: str, batch: bool) -> str:
+    """Verdict cache key for a row answered with the batch or the single-row system prompt."""
+    return cache_key(_system_prompt(batch), playbook, evidence_text, _model_route(),
+                     {**_call_options(), "format": _call_format()})
+
+
+async def _ask(job: dict, model: str) -> tuple[dict, dict]:
+    """One single-row verdict call to `model`. Returns (parsed verdict, call stats)."""
+    raw_output, stats = await call_llm_with_stats(
+        _system_prompt(False), job["user_prompt"], options=_call_options(), format=_call_format(),
+        model=model,
+    )
+    verdict = parse_verdict_json(raw_output) if STRUCTURED_OUTPUT else parse_verdict(raw_output)
+    return verdict, stats
+
+
+async def _escalate(job: dict, verdict: dict, problem: str, extra: dict) -> dict:
+    """
+    Cascade step: re-ask OLLAMA_ESCALATION_MODEL for a row whose fast-model
+    verdict failed consistency_problem(). Updates `extra` with the tier, model
+    and latency. If the strong model errors or also returns UNKNOWN, the fast
+    model's verdict is kept (unless it was UNKNOWN too).
+    """
+    tag = job["tag"]
+    extra["LLMEscalation"] = problem
+    log(f"{tag}   ESCALATING to {OLLAMA_ESCALATION_MODEL}: {problem}")
+    try:
+        strong, stats = await _ask(job, OLLAMA_ESCALATION_MODEL)
+    except Exception as e:
+        log(f"{tag}   Escalation LLM ERROR: {e} — keeping {OLLAMA_MODEL} verdict")
+        return verdict
+    extra["LLMStrongMs"] = stats["wall_ms"]
+    extra.setdefault("LLMCalls", []).append(_call_record(stats))
+    log(f"{tag}   LLM ({stats['model']}): {strong['verdict']} — {strong['reason']} "
+        f"[{stats['wall_ms']:.0f} ms]")
+    log(f"{tag}   LLM timing ({stats['model']}): {_timing(stats)}")
+    if strong["verdict"] == "UNKNOWN" and verdict["verdict"] != "UNKNOWN":
+        return verdict
+    extra["LLMTier"] = "strong"
+    extra["LLMModel"] = stats["model"]
+    return strong
+
+
+async def _llm_stage(job: dict, cache: VerdictCache | None) -> dict:
+    """
+    Single-turn LLM call for one queued row. Errors become UNKNOWN verdicts;
+    parsed verdicts are written to the cache. With OLLAMA_ESCALATION_MODEL set,
+    answers that fail the self-consistency check are re-asked of the stronger
+    model.
+    """
+    tag = job["tag"]
+    log(f"{tag}   Calling LLM ({len(job['user_prompt'])} chars)...")
+    extra = dict(job["extra"])
+    try:
+        verdict, stats = await _ask(job, OLLAMA_MODEL)
+        log(f"{tag}   LLM: {verdict['verdict']} — {verdict['reason']}")
+        log(f"{tag}   LLM timing: {_timing(stats)}")
+        extra.update(_stats_columns(stats))
+        extra["LLMCalls"] = [_call_record(stats)]
+        problem = consistency_problem(verdict, job["category"])
+        if problem and OLLAMA_ESCALATION_MODEL:
+            verdict = await _escalate(job, verdict, problem, extra)
+        if cache is not None and verdict["verdict"] != "UNKNOWN":
+            # Keyed on the single-row prompt even when this is a batch row's fallback
+            cache.put(_verdict_key(job["playbook"], job["evidence_text"], False), verdict, model=_model_route())
+    except Exception as e:
+        log(f"{tag}   LLM ERROR: {e}")
+        verdict = {"verdict": "UNKNOWN", "reason": f"LLM error: {e}", "new_category": ""}
+    return _result(job["row"], verdict, "llm", extra)
+
+
+def is_final(result: dict) -> bool:
+    """
+    False for rows that failed on a transient error (evidence or LLM call) or
+    were deferred by the time budget, and should be retried.
+    """
+    return (
+        result.get("InvestigationMethod") not in ("error", "deferred")
+        and not str(result.get("LLMReason", "")).startswith("LLM error:")
+    )
+
+
+def build_batch_prompt(playbook: str, evidence_texts: list[str]) -> str:
+    """One playbook followed by K labelled evidence packets."""
+    packets = [f"=== ROW {n} ===\n{text}" for n, text in enumerate(evidence_texts, 1)]
+    return f"{playbook}\n\n---\n\n" + "\n\n".join(packets)
+
+
+async def _llm_batch_stage(jobs: list[dict], cache: VerdictCache | None) -> list[dict]:
+    """
+    One LLM call for K same-category rows. Rows whose answer is missing or
+    doesn't parse fall back to a single-row call. Per-call timing is recorded
+    on every row of the batch; LLMBatchRow marks which row is the first.
+    """
+    tags = ",".join(job["tag"].strip("[]").split("/")[0] for job in jobs)
+    prompt = build_batch_prompt(jobs[0]["playbook"], [job["evidence_text"] for job in jobs])
+    log(f"[batch {tags}] Calling LLM for {len(jobs)} {jobs[0]['category']} row(s) ({len(prompt)} chars)...")
+    stats = None
+    try:
+        n = len(jobs)
+        raw_output, stats = await call_llm_with_stats(
+            _system_prompt(True), prompt, options=_call_options(n), format=_call_format(n),
+        )
+        if STRUCTURED_OUTPUT:
+            verdicts = parse_batch_verdicts_json(raw_output, n)
+        else:
+            verdicts = parse_batch_verdicts(raw_output, n)
+        log(f"[batch {tags}] LLM timing: {_timing(stats)}")
+    except Exception as e:
+        log(f"[batch {tags}] LLM ERROR: {e} — falling back to single-row calls")
+        verdicts = [None] * len(jobs)
+
+    out = []
+    for n, (job, verdict) in enumerate(zip(jobs, verdicts), 1):
+        if verdict is None:
+            log(f"{job['tag']}   Batch answer missing/unparseable — single-row fallback")
+            out.append(await _llm_stage(job, cache))
+            continue
+        log(f"{job['tag']}   LLM (batch): {verdict['verdict']} — {verdict['reason']}")
+        extra = {**job["extra"], **_stats_columns(stats), "LLMBatchSize": len(jobs), "LLMBatchRow": n,
+                 "LLMCalls": []}
+        problem = consistency_problem(verdict, job["category"])
+        if problem and OLLAMA_ESCALATION_MODEL:
+            verdict = await _escalate(job, verdict, problem, extra)
+        if cache is not None:
+            cache.put(job["cache_key"], verdict, model=_model_route())
+        out.append(_result(job["row"], verdict, "llm-batch", extra))
+    if stats is not None:
+        # The shared batch call is accounted once, on the batch's first row
+        out[0].setdefault("LLMCalls", []).insert(0, _call_record(stats, rows=len(jobs)))
+    return out
+
+
+def schedule_by_category(staged: list[dict]) -> list[int]:
+    """
+    Processing order that keeps same-category rows adjacent, so consecutive LLM
+    prompts share a byte-identical system prompt + playbook prefix and Ollama
+    can reuse its KV cache instead of re-prefilling ~500 tokens per row.
+    Categories appear in order of first occurrence; rows keep their relative
+    order within a category.
+    """
+    first_seen: dict[str, int] = {}
+    for i, row in enumerate(staged):
+        first_seen.setdefault(row.get("ErrorCategory", "OTHER"), i)
+    return sorted(range(len(staged)), key=lambda i: (first_seen[staged[i].get("ErrorCategory", "OTHER")], i))
+
+
+PRIORITY_WEIGHTS = os.getenv("INVESTIGATION_PRIORITY", "days=1,deficit=1,retry=1")
+_PRIORITY_FIELDS = {"days": "DaysOpen", "deficit": "Deficit", "retry": "RetryCount"}
+
+
+def parse_priority(spec: str) -> dict[str, float]:
+    """Parse 'days=1,deficit=2,retry=5' into {row column: weight}. Unknown keys raise ValueError."""
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip().lower()
+        if name not in _PRIORITY_FIELDS:
+            raise ValueError(f"Unknown priority term {name!r} (expected {', '.join(_PRIORITY_FIELDS)})")
+        weights[_PRIORITY_FIELDS[name]] = float(value or 1)
+    return weights
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def priority_score(row: dict, weights: dict[str, float]) -> float:
+    """Weighted sum of the row's priority columns; blanks count as 0, deficits by magnitude."""
+    return sum(w * abs(_number(row.get(col))) for col, w in weights.items())
+
+
+def schedule_by_priority(staged: list[dict], weights: dict[str, float]) -> list[int]:
+    """Processing order by descending priority_score; ties keep Staged Fixes order."""
+    return sorted(range(len(staged)), key=lambda i: -priority_score(staged[i], weights))
+
+
+def _deferred(row: dict) -> dict:
+    verdict = {"verdict": "DEFERRED", "reason": "Time budget exhausted before this row finished", "new_category": ""}
+    return _result(row, verdict, "deferred", {})
+
+
+async def investigate_rows(
+    staged: list[dict],
+    cache: VerdictCache | None = None,
+    on_result: Callable[[int, dict], None] | None = None,
+    order: list[int] | None = None,
+    batch_size: int = 1,
+    time_budget: float | None = None,
+    warmup: asyncio.Task | None = None,
+) -> list[dict]:
+    """
+    Run the evidence -> fast-path -> cache -> LLM pipeline over all staged rows.
+    `order` is the processing order (indices into staged; default input order).
+    With batch_size > 1, up to that many same-category rows share one LLM call.
+    Returns one result dict per input row, in input order. `on_result(index,
+    result)` is called as each row finishes (used for the checkpoint journal).
+    With time_budget (seconds), in-flight work is cancelled when it runs out and
+    every row without a result comes back DEFERRED.
+    LLM workers wait for the `warmup` task (if any) before their first call, so
+    the model load isn't charged to whichever row happens to be first.
+    """
+    total = len(staged)
+    results: list[dict | None] = [None] * total
+    evidence_sem = asyncio.Semaphore(EVIDENCE_CONCURRENCY)
+    # Items on llm_queue are lists of (index, job); single-row mode uses lists of one.
+    llm_queue: asyncio.Queue = asyncio.Queue(maxsize=LLM_QUEUE_SIZE)
+    batch_queue: asyncio.Queue = asyncio.Queue(maxsize=LLM_QUEUE_SIZE)
+
+    start = time.perf_counter()
+    first_llm: list[float] = []
+
+    def deliver(index: int, result: dict):
+        results[index] = result
+        if not first_llm and result.get("LLMCalls"):
+            first_llm.append(time.perf_counter() - start)
+            log(f"[PIPELINE] First LLM verdict after {first_llm[0]:.1f}s")
+        if on_result is not None:
+            on_result(index, result)
+
+    async def produce(index: int, row: dict):
+        tag = f"[{index + 1}/{total}]"
+        async with evidence_sem:
+            try:
+                with tracing.span("evidence stage", row=index + 1, category=row.get("ErrorCategory")) as s:
+                    result, job = await _evidence_stage(tag, row, cache, batch_size > 1)
+                    s["decided"] = result["InvestigationMethod"] if result is not None else "queued for LLM"
+            except Exception as e:
+                log(f"{tag}   EVIDENCE ERROR: {e}")
+                verdict = {"verdict": "UNKNOWN", "reason": f"Evidence error: {e}", "new_category": ""}
+                result, job = _result(row, verdict, "error", {}), None
+        if result is not None:
+            deliver(index, result)
+        elif batch_size > 1:
+            await batch_queue.put((index, job))
+        else:
+            # Blocks while the LLM stage is saturated — backpressure on evidence
+            await llm_queue.put([(index, job)])
+
+    async def batcher():
+        """Pack same-category jobs into batches; flush on size, category change or end of input."""
+        pending: list[tuple[int, dict]] = []
+        while True:
+            item = await batch_queue.get()
+            if item is not None and pending and item[1]["category"] != pending[0][1]["category"]:
+                await llm_queue.put(pending)
+                pending = []
+            if item is None:
+                if pending:
+                    await llm_queue.put(pending)
+                return
+            pending.append(item)
+            if len(pending) >= batch_size:
+                await llm_queue.put(pending)
+                pending = []
+
+    async def llm_worker():
+        if warmup is not None:
+            # Shielded: a worker cancelled at the budget must not cancel the shared warm-up
+            await asyncio.shield(warmup)
+        while True:
+            items = await llm_queue.get()
+            try:
+                if items is None:
+                    return
+                if len(items) == 1:
+                    index, job = items[0]
+                    with tracing.span("LLM stage", row=index + 1, category=job["category"]):
+                        result = await _llm_stage(job, cache)
+                    deliver(index, result)
+                else:
+                    with tracing.span("LLM batch stage", rows=len(items), category=items[0][1]["category"]):
+                        batch_results = await _llm_batch_stage([job for _, job in items], cache)
+                    for (index, _), result in zip(items, batch_results):
+                        deliver(index, result)
+            finally:
+                llm_queue.task_done()
+
+    async def run_pipeline():
+        await asyncio.gather(*(produce(i, staged[i]) for i in order))
+        if batch_task is not None:
+            await batch_queue.put(None)
+            await batch_task
+        for _ in workers:
+            await llm_queue.put(None)
+        await asyncio.gather(*workers)
+
+    workers = [asyncio.create_task(llm_worker()) for _ in range(max(1, LLM_CONCURRENCY))]
+    batch_task = asyncio.create_task(batcher()) if batch_size > 1 else None
+    if order is None:
+        order = list(range(total))
+    try:
+        await asyncio.wait_for(run_pipeline(), time_budget)
+    except asyncio.TimeoutError:
+        unfinished = sum(r is None for r in results)
+        log(f"\n[BUDGET] Time budget of {time_budget:.0f}s exhausted — deferring {unfinished} unfinished row(s).")
+        for i, r in enumerate(results):
+            if r is None:
+                results[i] = _deferred(staged[i])
+    finally:
+        for w in workers:
+            w.cancel()
+        if batch_task is not None:
+            batch_task.cancel()
+
+    # Positions must keep matching `staged`: main() zips results with the rows
+    assert all(r is not None for r in results), "investigation pipeline left a row without a result"
+    return results
+
+
 # ---------------------------------------------------------------------------
 # Main investigation loop
 # ---------------------------------------------------------------------------
 
+def log_prefill_summary(results: list[dict]):
+    """
+    Compare prefill on the first LLM call of each category against follow-up
+    calls in the same category — the gap is the prompt-prefix cache saving.
+    Also reports average decode time per call and the LLM UNKNOWN rate.
+    """
+    # One entry per call: batched rows share their call's stats, count it once
+    timed = [r for r in results if r.get("LLMPrefillMs") is not None and r.get("LLMBatchRow", 1) == 1]
+    if not timed:
+        return
+    seen: set[str] = set()
+    first, rest = [], []
+    for r in timed:
+        category = r.get("ErrorCategory", "OTHER")
+        (rest if category in seen else first).append(r)
+        seen.add(category)
+
+    def avg(rows: list[dict], col: str) -> float:
+        return sum(r[col] for r in rows) / len(rows) if rows else 0.0
+
+    log(f"  Prefill, first call per category: {avg(first, 'LLMPrefillMs'):.0f} ms avg "
+        f"({avg(first, 'LLMPromptTokens'):.0f} tok) over {len(first)} call(s)")
+    if rest:
+        log(f"  Prefill, follow-up calls:         {avg(rest, 'LLMPrefillMs'):.0f} ms avg "
+            f"({avg(rest, 'LLMPromptTokens'):.0f} tok) over {len(rest)} call(s)")
+    log(f"  Decode, per call:                 {avg(timed, 'LLMEvalMs'):.0f} ms avg "
+        f"({avg(timed, 'LLMEvalTokens'):.0f} tok)")
+    llm_rows = [r for r in results if r.get("InvestigationMethod") in ("llm", "llm-batch")]
+    unknown = sum(r.get("LLMVerdict") == "UNKNOWN" for r in llm_rows)
+    log(f"  LLM UNKNOWN rate:                 {unknown}/{len(llm_rows)} ({unknown / len(llm_rows):.0%})")
+
+
+def log_llm_accounting(results: list[dict]):
+    """Per category x model Ollama accounting, and cold model loads called out separately."""
+    accounting = llm_accounting(results)
+    if not accounting:
+        return
+    log("  LLM accounting (category / model: calls, prompt tok @ prefill tok/s, eval tok @ eval tok/s, load):")
+    for a in accounting:
+        log(f"    {a['category']:<18} {a['model']:<14} {a['calls']:>4} call(s)  "
+            f"{a['prompt_tokens']:>7} tok @ {_tok_per_s(a['prompt_tokens'], a['prefill_ms']):>6} tok/s  "
+            f"{a['eval_tokens']:>6} tok @ {_tok_per_s(a['eval_tokens'], a['eval_ms']):>5} tok/s  "
+            f"load {a['load_ms']:.0f} ms")
+    cold = sum(a["cold_loads"] for a in accounting)
+    if cold:
+        cold_ms = sum(c["load_ms"] or 0 for r in results for c in r.get("LLMCalls") or [] if c.get("cold"))
+        log(f"  COLD model loads: {cold} call(s), {cold_ms / 1000:.1f}s spent loading")
+
+
+def log_tier_summary(results: list[dict]):
+    """Cascade report: rows decided per model tier and average latency per tier."""
+    if not OLLAMA_ESCALATION_MODEL:
+        return
+    fast = [r["LLMFastMs"] for r in results if r.get("LLMFastMs") is not None and r.get("LLMBatchRow", 1) == 1]
+    strong = [r["LLMStrongMs"] for r in results if r.get("LLMStrongMs") is not None]
+    tiers = Counter(r.get("LLMTier") for r in results)
+    log(f"  Tier fast ({OLLAMA_MODEL}):   {tiers.get('fast', 0)} row(s), "
+        f"{sum(fast) / len(fast) if fast else 0:.0f} ms avg over {len(fast)} call(s)")
+    log(f"  Tier strong ({OLLAMA_ESCALATION_MODEL}): {tiers.get('strong', 0)} row(s), "
+        f"{sum(strong) / len(strong) if strong else 0:.0f} ms avg over {len(strong)} call(s)")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="LLM investigation of audit Staged Fixes rows.")
+    parser.add_argument("audit_path", nargs="?", help="Audit workbook (default: newest audit_*.xlsx)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the persistent LLM verdict cache")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip rows already journaled for this audit input")
+    parser.add_argument("--journal", help="Journal file (default: journals/<audit>_<sha>.jsonl)")
+    parser.add_argument("--render-journal", action="store_true",
+                        help="Write the workbook from the journal's current contents and exit")
+    parser.add_argument("--no-group", action="store_true",
+                        help="Process rows in Staged Fixes order instead of grouped by category")
+    parser.add_argument("--batch-size", type=int, default=1, metavar="K",
+                        help="Pack up to K same-category rows into one LLM call (default 1 = off)")
+    parser.add_argument("--free-text", action="store_true",
+                        help="Use the 3-line free-text verdict format instead of JSON-schema decoding")
+    parser.add_argument("--no-rules", action="store_true",
+                        help="Skip the compiled playbook RULES; every non-fast-path row goes to the LLM")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Don't preload the model at startup or unload it at shutdown")
+    parser.add_argument("--time-budget", type=_parse_duration, metavar="DURATION",
+                        help="Wall-time budget, e.g. 90s, 20m, 1.5h (bare number = minutes). "
+                             "Rows run highest priority first; unfinished rows are written as DEFERRED")
+    parser.add_argument("--trace", action="store_true", default=None,
+                        help="Write a Chrome/Perfetto trace of every stage, MCP and Ollama call to traces/ (or TRACE=1)")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="Also dump a cProfile of the whole run to traces/ (or TRACE_PROFILE=1)")
+    parser.add_argument("--priority", default=PRIORITY_WEIGHTS, metavar="WEIGHTS",
+                        help="Priority score weights for --time-budget, e.g. days=1,deficit=2,retry=5 "
+                             f"(default {PRIORITY_WEIGHTS})")
+    args = parser.parse_args(argv)
+    try:
+        args.priority = parse_priority(args.priority)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def _parse_duration(text: str) -> float:
+    """'90s' / '20m' / '1.5h' / '20' (minutes) -> seconds."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip().lower()
+    try:
+        if text and text[-1] in units:
+            return float(text[:-1]) * units[text[-1]]
+        return float(text) * 60
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid duration {text!r} (use e.g. 90s, 20m, 1.5h)") from None
+
+
+def _output_filename() -> str:
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(project_dir, f"investigation_{timestamp}.xlsx")
+
+
+def render_journal(journal_path: str) -> str | None:
+    """
+    Build an investigation workbook from a journal. Rows are ordered like the
+    audit's Staged Fixes tab when that workbook is still on disk, otherwise in
+    completion order. Returns the output filename, or None if nothing to render.
+    """
+    header, completed = load_journal(journal_path)
+    if not completed:
+        log(f"[JOURNAL] {journal_path} has no finished rows.")
+        return None
+
+    results = list(completed.values())
+    audit_path = header.get("audit_path")
+    if audit_path and os.path.isfile(audit_path):
+        keys = row_keys(read_staged_fixes(audit_path))
+        ordered = [completed[k] for k in keys if k in completed]
+        if len(ordered) == len(completed):
+            results = ordered
+    log(f"[JOURNAL] Rendering {len(results)} journaled row(s) from {journal_path}")
+
+    filename = _output_filename()
+    write_investigation_excel(results, filename)
+    return filename
+
+
+def record_history(filename: str, results: list[dict], audit_path: str):
+    """Add this run to the history store (history.py); a failure there doesn't fail the run."""
+    try:
+        store = HistoryStore()
+        try:
+            run_id = store.record_run("investigation", filename, results, audit_path=audit_path)
+        finally:
+            store.close()
+        log(f"[HISTORY] Recorded as run {run_id} in {store.path}")
+    except Exception as e:
+        log(f"[HISTORY] Not recorded: {e}")
+
+
+async def _warm_up():
+    """Load OLLAMA_MODEL on every backend and report how long each load took."""
+    start = time.perf_counter()
+    try:
+        loaded = await warm_up()
+    except Exception as e:
+        log(f"[WARMUP] FAILED: {e} — the first LLM call will load the model")
+        return
+    for r in loaded:
+        if r["ok"]:
+            log(f"[WARMUP] {r['model']} resident on {r['backend']} "
+                f"(num_ctx {OLLAMA_NUM_CTX}, load {r['load_ms']:.0f} ms)")
+        else:
+            log(f"[WARMUP] {r['model']} on {r['backend']} FAILED: {r['error']}")
+    log(f"[WARMUP] Done in {time.perf_counter() - start:.1f}s")
+
+
 async def main():
+    global STRUCTURED_OUTPUT, PLAYBOOK_RULES
+    args = parse_args()
+    STRUCTURED_OUTPUT = not args.free_text
+    PLAYBOOK_RULES = not args.no_rules
     log("=== LLM Investigation Layer (Phase 4) ===\n")
 
+    if PLAYBOOK_RULES:
+        try:
+            compiled = compile_all()
+        except PlaybookRuleError as e:
+            log(f"[ERROR] Playbook rules don't compile: {e}")
+            return
+        steps = [rule for rules in compiled.values() for rule in rules]
+        judgment = sum(rule["verdict"] == "JUDGMENT" for rule in steps)
+        log(f"[PLAYBOOK] {sum(bool(r) for r in compiled.values())} playbook(s) compiled: "
+            f"{len(steps)} step(s), {judgment} marked JUDGMENT\n")
+    if LEARNED_RULES:
+        log(f"[LEARNED] {sum(len(r) for r in LEARNED_RULES.values())} learned fast-path rule(s) "
+            f"for {len(LEARNED_RULES)} category(ies)\n")
+
     # Find audit file
-    explicit = sys.argv[1] if len(sys.argv) > 1 else None
+    explicit = args.audit_path
     try:
         audit_path = find_latest_audit(explicit)
     except FileNotFoundError as e:
-        log(f"[ERROR] {e}")
+        if not (args.render_journal and args.journal):
+            log(f"[ERROR] {e}")
+            return
+        audit_path = None
+
+    if args.render_journal:
+        journal_path = args.journal or journal_path_for(audit_path, audit_fingerprint(audit_path))
+        if not os.path.isfile(journal_path):
+            log(f"[ERROR] No journal at {journal_path}")
+            return
+        render_journal(journal_path)
         return
+
     log(f"[INPUT] Reading: {audit_path}")
 
     # Read staged fixes
@@ -257,109 +1147,139 @@ async def main():
         log("[INFO] No staged fixes to investigate.")
         return
 
-    # Connectivity check
-    log("Step 0: Testing MCP server connectivity...")
-    try:
-        raw = await mcp_client.call_tool("execute_query", {"query": "SELECT 1 AS ping", "database": "Inventory"})
-        log("  MCP server is reachable.\n")
-    except Exception as e:
-        log(f"[ERROR] MCP server unreachable: {e}")
-        return
-
-    # --- Investigation loop ---
-    results = []
-    fast_path_count = 0
-    llm_count = 0
-    no_playbook_count = 0
-
+    # Checkpoint journal — resume skips rows already finished for this audit input
+    audit_sha = audit_fingerprint(audit_path)
+    journal_path = args.journal or journal_path_for(audit_path, audit_sha)
+    journal = RunJournal(journal_path, audit_path, audit_sha, resume=args.resume)
+    keys = row_keys(staged)
+    pending = [i for i, k in enumerate(keys) if k not in journal.completed]
+    log(f"[JOURNAL] {journal_path}")
+    if args.resume:
+        log(f"[JOURNAL] Resuming: {len(staged) - len(pending)} row(s) already done, "
+            f"{len(pending)} to go.\n")
+
+    cache = None if args.no_cache else VerdictCache()
+    if cache is not None:
+        log(f"[CACHE] {len(cache)} cached verdict(s) in {cache.path}")
+
+    def checkpoint(index: int, result: dict):
+        if is_final(result):
+            journal.append(keys[pending[index]], result)
+
+    warmup = None
     try:
-        for i, row in enumerate(staged, 1):
-            category = row.get("ErrorCategory", "OTHER")
-            part = row.get("PartNumber", "?")
-            location = row.get("Location", "?")
-            log(f"[{i}/{len(staged)}] {category} — Part={part} Location={location}")
-
-            # 1. Gather evidence (parallel SQL queries)
-            evidence = await gather_evidence(row, category)
-            evidence_labels = [f"{k}({len(v)})" for k, v in evidence.items()]
-            log(f"  Evidence: {', '.join(evidence_labels)}")
-
-            # 2. Check fast-path
-            fast_result = check_fast_path(category, evidence, row)
-            if fast_result:
-                log(f"  FAST-PATH: {fast_result['verdict']} — {fast_result['reason']}")
-                fast_path_count += 1
-                results.append({
-                    **row,
-                    "LLMVerdict": fast_result["verdict"],
-                    "LLMReason": fast_result["reason"],
-                    "LLMNewCategory": fast_result.get("new_category", ""),
-                    "InvestigationMethod": "fast-path",
-                })
-                continue
-
-            # 3. Load playbook
-            playbook = load_playbook(category)
-            if not playbook:
-                log(f"  NO PLAYBOOK for {category} — marking UNKNOWN")
-                no_playbook_count += 1
-                results.append({
-                    **row,
-                    "LLMVerdict": "UNKNOWN",
-                    "LLMReason": f"No playbook for category {category}",
-                    "LLMNewCategory": "",
-                    "InvestigationMethod": "no-playbook",
-                })
-                continue
-
-            # 4. Format evidence packet
-            evidence_text = format_evidence(row, evidence)
-
-            # 5. Call LLM — single turn, playbook + evidence
-            user_prompt = f"{playbook}\n\n---\n\n{evidence_text}"
-            log(f"  Calling LLM ({len(user_prompt)} chars)...")
+        if pending:
+            if OLLAMA_WARMUP and not args.no_warmup:
+                # Loads the model while the MCP check and evidence gathering run
+                warmup = asyncio.create_task(_warm_up())
 
+            # Connectivity check
+            log("Step 0: Testing MCP server connectivity...")
             try:
-                raw_output = await call_llm_single_turn(SYSTEM_PROMPT, user_prompt)
-                verdict = parse_verdict(raw_output)
-                log(f"  LLM: {verdict['verdict']} — {verdict['reason']}")
-                llm_count += 1
+                with tracing.span("connectivity ping"):
+                    await mcp_client.call_tool("execute_query", {"query": "SELECT 1 AS ping", "database": "Inventory"})
+                log("  MCP server is reachable.\n")
             except Exception as e:
-                log(f"  LLM ERROR: {e}")
-                verdict = {"verdict": "UNKNOWN", "reason": f"LLM error: {e}", "new_category": ""}
-                llm_count += 1
-
-            results.append({
-                **row,
-                "LLMVerdict": verdict["verdict"],
-                "LLMReason": verdict["reason"],
-                "LLMNewCategory": verdict.get("new_category", ""),
-                "InvestigationMethod": "llm",
-            })
+                log(f"[ERROR] MCP server unreachable: {e}")
+                return
+
+            log("Step 0b: Checking Ollama backends...")
+            health = await get_pool().check_health()
+            for backend, ok in health.items():
+                log(f"  {backend}: {'up' if ok else 'DOWN'}")
+            if not any(health.values()):
+                log("[WARN] No Ollama backend answered; LLM rows will fail over and retry on each call.")
+            log("")
+
+            # --- Investigation pipeline ---
+            log(f"Pipeline: evidence concurrency={EVIDENCE_CONCURRENCY}, "
+                f"LLM concurrency={LLM_CONCURRENCY}, batch size={args.batch_size}, "
+                f"model={_model_route()}, "
+                f"verdict format={'json-schema' if STRUCTURED_OUTPUT else 'free-text'}\n")
+            todo = [staged[i] for i in pending]
+            if args.time_budget:
+                order = schedule_by_priority(todo, args.priority)
+                weights = ", ".join(f"{col}×{w:g}" for col, w in args.priority.items())
+                log(f"[BUDGET] {args.time_budget:.0f}s budget; rows ordered by priority ({weights})\n")
+            else:
+                order = None if args.no_group else schedule_by_category(todo)
+            fresh = await investigate_rows(todo, cache, on_result=checkpoint, order=order,
+                                           batch_size=args.batch_size, time_budget=args.time_budget,
+                                           warmup=warmup)
+            for i, result in zip(pending, fresh):
+                journal.completed.setdefault(keys[i], result)
+
+        results = [journal.completed[k] for k in keys]
 
         # --- Summary ---
+        method_counts = Counter(r["InvestigationMethod"] for r in results)
         log(f"\n{'='*50}")
         log(f"Investigation complete: {len(results)} row(s)")
-        log(f"  Fast-path confirmed: {fast_path_count}")
-        log(f"  LLM investigated:    {llm_count}")
-        log(f"  No playbook:         {no_playbook_count}")
+        if args.resume:
+            log(f"  Resumed from journal: {len(staged) - len(pending)}")
+        log(f"  Fast-path confirmed: {method_counts.get('fast-path', 0)}")
+        log(f"  Playbook rules:      {method_counts.get('playbook', 0)}")
+        if LEARNED_RULES:
+            log(f"  Learned rules:       {method_counts.get('learned-rule', 0)}")
+        log(f"  LLM investigated:    {method_counts.get('llm', 0)}")
+        if args.batch_size > 1:
+            log(f"  LLM batched:         {method_counts.get('llm-batch', 0)}")
+        if cache is not None:
+            lookups = cache.hits + cache.misses
+            rate = f"{cache.hits / lookups:.0%}" if lookups else "n/a"
+            log(f"  LLM cache hits:      {cache.hits}/{lookups} ({rate})")
+        log(f"  No playbook:         {method_counts.get('no-playbook', 0)}")
+        if method_counts.get("error"):
+            log(f"  Evidence errors:     {method_counts['error']}")
+        if method_counts.get("deferred"):
+            log(f"  Deferred (budget):   {method_counts['deferred']} — rerun with --resume to finish them")
+        log(f"  Evidence queries:    {sum(r.get('EvidenceQueries') or 0 for r in results)}")
+        log("  Decided by:          " + ", ".join(
+            f"{label} {count}/{len(results)} ({count / len(results):.0%})" for label, count in decided_by(results)
+        ))
 
         verdict_counts = Counter(r["LLMVerdict"] for r in results)
-        for v in ("CONFIRM", "ESCALATE", "RECLASSIFY", "UNKNOWN"):
+        for v in ("CONFIRM", "ESCALATE", "RECLASSIFY", "UNKNOWN", "DEFERRED"):
             log(f"  {v}: {verdict_counts.get(v, 0)}")
+        log_prefill_summary(results)
+        log_llm_accounting(results)
+        log_tier_summary(results)
+        for b in get_pool().stats():
+            if b["calls"]:
+                log(f"  Backend {b['backend']}: {b['calls']} call(s), {b['failures']} failure(s)")
         log(f"{'='*50}")
 
         # --- Write Excel ---
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        project_dir = os.path.dirname(os.path.abspath(__file__))
-        filename = os.path.join(project_dir, f"investigation_{timestamp}.xlsx")
-        write_investigation_excel(results, filename)
+        output = _output_filename()
+        with tracing.span("write workbook", rows=len(results)):
+            write_investigation_excel(results, output)
+        with tracing.span("record history", rows=len(results)):
+            record_history(output, results, audit_path)
+
+    except asyncio.CancelledError:
+        log(f"\n[JOURNAL] Interrupted — {len(journal.completed)} finished row(s) saved. "
+            f"Rerun with --resume to continue.")
+        raise
 
     finally:
+        journal.close()
+        if cache is not None:
+            cache.close()
+        if warmup is not None:
+            warmup.cancel()
+            for r in await release_models():
+                log(f"[WARMUP] Released {r['model']} on {r['backend']}"
+                    + ("" if r["ok"] else f" — FAILED: {r['error']}"))
+        await close_pool()
         log("\n[MCP] Closing server connection...")
         await mcp_client.close_session()
         log("[MCP] Connection closed.")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli = parse_args()
+    tracing.start("investigate", cli.trace, cli.profile)
+    try:
+        asyncio.run(main())
+    finally:
+        tracing.stop(log)
@@ -0,0 +1,146 @@
+"""
+journal.py — Crash-safe checkpoint journal for investigate.py runs.
+
+Append-only JSONL. The first line is a header identifying the audit input
+(workbook path + SHA-256 of its bytes); every following line is one finished
+investigation row, flushed and fsync'd as soon as the row completes. A crash,
+Ctrl-C or Ollama restart loses at most the rows that were in flight.
+
+`investigate.py --resume` reloads the journal for the same audit input and
+skips rows already recorded; `--render-journal` builds the workbook from
+whatever the journal holds at that moment.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+JOURNAL_DIR = os.getenv("INVESTIGATION_JOURNAL_DIR", os.path.join(PROJECT_DIR, "journals"))
+
+
+def audit_fingerprint(path: str) -> str:
+    """SHA-256 of the audit workbook bytes — identifies 'the same audit input'."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def journal_path_for(audit_path: str, audit_sha: str) -> str:
+    """Default journal location for an audit input: journals/<audit stem>_<sha12>.jsonl."""
+    stem = os.path.splitext(os.path.basename(audit_path))[0]
+    return os.path.join(JOURNAL_DIR, f"{stem}_{audit_sha[:12]}.jsonl")
+
+
+def row_keys(rows: list[dict]) -> list[str]:
+    """
+    Stable identity for each staged row: PartLineID|PartNumber|Location|IntegrationID.
+    Repeats of the same identity get a #n suffix so every key is unique.
+    """
+    seen: dict[str, int] = {}
+    keys = []
+    for row in rows:
+        base = "|".join(
+            str(row.get(c) or "") for c in ("PartLineID", "PartNumber", "Location", "IntegrationID")
+        )
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        keys.append(base if n == 0 else f"{base}#{n}")
+    return keys
+
+
+def load_journal(path: str) -> tuple[dict, dict[str, dict]]:
+    """
+    Read a journal file. Returns (header, {row_key: result}).
+    A truncated final line (crash mid-write) is ignored.
+    """
+    header: dict = {}
+    completed: dict[str, dict] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("type") == "header":
+                header = record
+            elif record.get("type") == "row":
+                completed[record["key"]] = record["result"]
+    return header, completed
+
+
+def _truncate_partial_line(path: str):
+    """
+    Cut a record left half-written by a crash, so the next append starts on
+    its own line instead of being glued onto the fragment (and lost with it).
+    """
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        end = 0
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                end = pos + i + 1
+                break
+        f.truncate(end)
+
+
+class RunJournal:
+    """
+    Append-only journal for one investigation run.
+
+    With resume=True an existing journal for the same audit fingerprint is
+    loaded into `completed` and appended to. Otherwise any existing journal at
+    `path` is rotated aside (never deleted) and a fresh one is started.
+    """
+
+    def __init__(self, path: str, audit_path: str, audit_sha: str, resume: bool = False):
+        self.path = path
+        self.completed: dict[str, dict] = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        if os.path.isfile(path):
+            header, completed = load_journal(path)
+            if resume and header.get("audit_sha256") == audit_sha:
+                self.completed = completed
+                _truncate_partial_line(path)
+                self._f = open(path, "a", encoding="utf-8")
+                return
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            os.replace(path, f"{os.path.splitext(path)[0]}.{stamp}.jsonl")
+
+        self._f = open(path, "w", encoding="utf-8")
+        self._write({
+            "type": "header",
+            "audit_path": os.path.abspath(audit_path),
+            "audit_sha256": audit_sha,
+            "started": datetime.now().isoformat(timespec="seconds"),
+        })
+
+    def _write(self, record: dict):
+        self._f.write(json.dumps(record, default=str) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def append(self, key: str, result: dict):
+        """Record one finished row durably."""
+        self.completed[key] = result
+        self._write({"type": "row", "key": key, "result": result})
+
+    def close(self):
+        self._f.close()
@@ -0,0 +1,292 @@
+"""
+learn_rules.py — Learn new fast-path rules offline from past LLM verdicts.
+
+Every LLM-decided row is journaled with its EvidenceFeatures (evidence.py
+evidence_features) next to the verdict. This tool collects those
+(features, verdict) pairs from journals/*.jsonl, fits a short ordered rule list
+per category by sequential covering (each rule a conjunction of up to
+--max-conditions threshold tests), and scores every rule on held-out rows. Rows
+are split by row identity, so the same part/location never lands on both sides.
+
+The list is first-match, so each later rule was fit and scored only on rows
+the earlier ones didn't cover. Rules are therefore exported as a prefix: every
+rule up to (not including) the first whose held-out precision or support misses
+the bar goes to learned_rules.json. evidence.py loads it at startup, and check_fast_path applies
+the rules after the hand-written and playbook rules. Delete the file (or set
+LEARNED_RULES_PATH=) to switch them off.
+
+Usage:
+    python learn_rules.py
+    python learn_rules.py journals/*.jsonl --min-precision 0.97 --holdout 0.3
+    python learn_rules.py --dry-run
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from evidence import LEARNED_RULES_PATH, describe_conditions
+from journal import JOURNAL_DIR, load_journal
+from llm_utils import VERDICTS
+
+LLM_METHODS = ("llm", "llm-batch", "llm-cache")
+MAX_THRESHOLDS = 12
+
+
+def log(msg: str):
+    print(msg.encode("ascii", "replace").decode("ascii"), flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Training data
+# ---------------------------------------------------------------------------
+
+def _label(result: dict) -> str:
+    verdict = result["LLMVerdict"]
+    return f"RECLASSIFY:{result.get('LLMNewCategory', '')}" if verdict == "RECLASSIFY" else verdict
+
+
+def collect_examples(paths: list[str]) -> list[dict]:
+    """
+    (features, verdict) pairs from journaled LLM rows. Rows decided by rules,
+    UNKNOWN verdicts and rows journaled before features were recorded are
+    skipped; identical repeats (same row, same evidence, same verdict) count once.
+    """
+    examples, seen = [], set()
+    for path in paths:
+        _, completed = load_journal(path)
+        for key, result in completed.items():
+            features = result.get("EvidenceFeatures")
+            if (result.get("InvestigationMethod") not in LLM_METHODS
+                    or result.get("LLMVerdict") not in VERDICTS or not features):
+                continue
+            label = _label(result)
+            fingerprint = (key, json.dumps(features, sort_keys=True), label)
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            examples.append({
+                "key": key.split("#")[0],
+                "category": result.get("ErrorCategory", "OTHER"),
+                "features": features,
+                "label": label,
+            })
+    return examples
+
+
+def is_holdout(key: str, fraction: float) -> bool:
+    """Deterministic split by row identity."""
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF < fraction
+
+
+# ---------------------------------------------------------------------------
+# Sequential covering
+# ---------------------------------------------------------------------------
+
+def _holds(condition: tuple, features: dict) -> bool:
+    feature, op, value = condition
+    if feature not in features:
+        return False
+    return features[feature] <= value if op == "<=" else features[feature] > value
+
+
+def candidate_conditions(examples: list[dict], min_support: int) -> list[tuple]:
+    """Threshold tests at midpoints between observed values of every feature seen often enough."""
+    values: dict[str, set[float]] = {}
+    for e in examples:
+        for feature, value in e["features"].items():
+            values.setdefault(feature, set()).add(value)
+    present = Counter(f for e in examples for f in e["features"])
+
+    conditions = []
+    for feature, seen in sorted(values.items()):
+        if present[feature] < min_support or len(seen) < 2:
+            continue
+        ordered = sorted(seen)
+        cuts = [(a + b) / 2 for a, b in zip(ordered, ordered[1:])]
+        if len(cuts) > MAX_THRESHOLDS:
+            step = len(cuts) / MAX_THRESHOLDS
+            cuts = [cuts[int(i * step)] for i in range(MAX_THRESHOLDS)]
+        for cut in cuts:
+            conditions.append((feature, "<=", round(cut, 4)))
+            conditions.append((feature, ">", round(cut, 4)))
+    return conditions
+
+
+def _laplace(pos: int, total: int) -> float:
+    return (pos + 1) / (total + 2)
+
+
+def grow_rule(examples: list[dict], label: str, candidates: list[tuple],
+              min_support: int, max_conditions: int) -> tuple[list[tuple], list[dict]]:
+    """Greedily add the condition that most improves Laplace precision for `label`."""
+    rule: list[tuple] = []
+    covered = examples
+    score = _laplace(sum(e["label"] == label for e in covered), len(covered))
+    while len(rule) < max_conditions:
+        best = None
+        for cond in candidates:
+            if cond in rule:
+                continue
+            subset = [e for e in covered if _holds(cond, e["features"])]
+            pos = sum(e["label"] == label for e in subset)
+            if pos < min_support:
+                continue
+            key = (_laplace(pos, len(subset)), pos)
+            if best is None or key > best[0]:
+                best = (key, cond, subset)
+        if best is None or best[0][0] <= score:
+            break
+        score = best[0][0]
+        rule.append(best[1])
+        covered = best[2]
+        if all(e["label"] == label for e in covered):
+            break
+    return rule, covered
+
+
+def fit_rule_list(examples: list[dict], min_precision: float, min_support: int,
+                  max_rules: int, max_conditions: int) -> list[dict]:
+    """
+    Ordered rule list: repeatedly grow the best rule over all labels, keep it
+    if its training precision clears min_precision, and remove what it covers.
+    """
+    candidates = candidate_conditions(examples, min_support)
+    remaining = list(examples)
+    rules = []
+    while remaining and len(rules) < max_rules:
+        best = None
+        for label in Counter(e["label"] for e in remaining):
+            conditions, covered = grow_rule(remaining, label, candidates, min_support, max_conditions)
+            if not conditions:
+                continue
+            pos = sum(e["label"] == label for e in covered)
+            key = (_laplace(pos, len(covered)), pos)
+            if best is None or key > best[0]:
+                best = (key, label, conditions, covered, pos)
+        if best is None:
+            break
+        _, label, conditions, covered, pos = best
+        if pos / len(covered) < min_precision:
+            break
+        rules.append({
+            "conditions": [list(c) for c in conditions],
+            "label": label,
+            "train_precision": round(pos / len(covered), 4),
+            "train_support": len(covered),
+        })
+        covered_ids = {id(e) for e in covered}
+        remaining = [e for e in remaining if id(e) not in covered_ids]
+    return rules
+
+
+def score_holdout(rules: list[dict], examples: list[dict]):
+    """Held-out precision/support per rule, with first-match rule-list semantics."""
+    for rule in rules:
+        rule["holdout_hits"] = rule["holdout_support"] = 0
+    for e in examples:
+        for rule in rules:
+            if all(_holds(tuple(c), e["features"]) for c in rule["conditions"]):
+                rule["holdout_support"] += 1
+                rule["holdout_hits"] += e["label"] == rule["label"]
+                break
+    for rule in rules:
+        n = rule["holdout_support"]
+        rule["holdout_precision"] = round(rule["holdout_hits"] / n, 4) if n else 0.0
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Learn fast-path rules from journaled LLM verdicts.")
+    parser.add_argument("journals", nargs="*", help=f"Journal files (default: {JOURNAL_DIR}/*.jsonl)")
+    parser.add_argument("--out", default=LEARNED_RULES_PATH, help="Exported rules file (default: %(default)s)")
+    parser.add_argument("--holdout", type=float, default=0.25, help="Held-out fraction (default 0.25)")
+    parser.add_argument("--min-precision", type=float, default=0.95,
+                        help="Min precision, on training and held-out rows, to keep/export a rule (default 0.95)")
+    parser.add_argument("--min-support", type=int, default=5, help="Min training rows a rule must cover (default 5)")
+    parser.add_argument("--min-holdout-support", type=int, default=3,
+                        help="Min held-out rows a rule must fire on to be exported (default 3)")
+    parser.add_argument("--max-rules", type=int, default=5, help="Max rules per category (default 5)")
+    parser.add_argument("--max-conditions", type=int, default=3, help="Max conditions per rule (default 3)")
+    parser.add_argument("--dry-run", action="store_true", help="Report only; don't write the rules file")
+    args = parser.parse_args()
+
+    paths = args.journals or sorted(glob.glob(os.path.join(JOURNAL_DIR, "*.jsonl")))
+    examples = collect_examples(paths)
+    log(f"[LEARN] {len(examples)} LLM verdict(s) with evidence features from {len(paths)} journal(s)")
+    if not examples:
+        log("[LEARN] Nothing to learn from — run investigate.py first.")
+        return
+
+    exported = []
+    total_test = total_avoided = 0
+    by_category: dict[str, list[dict]] = {}
+    for e in examples:
+        by_category.setdefault(e["category"], []).append(e)
+
+    for category, rows in sorted(by_category.items()):
+        train = [e for e in rows if not is_holdout(e["key"], args.holdout)]
+        test = [e for e in rows if is_holdout(e["key"], args.holdout)]
+        labels = Counter(e["label"] for e in rows)
+        log(f"\n=== {category}: {len(train)} train / {len(test)} held-out — "
+            + ", ".join(f"{k}={v}" for k, v in labels.most_common()))
+
+        rules = fit_rule_list(train, args.min_precision, args.min_support, args.max_rules, args.max_conditions)
+        score_holdout(rules, test)
+        if not rules:
+            log("  No rule reaches the precision bar.")
+        total_test += len(test)
+        # Later rules were only fit/scored on rows earlier rules left over, so
+        # everything after the first skipped rule is skipped too
+        cut = False
+        for n, rule in enumerate(rules, 1):
+            passes = (rule["holdout_support"] >= args.min_holdout_support
+                      and rule["holdout_precision"] >= args.min_precision)
+            keep = passes and not cut
+            cut = cut or not passes
+            outcome = "EXPORT" if keep else "skip" if not passes else "skip (follows a skipped rule)"
+            log(f"  {n}. IF {describe_conditions(rule['conditions'])} THEN {rule['label']}")
+            log(f"     train {rule['train_precision']:.0%} (n={rule['train_support']}), "
+                f"held-out {rule['holdout_precision']:.0%} (n={rule['holdout_support']}) "
+                f"-> {outcome}")
+            if not keep:
+                continue
+            total_avoided += rule["holdout_support"]
+            verdict, _, new_category = rule["label"].partition(":")
+            exported.append({
+                "category": category,
+                "conditions": rule["conditions"],
+                "verdict": verdict,
+                "new_category": new_category,
+                "precision": rule["holdout_precision"],
+                "support": rule["holdout_support"],
+                "train_precision": rule["train_precision"],
+                "train_support": rule["train_support"],
+            })
+
+    log(f"\n{'='*50}")
+    log(f"Exportable rules:     {len(exported)}")
+    if total_test:
+        log(f"Held-out LLM rows they decide: {total_avoided}/{total_test} ({total_avoided / total_test:.0%})")
+    if args.dry_run:
+        log("[LEARN] --dry-run: rules file not written.")
+        return
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "journals": [os.path.basename(p) for p in paths],
+            "min_precision": args.min_precision,
+            "rules": exported,
+        }, f, indent=2)
+    log(f"[LEARN] Wrote {len(exported)} rule(s) -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+llm_cache.py — Persistent LLM verdict cache for the investigation layer.
+
+Identical evidence packets recur constantly (same part/location on several
+tickets, nightly reruns where nothing changed). Each parsed verdict is stored in
+a local SQLite file keyed by a hash of everything that determines the model's
+answer: system prompt, playbook text, evidence text, model name and model
+options. Entries expire after LLM_CACHE_TTL_HOURS; the store is trimmed to
+LLM_CACHE_MAX_ENTRIES, least recently used first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(PROJECT_DIR, ".cache", "llm_verdicts.sqlite"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+def cache_key(system: str, playbook: str, evidence_text: str, model: str, options: dict | None) -> str:
+    """SHA-256 over the prompt parts, model name and (sorted) model options."""
+    payload = json.dumps(
+        {
+            "system": system,
+            "playbook": playbook,
+            "evidence": evidence_text,
+            "model": model,
+            "options": options or {},
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    SQLite-backed verdict cache with TTL expiry and LRU size bound.
+    Tracks hits/misses for the lifetime of the object.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH,
+                 ttl_hours: float = LLM_CACHE_TTL_HOURS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "  key TEXT PRIMARY KEY,"
+            "  verdict TEXT NOT NULL,"
+            "  model TEXT,"
+            "  created REAL NOT NULL,"
+            "  last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_verdicts_last_used ON verdicts(last_used)")
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached verdict dict for key, or None on miss/expiry."""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT verdict, created FROM verdicts WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self._conn.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, verdict: dict, model: str = ""):
+        """Store a verdict and trim the table back to max_entries."""
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, verdict, model, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(verdict), model, now, now),
+        )
+        self._conn.execute(
+            "DELETE FROM verdicts WHERE key IN ("
+            "  SELECT key FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,),
+        )
+        self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete entries older than the TTL. Returns the number removed."""
+        cutoff = time.time() - self.ttl_seconds
+        cur = self._conn.execute("DELETE FROM verdicts WHERE created < ?", (cutoff,))
+        self._conn.commit()
+        return cur.rowcount
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,349 @@
+"""
+llm_pool.py — Pooled, load-balanced Ollama clients across one or more backends.
+
+Each backend is an Ollama host, optionally pinned to one model, with a weight
+(its number of parallel request slots). One ollama.AsyncClient is kept per
+backend for the life of the process, so HTTP connections are reused instead of
+being rebuilt on every call.
+
+Requests go to the healthy backend with the lowest outstanding-requests/weight
+ratio. A failed call marks its backend down for OLLAMA_FAIL_COOLDOWN seconds and
+is retried on the next backend; after the cooldown the backend is tried again.
+LLM_CALL_TIMEOUT is one deadline per call, failovers included: an attempt that
+outlives it counts as failed, and later backends only get the time that is
+left, so a stalled generation can't block the caller forever. chat_stream()
+streams a call the same way: it fails over until the first chunk arrives, and
+the deadline also covers the wait for every later chunk. check_health()
+probes every backend (GET /api/tags) on demand. warm() loads a model on every
+backend serving it ahead of the first real call, and release() unloads it
+again (keep_alive=0).
+
+Configure with OLLAMA_BACKENDS, a comma-separated list of url[|model][|weight]:
+    OLLAMA_BACKENDS=http://localhost:11434||2,http://ws-07:11434|phi4-mini|1
+Without it the pool holds one backend: OLLAMA_BASE_URL with weight
+OLLAMA_NUM_PARALLEL (default 1).
+"""
+
+import asyncio
+import os
+import time
+
+import ollama
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_BACKENDS = os.getenv("OLLAMA_BACKENDS", "")
+OLLAMA_FAIL_COOLDOWN = float(os.getenv("OLLAMA_FAIL_COOLDOWN", "60"))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "5"))
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "300"))
+
+
+class Backend:
+    """One Ollama host (optionally pinned to a model) with load and health state."""
+
+    def __init__(self, host: str, model: str | None = None, weight: int = 1):
+        self.host = host.rstrip("/")
+        self.model = model or None
+        self.weight = max(1, weight)
+        self.outstanding = 0
+        self.calls = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.last_error = ""
+        self._client: ollama.AsyncClient | None = None
+
+    @property
+    def client(self) -> ollama.AsyncClient:
+        # Created lazily so it binds to the running event loop's transport
+        if self._client is None:
+            self._client = ollama.AsyncClient(host=self.host)
+        return self._client
+
+    @property
+    def label(self) -> str:
+        return f"{self.host}|{self.model}" if self.model else self.host
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def serves(self, model: str | None) -> bool:
+        return model is None or self.model is None or self.model == model
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def mark_down(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)[:200]
+        self.down_until = time.monotonic() + OLLAMA_FAIL_COOLDOWN
+
+    def mark_up(self):
+        self.down_until = 0.0
+
+    async def close(self):
+        if self._client is not None:
+            close = getattr(self._client, "close", None)
+            if close is not None:
+                await close()
+            self._client = None
+
+
+def parse_backends(spec: str) -> list[Backend]:
+    """Parse 'url[|model][|weight],...' into Backends. Empty spec -> []."""
+    backends = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        parts = entry.split("|")
+        host = parts[0].strip()
+        model = parts[1].strip() if len(parts) > 1 else ""
+        weight = int(parts[2]) if len(parts) > 2 and parts[2].strip() else 1
+        backends.append(Backend(host, model or None, weight))
+    return backends
+
+
+class LLMPool:
+    """Weighted least-outstanding load balancer with failover over Backends."""
+
+    def __init__(self, backends: list[Backend]):
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = backends
+        self._rr = 0
+
+    def total_weight(self, model: str | None = None) -> int:
+        return sum(b.weight for b in self.backends if b.serves(model))
+
+    def _candidates(self, model: str | None) -> list[Backend]:
+        """Backends serving model, healthy ones first by load, then downed ones by cooldown expiry."""
+        now = time.monotonic()
+        serving = [b for b in self.backends if b.serves(model)]
+        if not serving:
+            raise RuntimeError(f"No Ollama backend configured for model {model!r}")
+        # Rotate the start point so equal-load backends take turns
+        self._rr = (self._rr + 1) % len(serving)
+        rotated = serving[self._rr:] + serving[:self._rr]
+        up = sorted((b for b in rotated if b.available(now)), key=lambda b: b.load())
+        down = sorted((b for b in rotated if not b.available(now)), key=lambda b: b.down_until)
+        return up + down
+
+    def pick(self, model: str | None = None) -> Backend:
+        """Least-loaded healthy backend for model (no outstanding tracking — see chat() / chat_stream())."""
+        return self._candidates(model)[0]
+
+    async def chat(self, model: str, **kwargs):
+        """
+        client.chat(model=..., **kwargs) on the least-loaded backend serving
+        model, failing over to the next backend on any error. LLM_CALL_TIMEOUT
+        (0 disables it) bounds the whole call, failovers included. Returns
+        (response, backend). Raises the last error if every backend fails or
+        the deadline passes. A backend pinned to a model always runs its own model.
+        """
+        last_error: Exception | None = None
+        deadline = time.monotonic() + LLM_CALL_TIMEOUT if LLM_CALL_TIMEOUT else None
+        for backend in self._candidates(model):
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                raise last_error or TimeoutError(f"No Ollama answer within {LLM_CALL_TIMEOUT:.0f}s")
+            backend.outstanding += 1
+            backend.calls += 1
+            try:
+                with tracing.span("ollama chat", "llm", backend=backend.host, model=backend.model or model,
+                                  outstanding=backend.outstanding) as s:
+                    response = await asyncio.wait_for(
+                        backend.client.chat(model=backend.model or model, **kwargs), remaining,
+                    )
+                    s["prompt_tokens"] = response.prompt_eval_count
+                    s["eval_tokens"] = response.eval_count
+            except asyncio.TimeoutError:
+                e = TimeoutError(f"{backend.host} did not answer within the {LLM_CALL_TIMEOUT:.0f}s call deadline")
+                backend.mark_down(e)
+                last_error = e
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                backend.mark_down(e)
+                last_error = e
+                continue
+            finally:
+                backend.outstanding -= 1
+            backend.mark_up()
+            return response, backend
+        raise last_error or RuntimeError("No Ollama backend available")
+
+    async def chat_stream(self, model: str, prefer: Backend | None = None, **kwargs):
+        """
+        Streaming chat(): an async generator of response chunks from
+        client.chat(model=..., stream=True, **kwargs). Until the first chunk
+        arrives an error or the deadline fails over to the next backend; after
+        that the stream stays on its backend and an error is raised. The
+        LLM_CALL_TIMEOUT deadline covers the whole stream, failovers included.
+        `prefer` is tried first while it is healthy (to reuse its KV cache).
+        Callers that stop early must aclose() the generator.
+        """
+        last_error: Exception | None = None
+        deadline = time.monotonic() + LLM_CALL_TIMEOUT if LLM_CALL_TIMEOUT else None
+
+        def remaining() -> float | None:
+            return deadline - time.monotonic() if deadline is not None else None
+
+        candidates = self._candidates(model)
+        if prefer in candidates and prefer.available(time.monotonic()):
+            candidates.remove(prefer)
+            candidates.insert(0, prefer)
+        for backend in candidates:
+            left = remaining()
+            if left is not None and left <= 0:
+                raise last_error or TimeoutError(f"No Ollama answer within {LLM_CALL_TIMEOUT:.0f}s")
+            backend.outstanding += 1
+            backend.calls += 1
+            stream = None
+            try:
+                try:
+                    with tracing.span("ollama first chunk", "llm", backend=backend.host,
+                                      model=backend.model or model, outstanding=backend.outstanding):
+                        stream = await asyncio.wait_for(
+                            backend.client.chat(model=backend.model or model, stream=True, **kwargs), left,
+                        )
+                        first = await asyncio.wait_for(anext(stream), remaining())
+                except asyncio.TimeoutError:
+                    e = TimeoutError(f"{backend.host} sent nothing within the {LLM_CALL_TIMEOUT:.0f}s call deadline")
+                    backend.mark_down(e)
+                    last_error = e
+                    continue
+                except StopAsyncIteration:
+                    backend.mark_up()
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    backend.mark_down(e)
+                    last_error = e
+                    continue
+                yield first
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), remaining())
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        e = TimeoutError(f"{backend.host} stream exceeded the {LLM_CALL_TIMEOUT:.0f}s call deadline")
+                        backend.mark_down(e)
+                        raise e from None
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        backend.mark_down(e)
+                        raise
+                    yield chunk
+                backend.mark_up()
+                return
+            finally:
+                backend.outstanding -= 1
+                if stream is not None:
+                    await stream.aclose()
+        raise last_error or RuntimeError("No Ollama backend available")
+
+    async def check_health(self) -> dict[str, bool]:
+        """Probe every backend concurrently. Returns {backend label: healthy}."""
+        async def probe(backend: Backend) -> bool:
+            try:
+                await asyncio.wait_for(backend.client.list(), OLLAMA_HEALTH_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                backend.mark_down(e)
+                return False
+            backend.mark_up()
+            return True
+
+        results = await asyncio.gather(*(probe(b) for b in self.backends))
+        return {b.label: ok for b, ok in zip(self.backends, results)}
+
+    async def _load(self, model: str, **kwargs) -> list[dict]:
+        """Empty-prompt /api/generate on every backend serving model, concurrently."""
+        async def one(backend: Backend) -> dict:
+            name = backend.model or model
+            try:
+                with tracing.span("ollama load", "llm", backend=backend.host, model=name,
+                                  keep_alive=kwargs.get("keep_alive")):
+                    response = await asyncio.wait_for(
+                        backend.client.generate(model=name, prompt="", **kwargs), LLM_CALL_TIMEOUT or None,
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return {"backend": backend.host, "model": name, "ok": False, "load_ms": 0.0,
+                        "error": str(e)[:200]}
+            return {"backend": backend.host, "model": name, "ok": True,
+                    "load_ms": round((response.load_duration or 0) / 1e6, 1), "error": ""}
+
+        serving = [b for b in self.backends if b.serves(model)]
+        return list(await asyncio.gather(*(one(b) for b in serving)))
+
+    async def warm(self, model: str, options: dict | None = None, keep_alive=None) -> list[dict]:
+        """
+        Load model on every backend serving it, with the given options (num_ctx
+        must match the real calls or Ollama reloads) and keep_alive. Returns one
+        {"backend", "model", "ok", "load_ms", "error"} per backend; never raises.
+        """
+        return await self._load(model, options=options, keep_alive=keep_alive)
+
+    async def release(self, model: str) -> list[dict]:
+        """Unload model from every backend serving it (keep_alive=0)."""
+        return await self._load(model, keep_alive=0)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "backend": b.label,
+                "weight": b.weight,
+                "calls": b.calls,
+                "failures": b.failures,
+                "outstanding": b.outstanding,
+                "healthy": b.available(now),
+                "last_error": b.last_error,
+            }
+            for b in self.backends
+        ]
+
+    async def close(self):
+        for b in self.backends:
+            await b.close()
+
+
+_pool: LLMPool | None = None
+
+
+def get_pool() -> LLMPool:
+    """Process-wide pool built from OLLAMA_BACKENDS (or OLLAMA_BASE_URL)."""
+    global _pool
+    if _pool is None:
+        backends = parse_backends(OLLAMA_BACKENDS)
+        if not backends:
+            weight = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+            backends = [Backend(OLLAMA_BASE_URL, None, weight)]
+        _pool = LLMPool(backends)
+    return _pool
+
+
+def use_backends(backends: list[Backend]) -> LLMPool:
+    """Replace the process-wide pool with one over `backends` (e.g. bench_pipeline.py's stub server)."""
+    global _pool
+    _pool = LLMPool(backends)
+    return _pool
+
+
+async def close_pool():
+    """Close every pooled client. The next get_pool() builds a fresh pool."""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -1,41 +1,184 @@
 """
 llm_utils.py — Shared Ollama LLM utilities.
 
-Provides a single-turn LLM call for the investigation layer (no tools, no streaming).
-Also used by agent.py for client setup.
+Provides a single-turn LLM call for the investigation layer (no tools, no streaming),
+JSON-schema verdict formats for constrained decoding, and verdict parsers.
+Also used by agent.py for model settings. Calls go through llm_pool, which keeps
+one connection-reusing client per Ollama backend and fails over between them.
 """
 
+import json
 import os
 import re
+import time
 
-import ollama
 from dotenv import load_dotenv
 
+from llm_pool import get_pool
+
 load_dotenv()
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "phi4-mini")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
+# Cascade: rows the fast OLLAMA_MODEL answers UNKNOWN, unparseably or
+# inconsistently are re-asked of this stronger model. Empty disables escalation.
+OLLAMA_ESCALATION_MODEL = os.getenv("OLLAMA_ESCALATION_MODEL", "")
+
+# Pinned per-call settings. Ollama reloads the model when num_ctx changes
+# between requests, and drops its KV cache when the model unloads, so both are
+# fixed for every call to keep the shared system+playbook prefix reusable.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+DEFAULT_OPTIONS = {"num_ctx": OLLAMA_NUM_CTX}
+
+# Warm-up: load OLLAMA_MODEL at startup (with DEFAULT_OPTIONS, so num_ctx
+# matches the real calls) and hold it with OLLAMA_RESIDENT_KEEP_ALIVE (-1 =
+# until released) for the rest of the run; release_models() unloads at shutdown.
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "1").lower() not in ("0", "false", "no", "")
+OLLAMA_RESIDENT_KEEP_ALIVE = os.getenv("OLLAMA_RESIDENT_KEEP_ALIVE", "-1")
+
+# A call whose load_duration exceeds this many ms loaded the model from disk
+# (cold) instead of finding it resident.
+OLLAMA_COLD_LOAD_MS = float(os.getenv("OLLAMA_COLD_LOAD_MS", "500"))
+
+# Output-length caps for verdict generation. A JSON verdict with a one-sentence
+# reason is ~60 tokens; every generated token costs real time on CPU.
+LLM_NUM_PREDICT = int(os.getenv("LLM_NUM_PREDICT", "128"))
+# Stop sequences for free-text verdicts (not used with JSON format — a stop
+# sequence inside a JSON string would truncate the object).
+VERDICT_STOP = ["\n\n\n", "\n---"]
+
+# ---------------------------------------------------------------------------
+# JSON-schema verdict formats (Ollama structured outputs)
+# ---------------------------------------------------------------------------
+
+VERDICTS = ("CONFIRM", "ESCALATE", "RECLASSIFY")
+CATEGORIES = (
+    "QTYFULFI_STALE", "STUCK_PROCESSING", "QTY_SHORTAGE", "QTY_SHORTAGE_RINV",
+    "TICKET_OPEN", "NOT_SAFE", "QTYFULFI", "CONTRACT_LOCATION", "NOT_INTEGRATED", "OTHER",
+)
+
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdict": {"type": "string", "enum": list(VERDICTS)},
+        "reason": {"type": "string"},
+        "new_category": {"type": "string", "enum": ["", *CATEGORIES]},
+    },
+    "required": ["verdict", "reason", "new_category"],
+}
+
+
+def batch_verdict_schema(n_rows: int) -> dict:
+    """Schema for a batch answer: {"rows": [{row, verdict, reason, new_category}, ...]} with exactly n_rows items."""
+    item = {
+        "type": "object",
+        "properties": {"row": {"type": "integer"}, **VERDICT_SCHEMA["properties"]},
+        "required": ["row", *VERDICT_SCHEMA["required"]],
+    }
+    return {
+        "type": "object",
+        "properties": {"rows": {"type": "array", "items": item, "minItems": n_rows, "maxItems": n_rows}},
+        "required": ["rows"],
+    }
+
 
-def get_client() -> ollama.AsyncClient:
-    """Return an async Ollama client pointed at the configured base URL."""
-    return ollama.AsyncClient(host=OLLAMA_BASE_URL)
+def _keep_alive_value(value: str) -> int | str:
+    """Ollama takes keep_alive as seconds (int, -1 = forever) or a duration string ("30m")."""
+    return int(value) if value.lstrip("-").isdigit() else value
 
 
-async def call_llm_single_turn(system: str, user: str) -> str:
+# keep_alive sent with every call; warm_up() switches it to the resident value
+_keep_alive: int | str = _keep_alive_value(OLLAMA_KEEP_ALIVE)
+# Models touched while resident, to unload at shutdown
+_resident: set[str] = set()
+
+
+async def warm_up(model: str = OLLAMA_MODEL) -> list[dict]:
+    """
+    Load `model` on every backend that serves it and keep it resident for the
+    run: from here on every call sends OLLAMA_RESIDENT_KEEP_ALIVE, so long
+    SQL-bound gaps between LLM calls don't let Ollama unload it. Returns the
+    pool's per-backend load results; never raises.
+    """
+    global _keep_alive
+    _keep_alive = _keep_alive_value(OLLAMA_RESIDENT_KEEP_ALIVE)
+    _resident.add(model)
+    return await get_pool().warm(model, options=DEFAULT_OPTIONS, keep_alive=_keep_alive)
+
+
+async def release_models() -> list[dict]:
+    """Unload every model held resident since warm_up(), and go back to OLLAMA_KEEP_ALIVE."""
+    global _keep_alive
+    released = []
+    for model in sorted(_resident):
+        released.extend(await get_pool().release(model))
+    _resident.clear()
+    _keep_alive = _keep_alive_value(OLLAMA_KEEP_ALIVE)
+    return released
+
+
+def _ms(ns) -> float:
+    """Ollama durations are nanoseconds; convert to milliseconds (None -> 0)."""
+    return round((ns or 0) / 1e6, 1)
+
+
+async def call_llm_with_stats(system: str, user: str, options: dict | None = None,
+                              format: dict | str | None = None,
+                              model: str = OLLAMA_MODEL) -> tuple[str, dict]:
     """
     Single-turn LLM call — no tools, no streaming.
-    Returns the raw content string from the model.
+    `options` are merged over DEFAULT_OPTIONS and passed to Ollama (num_predict
+    and stop go here). `format` is a JSON schema (or "json") for constrained
+    decoding.
+    Returns (content, stats) where stats splits prompt prefill from generation:
+        {"prompt_tokens", "prefill_ms", "eval_tokens", "eval_ms", "load_ms",
+         "total_ms", "cold", "wall_ms", "backend", "model"}
+    prompt_tokens counts only tokens Ollama actually evaluated, so a reused
+    prompt prefix shows up as a smaller count and a shorter prefill.
+    load_ms is Ollama's model load time; `cold` flags a call that had to load
+    the model (load_ms >= OLLAMA_COLD_LOAD_MS).
+    The call is load-balanced across the pool and retried on another backend
+    if one fails; `backend` is the host that answered. `wall_ms` is end-to-end
+    latency as seen by the caller, including queueing on the backend.
     """
-    client = get_client()
-    response = await client.chat(
-        model=OLLAMA_MODEL,
+    start = time.perf_counter()
+    if _resident:
+        _resident.add(model)
+    response, backend = await get_pool().chat(
+        model,
         messages=[
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ],
+        options={**DEFAULT_OPTIONS, **(options or {})},
+        format=format,
+        keep_alive=_keep_alive,
     )
-    return response.message.content or ""
+    stats = {
+        "prompt_tokens": response.prompt_eval_count or 0,
+        "prefill_ms": _ms(response.prompt_eval_duration),
+        "eval_tokens": response.eval_count or 0,
+        "eval_ms": _ms(response.eval_duration),
+        "load_ms": _ms(response.load_duration),
+        "total_ms": _ms(response.total_duration),
+        "cold": _ms(response.load_duration) >= OLLAMA_COLD_LOAD_MS,
+        "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+        "backend": backend.host,
+        "model": backend.model or model,
+    }
+    return response.message.content or "", stats
+
+
+async def call_llm_single_turn(system: str, user: str, options: dict | None = None,
+                               format: dict | str | None = None) -> str:
+    """
+    Single-turn LLM call — no tools, no streaming.
+    Returns the raw content string from the model.
+    """
+    content, _ = await call_llm_with_stats(system, user, options, format)
+    return content
 
 
 def parse_verdict(raw: str) -> dict:
@@ -74,3 +217,119 @@ def parse_verdict(raw: str) -> dict:
         "reason": reason or text[:200],
         "new_category": new_category,
     }
+
+
+_BATCH_ROW_MARKER = re.compile(r"(?im)^[\s#*=\[]*row\s*[:#]?\s*(\d+)\b.*$")
+
+
+def parse_batch_verdicts(raw: str, n_rows: int) -> list[dict | None]:
+    """
+    Split a multi-row batch answer into per-row verdicts.
+    Each row's answer must start with a "row: <n>" marker line (also accepts
+    "ROW n", "**Row n**", "=== ROW n ==="), followed by the usual
+    verdict/reason/new_category lines.
+
+    Returns a list of length n_rows; an entry is None when that row is missing,
+    duplicated, or its verdict didn't parse — the caller falls back to a
+    single-row call for it.
+    """
+    results: list[dict | None] = [None] * n_rows
+    markers = list(_BATCH_ROW_MARKER.finditer(raw))
+    seen: set[int] = set()
+    for i, m in enumerate(markers):
+        num = int(m.group(1))
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(raw)
+        if not 1 <= num <= n_rows:
+            continue
+        if num in seen:
+            results[num - 1] = None
+            continue
+        seen.add(num)
+        verdict = parse_verdict(raw[m.end():end])
+        if verdict["verdict"] != "UNKNOWN":
+            results[num - 1] = verdict
+    return results
+
+
+def _validate_json_verdict(obj) -> dict | None:
+    """Check one decoded verdict object against VERDICT_SCHEMA's rules. None if invalid."""
+    if not isinstance(obj, dict):
+        return None
+    verdict = str(obj.get("verdict", "")).strip().upper()
+    reason = obj.get("reason")
+    new_category = str(obj.get("new_category") or "").strip().upper()
+    if verdict not in VERDICTS or not isinstance(reason, str) or not reason.strip():
+        return None
+    if verdict == "RECLASSIFY":
+        if new_category not in CATEGORIES:
+            return None
+    else:
+        new_category = ""
+    return {"verdict": verdict, "reason": reason.strip().rstrip("."), "new_category": new_category}
+
+
+_HEDGE_PHRASES = re.compile(
+    r"(?i)\b(cannot determine|can't determine|unable to determine|insufficient evidence|"
+    r"not enough evidence|unclear|unsure|not sure|ambiguous)\b"
+)
+
+
+def consistency_problem(verdict: dict, category: str) -> str:
+    """
+    Cheap self-consistency check on a parsed verdict — no extra model call.
+    Returns a short description of the problem, or "" when the verdict holds up:
+      - UNKNOWN (unparseable or missing verdict)
+      - RECLASSIFY without a valid target, or back into the row's own category
+      - a reason that hedges ("insufficient evidence", "unclear", ...) while
+        still committing to a verdict
+    """
+    if verdict["verdict"] not in VERDICTS:
+        return "unparseable or UNKNOWN verdict"
+    if verdict["verdict"] == "RECLASSIFY":
+        new_category = verdict.get("new_category", "")
+        if new_category not in CATEGORIES:
+            return f"RECLASSIFY to invalid category {new_category!r}"
+        if new_category == category:
+            return f"RECLASSIFY to its own category {category}"
+    if _HEDGE_PHRASES.search(verdict.get("reason", "")):
+        return "reason hedges on the evidence"
+    return ""
+
+
+def parse_verdict_json(raw: str) -> dict:
+    """
+    Strict parser for JSON-format verdicts (VERDICT_SCHEMA). No regex
+    scraping: anything that isn't a valid verdict object is UNKNOWN.
+    """
+    try:
+        verdict = _validate_json_verdict(json.loads(raw))
+    except (json.JSONDecodeError, ValueError):
+        verdict = None
+    if verdict is None:
+        return {"verdict": "UNKNOWN", "reason": f"Invalid JSON verdict: {raw.strip()[:200]}", "new_category": ""}
+    return verdict
+
+
+def parse_batch_verdicts_json(raw: str, n_rows: int) -> list[dict | None]:
+    """
+    Strict parser for batch_verdict_schema answers. Returns a list of length
+    n_rows; an entry is None when that row is missing, duplicated or invalid.
+    """
+    results: list[dict | None] = [None] * n_rows
+    try:
+        rows = json.loads(raw).get("rows")
+    except (json.JSONDecodeError, ValueError, AttributeError):
+        return results
+    if not isinstance(rows, list):
+        return results
+    seen: set[int] = set()
+    for item in rows:
+        num = item.get("row") if isinstance(item, dict) else None
+        if not isinstance(num, int) or not 1 <= num <= n_rows:
+            continue
+        if num in seen:
+            results[num - 1] = None
+            continue
+        seen.add(num)
+        results[num - 1] = _validate_json_verdict(item)
+    return results
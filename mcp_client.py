@@ -3,9 +3,12 @@ mcp_client.py — Async MCP client wrapper for the mssql-mcp-server.
 
 Spawns the Node.js MCP server process via stdio transport and exposes
 a single call_tool() coroutine. The session is lazily initialized on
-first use and reused for the lifetime of the Python process.
+first use (under a lock, so concurrent first calls share one server process)
+and reused for the lifetime of the Python process. Every tool
+call has a deadline of MCP_CALL_TIMEOUT seconds (0 disables it).
 """
 
+import asyncio
 import json
 import os
 from contextlib import AsyncExitStack
@@ -14,13 +17,18 @@ from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
+import tracing
+
 load_dotenv()
 
 MCP_SERVER_PATH = os.getenv("MCP_SERVER_PATH", "")
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "60"))
 
 # Module-level session state (lazy singleton)
 _session: ClientSession | None = None
 _exit_stack: AsyncExitStack | None = None
+# Serializes session start-up; created on first use so it binds to the running loop
+_session_lock: asyncio.Lock | None = None
 
 
 async def get_session() -> ClientSession:
@@ -28,10 +36,21 @@ async def get_session() -> ClientSession:
     Returns a live MCP ClientSession, initializing it on first call.
     The Node.js server process is spawned once and kept alive.
     """
-    global _session, _exit_stack
+    global _session, _session_lock
 
     if _session is not None:
         return _session
+    if _session_lock is None:
+        _session_lock = asyncio.Lock()
+    async with _session_lock:
+        # Another coroutine may have started the server while this one waited
+        if _session is None:
+            _session = await _start_session()
+    return _session
+
+
+async def _start_session() -> ClientSession:
+    global _exit_stack
 
     if not MCP_SERVER_PATH:
         raise RuntimeError(
@@ -45,16 +64,25 @@ async def get_session() -> ClientSession:
     )
 
     _exit_stack = AsyncExitStack()
-    read, write = await _exit_stack.enter_async_context(stdio_client(server_params))
-    _session = await _exit_stack.enter_async_context(ClientSession(read, write))
-    await _session.initialize()
+    try:
+        read, write = await _exit_stack.enter_async_context(stdio_client(server_params))
+        session = await _exit_stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+    except BaseException:
+        # Don't leave a half-started server process behind
+        stack, _exit_stack = _exit_stack, None
+        try:
+            await stack.aclose()
+        except Exception:
+            pass
+        raise
 
-    return _session
+    return session
 
 
 async def close_session() -> None:
     """Close the MCP session and kill the Node.js subprocess cleanly."""
-    global _session, _exit_stack
+    global _session, _exit_stack, _session_lock
     if _exit_stack is not None:
         try:
             await _exit_stack.aclose()
@@ -62,15 +90,21 @@ async def close_session() -> None:
             pass
     _session = None
     _exit_stack = None
+    _session_lock = None
 
 
 async def call_tool(name: str, arguments: dict) -> str:
     """
     Calls a named MCP tool with the given arguments and returns
-    the result as a JSON string.
+    the result as a JSON string. Raises TimeoutError if the server doesn't
+    answer within MCP_CALL_TIMEOUT seconds.
     """
     session = await get_session()
-    result = await session.call_tool(name, arguments)
+    with tracing.span(f"mcp {name}", "mcp", database=arguments.get("database"), query=arguments.get("query")):
+        try:
+            result = await asyncio.wait_for(session.call_tool(name, arguments), MCP_CALL_TIMEOUT or None)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"MCP {name} call timed out after {MCP_CALL_TIMEOUT:.0f}s") from None
 
     # MCP results are a list of content blocks; extract text content
     parts = []
@@ -0,0 +1,431 @@
+"""
+playbook_rules.py — Executable playbooks for the investigation layer.
+
+Each playbooks/<CATEGORY>.txt may end with a machine-readable RULES: section
+that mirrors its DECISION TREE. Steps are tried in order; the first step whose
+condition holds decides the row:
+
+    RULES:
+    1. open_orders.count > 0 => ESCALATE | {open_orders.count} open SOP order(s) may re-allocate qty
+    2. gp_qty.QTYONHND < needed => RECLASSIFY QTY_SHORTAGE | GP QTYONHND={gp_qty.QTYONHND} < needed {needed}
+    3. contains(error, "open") => JUDGMENT
+    4. otherwise => CONFIRM | Human action needed
+
+A step marked JUDGMENT hands the row to the LLM, which still sees the prose
+playbook (the RULES section is stripped from the prompt). So does a step whose
+data is missing, e.g. the gp_qty query returned no rows, or a row where no step
+matched.
+
+Conditions are a small, side-effect-free expression language evaluated over
+the gathered evidence (never eval()):
+    label.count                 rows returned by evidence query `label`
+    label.FIELD                 FIELD of the first row (numbers coerced)
+    count(label, F=v, ...)      rows matching filters
+    sum(label, "F", ...)        sum of F over matching rows
+    days_since(value)           whole days since a date
+    contains(text, "a", ...)    case-insensitive substring match, any needle
+    needed, days_open, retry_count, location, error   — the staged row
+    otherwise                   always true
+location and error are text: a comparison involving one compares the plain
+(stripped, case-insensitive) text of every operand, so Location "100" equals
+an evidence field "100" instead of meeting it as the number 100.0.
+Filters: F=v, F__ne=v, F__in=(a, b), F__prefix="RINV", within_days=N
+(ItProcessDate). Operators: and / or / not, comparisons, + - * /.
+Reason text may interpolate expressions in {braces}.
+"""
+
+import ast
+import os
+import re
+from datetime import datetime
+
+from evidence import EVIDENCE_QUERIES
+from llm_utils import CATEGORIES, VERDICTS
+
+PLAYBOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "playbooks")
+RULES_HEADER = "RULES:"
+JUDGMENT = "JUDGMENT"
+
+_STEP = re.compile(r"^\s*(\d+)\.\s*(.+?)\s*=>\s*(.+?)\s*$")
+_TEMPLATE = re.compile(r"\{([^{}]+)\}")
+_ROW_NAMES = {
+    "needed": "QuantityNeeded",
+    "days_open": "DaysOpen",
+    "retry_count": "RetryCount",
+    "location": "Location",
+    "error": "IntegrationError",
+}
+# Row names compared (and rendered) as text, never coerced to numbers
+_TEXT_NAMES = {"location", "error"}
+_FUNCTIONS = {"count", "sum", "days_since", "contains"}
+_COMPARE = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+}
+_ARITH = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b if b else 0.0,
+}
+
+
+class PlaybookRuleError(ValueError):
+    """A RULES section that doesn't compile."""
+
+
+class _Pending(Exception):
+    """A step needs an evidence label that hasn't been gathered (yet)."""
+
+
+class _Missing(Exception):
+    """A step needs a value the evidence doesn't have (e.g. query returned no rows)."""
+
+
+# ---------------------------------------------------------------------------
+# Loading and compiling
+# ---------------------------------------------------------------------------
+
+def split_playbook(text: str) -> tuple[str, str]:
+    """
+    Split playbook text into (prose for the LLM prompt, RULES section body).
+    Only the blank lines before the RULES header are dropped. The playbook files
+    keep their original bytes (CRLF) in front of the appended section, and
+    read_playbook() reads them in text mode like load_playbook() always has, so
+    the prose, LLM prompts and verdict cache keys are unchanged.
+    """
+    m = re.search(rf"(?m)^{re.escape(RULES_HEADER)}\s*$", text)
+    if not m:
+        return text, ""
+    return text[:m.start()].rstrip("\r\n"), text[m.end():]
+
+
+def read_playbook(category: str) -> tuple[str, str] | None:
+    """(prompt text, rules text) for a category's playbook file, or None if there is none."""
+    path = os.path.join(PLAYBOOK_DIR, f"{category}.txt")
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return split_playbook(f.read())
+
+
+def _check_expr(tree: ast.AST, labels: set[str], where: str):
+    """Reject anything outside the expression language at compile time."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id not in _ROW_NAMES and node.id not in labels and node.id not in _FUNCTIONS \
+                    and node.id != "otherwise":
+                raise PlaybookRuleError(f"{where}: unknown name {node.id!r}")
+        elif isinstance(node, ast.Attribute):
+            if not isinstance(node.value, ast.Name) or node.value.id not in labels:
+                raise PlaybookRuleError(f"{where}: attribute access is only allowed on evidence labels")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+                raise PlaybookRuleError(f"{where}: unknown function {ast.unparse(node.func)!r}")
+        elif isinstance(node, ast.Compare):
+            if any(type(op) not in _COMPARE for op in node.ops):
+                raise PlaybookRuleError(f"{where}: unsupported comparison")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _ARITH:
+                raise PlaybookRuleError(f"{where}: unsupported operator")
+        elif not isinstance(node, (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not,
+                                   ast.USub, ast.Constant, ast.Tuple, ast.keyword, ast.Load,
+                                   *_COMPARE, *_ARITH)):
+            raise PlaybookRuleError(f"{where}: unsupported syntax {type(node).__name__}")
+
+
+def _parse_expr(source: str, labels: set[str], where: str) -> ast.Expression:
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise PlaybookRuleError(f"{where}: {e.msg} in {source!r}") from None
+    _check_expr(tree, labels, where)
+    return tree
+
+
+def compile_rules(rules_text: str, category: str) -> list[dict]:
+    """
+    Compile a RULES section into an ordered list of steps:
+        {"step", "source", "condition", "verdict", "new_category", "reason", "reason_exprs"}
+    Raises PlaybookRuleError on anything malformed.
+    """
+    labels = {spec["label"] for spec in EVIDENCE_QUERIES.get(category, [])}
+    rules = []
+    for line in rules_text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        m = _STEP.match(line)
+        if not m:
+            raise PlaybookRuleError(f"{category}: cannot parse rule line {line.strip()!r}")
+        step, condition, action = int(m.group(1)), m.group(2), m.group(3)
+        where = f"{category} step {step}"
+
+        head, _, reason = action.partition("|")
+        words = head.split()
+        verdict = words[0].upper() if words else ""
+        new_category = words[1].upper() if len(words) > 1 else ""
+        if verdict not in (*VERDICTS, JUDGMENT):
+            raise PlaybookRuleError(f"{where}: unknown verdict {verdict!r}")
+        if verdict == "RECLASSIFY" and new_category not in CATEGORIES:
+            raise PlaybookRuleError(f"{where}: RECLASSIFY needs a known category, got {new_category!r}")
+        if verdict != JUDGMENT and not reason.strip():
+            raise PlaybookRuleError(f"{where}: {verdict} step needs a '| reason'")
+
+        reason = reason.strip()
+        rules.append({
+            "step": step,
+            "source": line.strip(),
+            "condition": _parse_expr(condition, labels, where),
+            "verdict": verdict,
+            "new_category": new_category if verdict == "RECLASSIFY" else "",
+            "reason": reason,
+            "reason_exprs": {
+                expr: _parse_expr(expr, labels, f"{where} reason") for expr in _TEMPLATE.findall(reason)
+            },
+        })
+    return rules
+
+
+_compiled: dict[str, list[dict]] = {}
+
+
+def load_rules(category: str) -> list[dict]:
+    """Compiled rules for a category (cached). [] when the playbook has no RULES section."""
+    if category not in _compiled:
+        playbook = read_playbook(category)
+        _compiled[category] = compile_rules(playbook[1], category) if playbook else []
+    return _compiled[category]
+
+
+def compile_all() -> dict[str, list[dict]]:
+    """Compile every playbook's rules up front so a broken RULES section fails the run early."""
+    return {category: load_rules(category) for category in CATEGORIES}
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+def _value(v):
+    """Normalize an evidence/row value: numeric strings -> float, strings stripped."""
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, (int, float)):
+        return v
+    if v is None:
+        return None
+    if isinstance(v, datetime):
+        return v
+    text = str(v).strip()
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _date(v) -> datetime | None:
+    if isinstance(v, datetime):
+        return v
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(str(v).strip()[:19])
+    except ValueError:
+        return None
+
+
+def _matches(row: dict, filters: dict) -> bool:
+    for key, expected in filters.items():
+        if key == "within_days":
+            when = _date(row.get("ItProcessDate"))
+            if when is None or (datetime.now() - when).days > expected:
+                return False
+            continue
+        field, _, op = key.partition("__")
+        actual = _value(row.get(field))
+        if op == "":
+            ok = actual == _value(expected)
+        elif op == "ne":
+            ok = actual != _value(expected)
+        elif op == "in":
+            ok = actual in {_value(e) for e in expected}
+        elif op == "prefix":
+            ok = str(row.get(field) or "").strip().upper().startswith(str(expected).upper())
+        else:
+            raise _Missing(f"unknown filter {key!r}")
+        if not ok:
+            return False
+    return True
+
+
+class _Context:
+    def __init__(self, evidence: dict[str, list[dict]], row: dict):
+        self.evidence = evidence
+        self.row = row
+
+    def rows(self, label: str) -> list[dict]:
+        if label not in self.evidence:
+            raise _Pending(label)
+        return self.evidence[label]
+
+    def eval(self, node: ast.AST):
+        if isinstance(node, ast.Expression):
+            return self.eval(node.body)
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Tuple):
+            return tuple(self.eval(e) for e in node.elts)
+        if isinstance(node, ast.Name):
+            if node.id == "otherwise":
+                return True
+            if node.id in _TEXT_NAMES:
+                raw = self.row.get(_ROW_NAMES[node.id])
+                return "" if raw is None else str(raw).strip()
+            if node.id in _ROW_NAMES:
+                value = _value(self.row.get(_ROW_NAMES[node.id]))
+                return value if isinstance(value, (int, float)) else 0
+            return node.id  # evidence label passed to a function
+        if isinstance(node, ast.Attribute):
+            rows = self.rows(node.value.id)
+            if node.attr == "count":
+                return len(rows)
+            if not rows:
+                raise _Missing(f"{node.value.id} returned no rows")
+            value = _value(rows[0].get(node.attr))
+            if value is None:
+                raise _Missing(f"{node.value.id}.{node.attr} is empty")
+            return value
+        if isinstance(node, ast.BoolOp):
+            if isinstance(node.op, ast.And):
+                return all(self.eval(v) for v in node.values)
+            return any(self.eval(v) for v in node.values)
+        if isinstance(node, ast.UnaryOp):
+            value = self.eval(node.operand)
+            return (not value) if isinstance(node.op, ast.Not) else -value
+        if isinstance(node, ast.Compare):
+            operands = [node.left, *node.comparators]
+            as_text = any(isinstance(o, ast.Name) and o.id in _TEXT_NAMES for o in operands)
+            operand = (lambda o: self.text(o).casefold()) if as_text else self.eval
+            left = operand(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = operand(comparator)
+                try:
+                    if not _COMPARE[type(op)](left, right):
+                        return False
+                except TypeError:
+                    raise _Missing(f"cannot compare {left!r} with {right!r}") from None
+                left = right
+            return True
+        if isinstance(node, ast.BinOp):
+            try:
+                return _ARITH[type(node.op)](self.eval(node.left), self.eval(node.right))
+            except TypeError:
+                raise _Missing(f"non-numeric value in {ast.unparse(node)}") from None
+        if isinstance(node, ast.Call):
+            return self.call(node.func.id, [self.eval(a) for a in node.args],
+                             {k.arg: self.eval(k.value) for k in node.keywords})
+        raise _Missing(f"unsupported syntax {type(node).__name__}")
+
+    def text(self, node: ast.AST) -> str:
+        """
+        Plain text of an operand for text comparisons and reasons: row text
+        fields and evidence fields as stored (stripped, no number coercion).
+        """
+        if isinstance(node, ast.Expression):
+            node = node.body
+        if isinstance(node, ast.Attribute) and node.attr != "count":
+            rows = self.rows(node.value.id)
+            if not rows:
+                raise _Missing(f"{node.value.id} returned no rows")
+            raw = rows[0].get(node.attr)
+            if raw is None or not str(raw).strip():
+                raise _Missing(f"{node.value.id}.{node.attr} is empty")
+            return _fmt(raw) if isinstance(raw, (int, float)) else str(raw).strip()
+        return _fmt(self.eval(node))
+
+    def call(self, name: str, args: list, kwargs: dict):
+        if name == "count":
+            return sum(1 for r in self.rows(args[0]) if _matches(r, kwargs))
+        if name == "sum":
+            values = (_value(r.get(args[1])) for r in self.rows(args[0]) if _matches(r, kwargs))
+            return sum(v for v in values if isinstance(v, (int, float)))
+        if name == "days_since":
+            when = _date(args[0])
+            if when is None:
+                raise _Missing(f"not a date: {args[0]!r}")
+            return (datetime.now() - when).days
+        if name == "contains":
+            text = str(args[0] or "").lower()
+            return any(str(needle).lower() in text for needle in args[1:])
+        raise _Missing(f"unknown function {name}")
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _render_reason(rule: dict, ctx: _Context) -> str:
+    def sub(m: re.Match) -> str:
+        try:
+            return ctx.text(rule["reason_exprs"][m.group(1)])
+        except (_Pending, _Missing):
+            return "?"
+    return _TEMPLATE.sub(sub, rule["reason"])
+
+
+def evaluate_rules(rules: list[dict], evidence: dict[str, list[dict]], row: dict) -> dict:
+    """
+    Walk the steps in order against the evidence gathered so far. Returns
+        {"status": "decided",      "step": n, "verdict": {...}}  — deterministic verdict
+        {"status": "judgment",     "step": n, "detail": ...}     — hand to the LLM
+        {"status": "pending",      "step": n, "detail": label}   — needs a later evidence tier
+        {"status": "undetermined", "step": None}                 — no step matched
+        {"status": "no-rules",     "step": None}                 — playbook has no RULES
+    """
+    if not rules:
+        return {"status": "no-rules", "step": None}
+    ctx = _Context(evidence, row)
+    for rule in rules:
+        try:
+            hit = bool(ctx.eval(rule["condition"]))
+        except _Pending as e:
+            return {"status": "pending", "step": rule["step"], "detail": str(e)}
+        except _Missing as e:
+            return {"status": "judgment", "step": rule["step"], "detail": str(e)}
+        if not hit:
+            continue
+        if rule["verdict"] == JUDGMENT:
+            return {"status": "judgment", "step": rule["step"], "detail": "marked JUDGMENT"}
+        return {
+            "status": "decided",
+            "step": rule["step"],
+            "verdict": {
+                "verdict": rule["verdict"],
+                "reason": _render_reason(rule, ctx),
+                "new_category": rule["new_category"],
+            },
+        }
+    return {"status": "undetermined", "step": None}
+
+
+def evaluate_playbook(category: str, evidence: dict[str, list[dict]], row: dict) -> dict:
+    """evaluate_rules() with the category's compiled playbook rules."""
+    return evaluate_rules(load_rules(category), evidence, row)
+
+
+def describe_outcome(outcome: dict) -> str:
+    """Short label for the PlaybookStep column."""
+    status, step = outcome["status"], outcome.get("step")
+    if status == "decided":
+        return f"step {step}"
+    if status == "judgment":
+        return f"step {step} judgment" if outcome.get("detail") == "marked JUDGMENT" else f"step {step} missing data"
+    if status == "pending":
+        return f"step {step} needs {outcome.get('detail')}"
+    return status
@@ -0,0 +1,235 @@
+"""
+query_cache.py — Question-to-SQL cache for the interactive agent.
+
+Ops users ask the same few questions every day with different identifiers
+("failed TMINs for part X", "GP qty for part Y at location Z"). When the agent
+answers one successfully, its final tool calls are stored as a template:
+    - the question with part numbers, locations, ticket IDs and other numbers
+      replaced by slots ({part1}, {loc1}, {ticket1}, {num1})
+    - the execute_query calls with the same values replaced by the same slots
+A later question with the same slot kinds and the same template words (order
+aside) reuses the SQL with its own values filled in, so agent.py goes straight
+to execution and the summary without the SQL-generating LLM turns. Only filler
+words are ignored; any other difference — "not", "last", "failed" vs
+"successful", "how many" vs "list" — is a different question and a miss, since
+no check short of the model could tell a harmless rewording from one that
+inverts the SQL.
+
+Entries live in a local SQLite file, expire after QUERY_CACHE_TTL_DAYS, and the
+store is trimmed to QUERY_CACHE_MAX_ENTRIES, least recently used first.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", os.path.join(PROJECT_DIR, ".cache", "agent_queries.sqlite"))
+QUERY_CACHE_TTL_DAYS = float(os.getenv("QUERY_CACHE_TTL_DAYS", "30"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "500"))
+
+# Identifier-like token: contains a digit (P12345, W101, 10-2345-AB, 123456)
+_VALUE = re.compile(r"(?<![\w{])([A-Za-z0-9][\w\-./]*\d[\w\-./]*|\d+)(?![\w}])")
+# Word before a value -> slot kind
+_SLOT_KEYWORDS = {
+    "ticket": "ticket", "tickets": "ticket", "tca": "ticket", "tcapkey": "ticket", "call": "ticket",
+    "location": "loc", "locations": "loc", "loc": "loc", "locncode": "loc", "at": "loc",
+    "warehouse": "loc", "truck": "loc", "site": "loc", "bin": "loc",
+    "part": "part", "parts": "part", "item": "part", "itemnmbr": "part", "sku": "part",
+}
+# Filler only: qualifiers (all/any, how many, not, last, ...) must stay in the template
+_STOPWORDS = {
+    "a", "an", "the", "for", "of", "on", "in", "to", "is", "are", "was", "were", "what", "whats",
+    "which", "show", "me", "give", "get", "find", "please", "and", "do", "does", "we", "there",
+}
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def templatize(question: str) -> tuple[str, dict[str, str]]:
+    """
+    ("failed tmin {part1}", {"part1": "P12345"}) for "Failed TMINs for part P12345?".
+    Values are classified by the word just before them; a value with letters
+    and digits and no keyword is a part, a bare number is a num.
+    """
+    slots: dict[str, str] = {}
+    counts: Counter = Counter()
+    by_value: dict[str, str] = {}
+    parts, last = [], 0
+    for m in _VALUE.finditer(question):
+        value = m.group(1)
+        if value not in by_value:
+            before = re.findall(r"[A-Za-z]+", question[:m.start()])
+            kind = _SLOT_KEYWORDS.get(before[-1].lower()) if before else None
+            if kind is None:
+                kind = "num" if value.isdigit() else "part"
+            counts[kind] += 1
+            by_value[value] = f"{kind}{counts[kind]}"
+            slots[by_value[value]] = value
+        parts += [question[last:m.start()], f" {{{by_value[value]}}} "]
+        last = m.end()
+    parts.append(question[last:])
+    words = re.findall(r"\{\w+\}|[a-z]+", "".join(parts).lower())
+    template = " ".join(_stem(w) for w in words if w not in _STOPWORDS)
+    return template, slots
+
+
+def signature(slots: dict[str, str]) -> str:
+    """Slot kinds and counts ('loc1,part1'); only templates with equal signatures can match."""
+    return ",".join(sorted(slots))
+
+
+def same_question(a: str, b: str) -> bool:
+    """True when two templates have the same words, ignoring order and repeats."""
+    return set(a.split()) == set(b.split())
+
+
+def _replace_value(text: str, value: str, placeholder: str) -> str:
+    return re.sub(rf"(?<![\w]){re.escape(value)}(?![\w])", placeholder, text)
+
+
+def parameterize(calls: list[tuple[str, dict]], slots: dict[str, str]) -> list[tuple[str, dict]] | None:
+    """
+    Replace each slot value in the calls' queries with {{slot}}. Returns None
+    when a value isn't in any query: the SQL doesn't depend on it, so it can't
+    be reused for a different value.
+    """
+    templated = [(name, dict(args)) for name, args in calls]
+    for slot, value in sorted(slots.items(), key=lambda s: -len(s[1])):
+        found = False
+        for _, args in templated:
+            query = args.get("query", "")
+            replaced = _replace_value(query, value, f"{{{{{slot}}}}}")
+            found = found or replaced != query
+            args["query"] = replaced
+        if not found:
+            return None
+    return templated
+
+
+def fill(calls: list[tuple[str, dict]], slots: dict[str, str]) -> list[tuple[str, dict]]:
+    """Template calls with this question's slot values substituted."""
+    filled = []
+    for name, args in calls:
+        args = dict(args)
+        for slot, value in slots.items():
+            args["query"] = args.get("query", "").replace(f"{{{{{slot}}}}}", value)
+        filled.append((name, args))
+    return filled
+
+
+class QueryCache:
+    """
+    SQLite-backed question -> SQL template cache with TTL expiry and LRU size
+    bound. Tracks hits/misses for the lifetime of the object.
+    """
+
+    def __init__(self, path: str = QUERY_CACHE_PATH,
+                 ttl_days: float = QUERY_CACHE_TTL_DAYS,
+                 max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS queries ("
+            "  template TEXT PRIMARY KEY,"
+            "  signature TEXT NOT NULL,"
+            "  calls TEXT NOT NULL,"
+            "  question TEXT,"
+            "  uses INTEGER NOT NULL DEFAULT 0,"
+            "  created REAL NOT NULL,"
+            "  last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_queries_signature ON queries(signature)")
+        self._conn.commit()
+        self.purge_expired()
+
+    def lookup(self, question: str) -> dict | None:
+        """
+        Entry for the same question: {"template", "question" (the cached one),
+        "calls" (filled in)}, or None on a miss.
+        """
+        template, slots = templatize(question)
+        cutoff = time.time() - self.ttl_seconds
+        rows = self._conn.execute(
+            "SELECT template, calls, question FROM queries WHERE signature = ? AND created >= ?",
+            (signature(slots), cutoff),
+        ).fetchall()
+        match = next((r for r in rows if same_question(template, r[0])), None)
+        if match is None:
+            self.misses += 1
+            return None
+        cached_template, calls, cached_question = match
+        self._conn.execute(
+            "UPDATE queries SET uses = uses + 1, last_used = ? WHERE template = ?", (time.time(), cached_template)
+        )
+        self._conn.commit()
+        self.hits += 1
+        return {
+            "template": cached_template,
+            "question": cached_question,
+            "calls": fill([tuple(c) for c in json.loads(calls)], slots),
+        }
+
+    def put(self, question: str, calls: list[tuple[str, dict]]) -> bool:
+        """
+        Store the tool calls that answered question. Only execute_query calls
+        whose SQL contains every slot value are stored. Returns True if stored.
+        """
+        if not calls or any(name != "execute_query" for name, _ in calls):
+            return False
+        template, slots = templatize(question)
+        templated = parameterize(calls, slots)
+        if templated is None:
+            return False
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO queries (template, signature, calls, question, uses, created, last_used) "
+            "VALUES (?, ?, ?, ?, 0, ?, ?)",
+            (template, signature(slots), json.dumps(templated), question, now, now),
+        )
+        self._conn.execute(
+            "DELETE FROM queries WHERE template IN ("
+            "  SELECT template FROM queries ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,),
+        )
+        self._conn.commit()
+        return True
+
+    def invalidate(self, template: str):
+        """Drop an entry whose SQL failed on reuse."""
+        self._conn.execute("DELETE FROM queries WHERE template = ?", (template,))
+        self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete entries older than the TTL. Returns the number removed."""
+        cutoff = time.time() - self.ttl_seconds
+        cur = self._conn.execute("DELETE FROM queries WHERE created < ?", (cutoff,))
+        self._conn.commit()
+        return cur.rowcount
+
+    def hit_rate(self) -> str:
+        lookups = self.hits + self.misses
+        return f"{self.hits}/{lookups} ({self.hits / lookups:.0%})" if lookups else "0/0 (n/a)"
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,312 @@
+"""
+schema_catalog.py — Local schema catalog for the interactive agent.
+
+The agent used to spend whole LLM turns on list_tables / describe_table for
+schemas that almost never change. This module builds a catalog of every table
+and view in Inventory, IntegrationDB and T2Online through MCP (one
+INFORMATION_SCHEMA query per database), persists it to
+.cache/schema_catalog.json, and indexes it by table and column name.
+
+For each question, context_for() retrieves the tables the question names
+(directly, through one of their columns, or through a domain alias such as
+"GP" or "Trakker") and renders a compact slice that agent.py inlines into the
+prompt. describe_table / list_tables calls for cataloged tables are answered
+locally.
+
+Staleness: each database's entry records MAX(sys.objects.modify_date) and the
+object count. refresh() re-reads those two numbers (one cheap query per
+database) and rebuilds only the databases whose schema changed, or whose entry
+is older than SCHEMA_CATALOG_MAX_AGE_DAYS.
+
+Usage:
+    python schema_catalog.py              # refresh stale databases, print a summary
+    python schema_catalog.py --refresh    # rebuild every database
+    python schema_catalog.py --show IV00102
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+
+import mcp_client
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA_CATALOG_PATH = os.getenv("SCHEMA_CATALOG_PATH", os.path.join(PROJECT_DIR, ".cache", "schema_catalog.json"))
+SCHEMA_CATALOG_MAX_AGE_DAYS = float(os.getenv("SCHEMA_CATALOG_MAX_AGE_DAYS", "7"))
+# Tables inlined into the prompt per question, and columns shown per table
+SCHEMA_CONTEXT_TABLES = int(os.getenv("SCHEMA_CONTEXT_TABLES", "4"))
+SCHEMA_CONTEXT_COLUMNS = int(os.getenv("SCHEMA_CONTEXT_COLUMNS", "30"))
+
+DATABASES = ("Inventory", "IntegrationDB", "T2Online")
+
+# Words people use for tables whose names don't say what they are
+TABLE_ALIASES = {
+    "gp": ["IV00102"],
+    "trakker": ["InventQuantities"],
+    "ticket": ["TicketCallMain", "TicketPartsMain"],
+    "tickets": ["TicketCallMain", "TicketPartsMain"],
+    "order": ["SOP10200"],
+    "orders": ["SOP10200"],
+    "integration": ["IntegrationTransactions"],
+    "transactions": ["IntegrationTransactions"],
+    "status": ["IntegrationStatusLookup"],
+    "acquisition": ["AcqAcquisitionLookup"],
+}
+
+_COLUMNS_SQL = (
+    "SELECT c.TABLE_SCHEMA, c.TABLE_NAME, t.TABLE_TYPE, c.COLUMN_NAME, c.DATA_TYPE, "
+    "c.CHARACTER_MAXIMUM_LENGTH, c.IS_NULLABLE, c.ORDINAL_POSITION "
+    "FROM INFORMATION_SCHEMA.COLUMNS c "
+    "JOIN INFORMATION_SCHEMA.TABLES t "
+    "ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME "
+    "ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION"
+)
+# Approximate row counts (needs VIEW DATABASE STATE; skipped if it fails) —
+# the size catalog behind sql_guard.py's large-table checks
+_ROWCOUNT_SQL = (
+    "SELECT s.name AS schema_name, o.name AS table_name, SUM(p.row_count) AS row_count "
+    "FROM sys.dm_db_partition_stats p "
+    "JOIN sys.objects o ON o.object_id = p.object_id "
+    "JOIN sys.schemas s ON s.schema_id = o.schema_id "
+    "WHERE p.index_id IN (0, 1) AND o.type = 'U' "
+    "GROUP BY s.name, o.name"
+)
+_FINGERPRINT_SQL = (
+    "SELECT CONVERT(varchar(23), MAX(modify_date), 121) AS changed, COUNT(*) AS objects "
+    "FROM sys.objects WHERE type IN ('U', 'V')"
+)
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def log(msg: str):
+    print(msg.encode("ascii", "replace").decode("ascii"), flush=True)
+
+
+def _type_name(col: dict) -> str:
+    length = col.get("CHARACTER_MAXIMUM_LENGTH")
+    if length in (None, ""):
+        return col["DATA_TYPE"]
+    return f"{col['DATA_TYPE']}({'max' if int(length) == -1 else int(length)})"
+
+
+async def _query(sql: str, database: str) -> list[dict]:
+    return mcp_client.parse_rows(await mcp_client.call_tool("execute_query", {"query": sql, "database": database}))
+
+
+async def _row_counts(database: str) -> list[dict]:
+    try:
+        return await _query(_ROWCOUNT_SQL, database)
+    except Exception:
+        return []
+
+
+async def fingerprint(database: str) -> str:
+    """Cheap schema-change marker: latest object modify_date + object count."""
+    rows = await _query(_FINGERPRINT_SQL, database)
+    return f"{rows[0].get('changed')}|{rows[0].get('objects')}" if rows else ""
+
+
+async def build_database(database: str) -> dict:
+    """Catalog entry for one database: {"built", "fingerprint", "tables": {schema.table: {...}}}."""
+    rows, marker, counts = await asyncio.gather(
+        _query(_COLUMNS_SQL, database), fingerprint(database), _row_counts(database),
+    )
+    row_counts = {f"{r.get('schema_name')}.{r.get('table_name')}": r.get("row_count") for r in counts}
+    tables: dict[str, dict] = {}
+    for col in rows:
+        name = f"{col['TABLE_SCHEMA']}.{col['TABLE_NAME']}"
+        table = tables.setdefault(name, {
+            "schema": col["TABLE_SCHEMA"],
+            "name": col["TABLE_NAME"],
+            "type": "view" if "VIEW" in str(col.get("TABLE_TYPE", "")).upper() else "table",
+            "columns": [],
+            "rows": row_counts.get(name),
+        })
+        table["columns"].append({
+            "name": col["COLUMN_NAME"],
+            "type": _type_name(col),
+            "nullable": str(col.get("IS_NULLABLE", "")).upper() == "YES",
+        })
+    return {"built": time.time(), "fingerprint": marker, "tables": tables}
+
+
+class SchemaCatalog:
+    """Tables and columns of every cataloged database, indexed by (lowercased) name."""
+
+    def __init__(self, data: dict | None = None, path: str = SCHEMA_CATALOG_PATH):
+        self.path = path
+        self.data: dict[str, dict] = data or {}
+        self._index()
+
+    @classmethod
+    def load(cls, path: str = SCHEMA_CATALOG_PATH) -> "SchemaCatalog":
+        """The persisted catalog, or an empty one if there is none yet."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(json.load(f).get("databases", {}), path)
+        except (OSError, ValueError):
+            return cls({}, path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"databases": self.data}, f)
+        os.replace(tmp, self.path)
+
+    def _index(self):
+        self.by_table: dict[str, list[tuple[str, dict]]] = {}
+        self.by_column: dict[str, list[tuple[str, dict]]] = {}
+        for database, entry in self.data.items():
+            for table in entry.get("tables", {}).values():
+                self.by_table.setdefault(table["name"].lower(), []).append((database, table))
+                for col in table["columns"]:
+                    self.by_column.setdefault(col["name"].lower(), []).append((database, table))
+
+    def row_counts(self) -> dict[str, int]:
+        """{lowercased table name: approximate rows} for tables whose size is known."""
+        return {
+            name: table["rows"]
+            for name, entries in self.by_table.items()
+            for _, table in entries
+            if table.get("rows") is not None
+        }
+
+    def __len__(self) -> int:
+        return sum(len(entry.get("tables", {})) for entry in self.data.values())
+
+    # --- Refresh -----------------------------------------------------------
+
+    def age_days(self, database: str) -> float | None:
+        entry = self.data.get(database)
+        return (time.time() - entry["built"]) / 86400 if entry else None
+
+    async def refresh(self, databases: tuple[str, ...] = DATABASES, force: bool = False) -> list[str]:
+        """
+        Rebuild databases that are missing, older than SCHEMA_CATALOG_MAX_AGE_DAYS
+        or whose fingerprint changed (all of them with force=True). Saves if
+        anything was rebuilt; returns the rebuilt database names.
+        """
+        async def stale(database: str) -> bool:
+            age = self.age_days(database)
+            if force or age is None or age > SCHEMA_CATALOG_MAX_AGE_DAYS:
+                return True
+            return await fingerprint(database) != self.data[database].get("fingerprint")
+
+        flags = await asyncio.gather(*(stale(db) for db in databases))
+        todo = [db for db, is_stale in zip(databases, flags) if is_stale]
+        for database, entry in zip(todo, await asyncio.gather(*(build_database(db) for db in todo))):
+            self.data[database] = entry
+        if todo:
+            self._index()
+            self.save()
+        return todo
+
+    # --- Lookup ------------------------------------------------------------
+
+    def find_table(self, name: str, database: str | None = None) -> tuple[str, dict] | None:
+        """(database, table) for a table name ('IV00102', 'dbo.IV00102', '[dbo].[IV00102]')."""
+        bare = name.replace("[", "").replace("]", "").split(".")[-1].lower()
+        matches = self.by_table.get(bare, [])
+        for db, table in matches:
+            if database is None or db.lower() == database.lower():
+                return db, table
+        return None
+
+    def describe(self, name: str, database: str | None = None, schema: str | None = None) -> str | None:
+        """describe_table answered from the catalog (JSON), or None if the table isn't cataloged."""
+        found = self.find_table(f"{schema}.{name}" if schema else name, database)
+        if found is None:
+            return None
+        db, table = found
+        return json.dumps({
+            "database": db,
+            "table": f"{table['schema']}.{table['name']}",
+            "type": table["type"],
+            "columns": table["columns"],
+            "source": "schema catalog",
+        })
+
+    def list_tables(self, database: str) -> str | None:
+        """list_tables answered from the catalog (JSON), or None if the database isn't cataloged."""
+        entry = next((e for db, e in self.data.items() if db.lower() == (database or "").lower()), None)
+        if entry is None:
+            return None
+        return json.dumps([
+            {"schema": t["schema"], "name": t["name"], "type": t["type"]} for t in entry["tables"].values()
+        ])
+
+    def relevant_tables(self, question: str, limit: int = SCHEMA_CONTEXT_TABLES) -> list[tuple[str, dict, set[str]]]:
+        """
+        Tables the question refers to, best first: named directly (3 points),
+        through an alias (2), or through one of their column names (1 per
+        column). Returns [(database, table, matched column names)].
+        """
+        scores: dict[tuple[str, str], list] = {}
+
+        def add(db: str, table: dict, points: int, column: str | None = None):
+            entry = scores.setdefault((db, table["name"]), [0, table, set()])
+            entry[0] += points
+            if column:
+                entry[2].add(column)
+
+        for word in {w.lower() for w in _WORD.findall(question)}:
+            for db, table in self.by_table.get(word, []):
+                add(db, table, 3)
+            for alias in TABLE_ALIASES.get(word, []):
+                for db, table in self.by_table.get(alias.lower(), []):
+                    add(db, table, 2)
+            for db, table in self.by_column.get(word, []):
+                add(db, table, 1, word)
+
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [(db, table, columns) for (db, _), (_, table, columns) in ranked[:limit]]
+
+    def context_for(self, question: str) -> str:
+        """Compact schema slice for the question ('' if nothing matched)."""
+        lines = []
+        for db, table, matched in self.relevant_tables(question):
+            cols = table["columns"]
+            # Columns the question names first, then table order
+            ordered = [c for c in cols if c["name"].lower() in matched] + [c for c in cols if c["name"].lower() not in matched]
+            shown = ", ".join(f"{c['name']} {c['type']}" for c in ordered[:SCHEMA_CONTEXT_COLUMNS])
+            more = f", ... {len(cols) - SCHEMA_CONTEXT_COLUMNS} more" if len(cols) > SCHEMA_CONTEXT_COLUMNS else ""
+            kind = " (view)" if table["type"] == "view" else ""
+            lines.append(f"{db}.{table['schema']}.{table['name']}{kind}: {shown}{more}")
+        return "\n".join(lines)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the agent's local schema catalog.")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild every database, stale or not")
+    parser.add_argument("--show", metavar="TABLE", help="Print one table's cataloged columns")
+    args = parser.parse_args()
+
+    catalog = SchemaCatalog.load()
+    try:
+        if args.show:
+            log(catalog.describe(args.show) or f"{args.show} is not in the catalog")
+            return
+        rebuilt = await catalog.refresh(force=args.refresh)
+    finally:
+        await mcp_client.close_session()
+
+    log(f"[SCHEMA] Rebuilt: {', '.join(rebuilt) or 'nothing (catalog is current)'}")
+    for database, entry in catalog.data.items():
+        columns = sum(len(t["columns"]) for t in entry["tables"].values())
+        log(f"  {database}: {len(entry['tables'])} table(s)/view(s), {columns} column(s), "
+            f"built {catalog.age_days(database):.1f} day(s) ago")
+    log(f"[SCHEMA] {catalog.path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,264 @@
+"""
+sql_guard.py — Pre-execution checks for agent-generated T-SQL.
+
+agent.py sends every execute_query through guard_query() before it reaches
+SQL Server:
+    1. Read-only, single statement: the query must start with SELECT or WITH,
+       and must not contain ';' batches or write/DDL/EXEC keywords.
+    2. Unfiltered large tables: a table above SQL_GUARD_LARGE_ROWS rows (size
+       catalog: schema_catalog.py row counts, overridden by
+       SQL_GUARD_TABLE_SIZES) that is read with no WHERE clause and then
+       sorted, grouped, aggregated or DISTINCTed is rejected. So is one filtered
+       only by a leading-wildcard LIKE. Both force a full scan; on the 1.1M-row
+       TicketCallMain that is the 30s timeout.
+    3. Row limit: a query without TOP or OFFSET/FETCH gets TOP SQL_GUARD_TOP
+       injected into its outer SELECT. A UNION/INTERSECT/EXCEPT query is
+       wrapped as SELECT TOP n * FROM (<query>) AS q instead.
+    4. Optional cost pre-check (SQL_GUARD_MAX_COST > 0): fetch the estimated
+       plan (SHOWPLAN_XML) and reject above that StatementSubTreeCost. This
+       needs an MCP server that runs SET statements on the same connection as
+       the query; if no plan comes back the check is skipped. SET SHOWPLAN_XML
+       must be alone in its batch, so ON / query / OFF are three calls; while
+       the check is on, callers hold query_lock() around the guard and the
+       query itself so no other query lands in between and gets plan XML
+       instead of rows. If SHOWPLAN can't be switched off again, the MCP
+       session is closed so the next query starts on a fresh connection.
+
+A rejection raises QueryRejected. Its message says what to change (which
+filter columns, what limit), and agent.py returns it to the model as a tool
+error so the next turn can fix the query.
+"""
+
+import asyncio
+import contextlib
+import os
+import re
+
+from dotenv import load_dotenv
+
+import mcp_client
+
+load_dotenv()
+
+SQL_GUARD_TOP = int(os.getenv("SQL_GUARD_TOP", "200"))
+SQL_GUARD_LARGE_ROWS = int(os.getenv("SQL_GUARD_LARGE_ROWS", "100000"))
+SQL_GUARD_TABLE_SIZES = os.getenv("SQL_GUARD_TABLE_SIZES", "TicketCallMain=1100000")
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "0"))
+
+# Selective (key / date) columns to suggest when a large table is rejected
+FILTER_HINTS = {
+    "ticketcallmain": "TcaPKey or a TcaCallDate range",
+    "ticketpartsmain": "TcpPKey, TcaPKey or TcpPartNumber",
+    "integrationtransactions": "ItPKey, ItPartNumber, TicketLineItemID or an ItProcessDate range",
+}
+
+_FORBIDDEN = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|DROP|ALTER|CREATE|TRUNCATE|EXEC|EXECUTE|GRANT|REVOKE|DENY|"
+    r"INTO|OPENROWSET|OPENQUERY|OPENDATASOURCE|SHUTDOWN|BACKUP|RESTORE|DBCC)\b",
+    re.IGNORECASE,
+)
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+((?:\[?[\w#]+\]?\s*\.\s*){0,3}\[?[\w#]+\]?)", re.IGNORECASE)
+_SELECT = re.compile(r"\bSELECT\b(\s+(?:DISTINCT|ALL)\b)?", re.IGNORECASE)
+_HAS_TOP = re.compile(r"^\s*SELECT\s+(?:(?:DISTINCT|ALL)\s+)?TOP\b", re.IGNORECASE)
+_SCAN_SHAPE = re.compile(r"\b(ORDER\s+BY|GROUP\s+BY|DISTINCT|COUNT|SUM|AVG|MIN|MAX)\b", re.IGNORECASE)
+_SELECTIVE = re.compile(r"=|<|>|\bIN\s*\(|\bBETWEEN\b", re.IGNORECASE)
+_COST = re.compile(r'StatementSubTreeCost="([\d.Ee+-]+)"')
+
+
+# Held by guard + execution of every query while the cost pre-check is on
+_query_lock: asyncio.Lock | None = None
+
+
+class QueryRejected(ValueError):
+    """The guard refused a query; the message tells the model how to fix it."""
+
+
+def query_lock() -> contextlib.AbstractAsyncContextManager:
+    """
+    Lock to hold around guard_query() and running the query it returns. A no-op
+    unless SQL_GUARD_MAX_COST is set, since only the SHOWPLAN sequence needs it.
+    """
+    global _query_lock
+    if SQL_GUARD_MAX_COST <= 0:
+        return contextlib.nullcontext()
+    if _query_lock is None:
+        _query_lock = asyncio.Lock()
+    return _query_lock
+
+
+def parse_table_sizes(spec: str) -> dict[str, int]:
+    """'Table=rows,Table2=rows' -> {lowercased table: rows}."""
+    sizes = {}
+    for item in spec.split(","):
+        name, _, rows = item.partition("=")
+        if name.strip() and rows.strip():
+            sizes[name.strip().lower()] = int(float(rows))
+    return sizes
+
+
+def table_sizes(catalog=None) -> dict[str, int]:
+    """Size catalog: schema catalog row counts (if any), overridden by SQL_GUARD_TABLE_SIZES."""
+    sizes = dict(catalog.row_counts()) if catalog is not None else {}
+    sizes.update(parse_table_sizes(SQL_GUARD_TABLE_SIZES))
+    return sizes
+
+
+def _mask(sql: str) -> str:
+    """
+    Same-length copy of sql with comments blanked and string-literal contents
+    replaced by spaces, so keyword and bracket scans ignore them and indexes
+    still line up with the original text.
+    """
+    out, i, n = [], 0, len(sql)
+    while i < n:
+        if sql.startswith("--", i):
+            end = sql.find("\n", i)
+            end = n if end == -1 else end
+            out.append(" " * (end - i))
+            i = end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+            out.append(" " * (end - i))
+            i = end
+        elif sql[i] == "'":
+            j = i + 1
+            while j < n:
+                if sql[j] == "'" and sql.startswith("''", j):
+                    j += 2
+                elif sql[j] == "'":
+                    break
+                else:
+                    j += 1
+            out.append("'" + " " * (min(j, n) - i - 1) + ("'" if j < n else ""))
+            i = j + 1
+        else:
+            out.append(sql[i])
+            i += 1
+    return "".join(out)[:n]
+
+
+def _depths(masked: str) -> list[int]:
+    depth, depths = 0, []
+    for ch in masked:
+        if ch == ")":
+            depth -= 1
+        depths.append(depth)
+        if ch == "(":
+            depth += 1
+    return depths
+
+
+def _tables(masked: str) -> list[str]:
+    """Bare (lowercased) names of every table read in FROM / JOIN clauses."""
+    return [re.sub(r"[\[\]\s]", "", ref).split(".")[-1].lower() for ref in _TABLE_REF.findall(masked)]
+
+
+def _wrap_top(sql: str, masked: str, depths: list[int], start: int, top: int) -> str:
+    """
+    SELECT TOP n * FROM (<query>) AS q for a set-operation query starting at
+    `start` (after any CTE list). A trailing ORDER BY moves outside the derived
+    table, where SQL Server allows it.
+    """
+    end = len(masked.rstrip().rstrip(";").rstrip())
+    order = [m for m in re.finditer(r"\bORDER\s+BY\b", masked[:end], re.IGNORECASE)
+             if depths[m.start()] == 0 and m.start() > start]
+    split = order[-1].start() if order else end
+    tail = f" {sql[split:end].strip()}" if order else ""
+    return f"{sql[:start]}SELECT TOP {top} * FROM ({sql[start:split].rstrip()}) AS q{tail}"
+
+
+def check_query(sql: str, sizes: dict[str, int], top: int = SQL_GUARD_TOP) -> tuple[str, list[str]]:
+    """
+    Validate and rewrite one agent query. Returns (sql to run, notes on what
+    was changed). Raises QueryRejected with a fix-it message.
+    """
+    masked = _mask(sql)
+    body = masked.strip().rstrip(";").strip()
+    if not re.match(r"(SELECT|WITH)\b", body, re.IGNORECASE):
+        raise QueryRejected("Only read-only SELECT queries are allowed (start with SELECT or WITH).")
+    if ";" in body:
+        raise QueryRejected("Send one SELECT statement per execute_query call (no ';' batches).")
+    keyword = _FORBIDDEN.search(body)
+    if keyword:
+        raise QueryRejected(f"{keyword.group(1).upper()} is not allowed; execute_query is read-only SELECT.")
+
+    depths = _depths(masked)
+    where = re.search(r"\bWHERE\b", masked, re.IGNORECASE)
+    for table in dict.fromkeys(_tables(masked)):
+        rows = sizes.get(table, 0)
+        if rows < SQL_GUARD_LARGE_ROWS:
+            continue
+        hint = FILTER_HINTS.get(table, "a key or date column")
+        if where is None and _SCAN_SHAPE.search(masked):
+            raise QueryRejected(
+                f"{table} has ~{rows:,} rows and this query reads all of them (no WHERE, with "
+                f"sorting/grouping/aggregation) — it will time out. Add a WHERE filter on {hint}."
+            )
+        if where is not None and re.search(r"\bLIKE\s+N?'%", sql, re.IGNORECASE) \
+                and not _SELECTIVE.search(masked[where.end():]):
+            raise QueryRejected(
+                f"{table} has ~{rows:,} rows and the only filter is a LIKE '%...' (leading wildcard), "
+                f"which scans the whole table. Filter on {hint}, or match the start of the value (LIKE 'X%')."
+            )
+
+    notes = []
+    outer = [m for m in _SELECT.finditer(masked) if depths[m.start()] == 0]
+    set_op = any(depths[m.start()] == 0 for m in re.finditer(r"\b(UNION|INTERSECT|EXCEPT)\b", masked, re.IGNORECASE))
+    # A set operation is only bounded when every branch is
+    has_top = [bool(_HAS_TOP.match(masked[m.start():])) for m in outer]
+    limited = (all(has_top) if set_op else any(has_top)) \
+        or re.search(r"\bFETCH\s+(NEXT|FIRST)\b", masked, re.IGNORECASE)
+    if not limited and outer and not set_op:
+        m = outer[-1]
+        sql = f"{sql[:m.end()]} TOP {top}{sql[m.end():]}"
+        notes.append(f"added TOP {top}")
+    elif not limited and outer:
+        if where is None and any(sizes.get(t, 0) >= SQL_GUARD_LARGE_ROWS for t in _tables(masked)):
+            raise QueryRejected(
+                "UNION/INTERSECT/EXCEPT over a large table needs a WHERE filter or a TOP in each branch."
+            )
+        sql = _wrap_top(sql, masked, depths, outer[0].start(), top)
+        notes.append(f"wrapped in SELECT TOP {top}")
+    return sql, notes
+
+
+async def estimated_cost(sql: str, database: str) -> float | None:
+    """
+    Estimated plan cost of sql via SHOWPLAN_XML, or None if the server didn't
+    return a plan. Call it under query_lock().
+    """
+    raw = ""
+    try:
+        await mcp_client.call_tool("execute_query", {"query": "SET SHOWPLAN_XML ON", "database": database})
+        raw = await mcp_client.call_tool("execute_query", {"query": sql, "database": database})
+    except Exception:
+        pass
+    finally:
+        try:
+            await mcp_client.call_tool("execute_query", {"query": "SET SHOWPLAN_XML OFF", "database": database})
+        except Exception:
+            # A connection left in SHOWPLAN mode answers every later query with plan XML
+            await mcp_client.close_session()
+    costs = [float(c) for c in _COST.findall(raw)]
+    return max(costs) if costs else None
+
+
+async def guard_query(sql: str, database: str, sizes: dict[str, int]) -> tuple[str, list[str]]:
+    """
+    check_query plus the optional SQL_GUARD_MAX_COST pre-check. Raises
+    QueryRejected. Hold query_lock() from here until the returned query has run.
+    """
+    sql, notes = check_query(sql, sizes)
+    if SQL_GUARD_MAX_COST > 0:
+        cost = await estimated_cost(sql, database)
+        if cost is None:
+            notes.append("cost pre-check skipped (no estimated plan)")
+        elif cost > SQL_GUARD_MAX_COST:
+            raise QueryRejected(
+                f"Estimated plan cost {cost:.1f} exceeds the limit of {SQL_GUARD_MAX_COST:g}. "
+                "Narrow the WHERE filter, drop ORDER BY on unindexed columns, or query fewer tables."
+            )
+        else:
+            notes.append(f"estimated cost {cost:.2f}")
+    return sql, notes
@@ -0,0 +1,44 @@
+"""Compiled playbook rules: text row fields against evidence fields."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playbook_rules import evaluate_playbook  # noqa: E402
+
+
+def _contract_location(location, stock_location, on_hand=3):
+    evidence = {
+        "acq_info": [{"AcqHWSStockLocation": stock_location}],
+        "gp_qty": [{"QTYONHND": on_hand}],
+    }
+    return evaluate_playbook("CONTRACT_LOCATION", evidence, {"Location": location})
+
+
+@pytest.mark.parametrize("location, stock_location", [
+    ("100", "100"),
+    ("100", 100),
+    (" 100 ", "100"),
+    ("0100", "0100"),
+    ("W100", "W100"),
+    ("w100", "W100"),
+])
+def test_part_already_at_contract_location_is_stale(location, stock_location):
+    outcome = _contract_location(location, stock_location)
+    assert outcome["status"] == "decided"
+    assert outcome["verdict"]["verdict"] == "RECLASSIFY"
+    assert outcome["verdict"]["new_category"] == "QTYFULFI_STALE"
+
+
+@pytest.mark.parametrize("location, stock_location", [
+    ("100", "200"),
+    ("100", "0100"),
+    ("W100", "W200"),
+])
+def test_part_elsewhere_is_moved(location, stock_location):
+    outcome = _contract_location(location, stock_location)
+    assert outcome["verdict"]["verdict"] == "CONFIRM"
+    assert outcome["verdict"]["reason"] == f"Move part to contract location {stock_location}"
@@ -0,0 +1,148 @@
+"""
+tool_results.py — Compaction of MCP tool results before they enter the agent's context.
+
+A broad SELECT can return thousands of rows — tens of KB of JSON that phi4-mini
+would have to prefill on CPU, or that overflows its context window. Instead of
+the raw JSON, the model gets:
+    - the first AGENT_RESULT_MAX_ROWS rows as a compact pipe-separated table
+      (cells cut at AGENT_RESULT_MAX_CELL characters)
+    - per-column statistics over *all* rows (non-null count, min/max, distinct
+      values, and the top values of low-cardinality columns)
+    - an "N more rows" marker naming the stored result
+The full result is saved under .cache/agent_results/ (last AGENT_RESULT_KEEP
+kept) so it can be exported to CSV with the agent's :export command.
+"""
+
+import csv
+import os
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+
+import mcp_client
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AGENT_RESULT_DIR = os.getenv("AGENT_RESULT_DIR", os.path.join(PROJECT_DIR, ".cache", "agent_results"))
+AGENT_RESULT_MAX_ROWS = int(os.getenv("AGENT_RESULT_MAX_ROWS", "20"))
+AGENT_RESULT_MAX_CELL = int(os.getenv("AGENT_RESULT_MAX_CELL", "40"))
+AGENT_RESULT_KEEP = int(os.getenv("AGENT_RESULT_KEEP", "50"))
+
+# Results this small (and within the row cap) go to the model unchanged
+_PASSTHROUGH_CHARS = 2000
+# Columns with at most this many distinct values list their top values
+_TOP_VALUES_MAX_DISTINCT = 10
+
+_seq = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for logging context size."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _cell(value) -> str:
+    text = "NULL" if value is None else str(value).replace("\n", " ").replace("|", "/")
+    return text if len(text) <= AGENT_RESULT_MAX_CELL else text[:AGENT_RESULT_MAX_CELL - 3] + "..."
+
+
+def _number(value) -> float | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def column_stats(rows: list[dict], column: str) -> str:
+    """One line of statistics for `column` over every row."""
+    values = [r.get(column) for r in rows if r.get(column) not in (None, "")]
+    if not values:
+        return f"{column}: all NULL"
+    parts = [f"{len(values)} non-null"]
+    numbers = [_number(v) for v in values]
+    if all(n is not None for n in numbers):
+        lo, hi = min(numbers), max(numbers)
+        parts.append(f"min {lo:g}, max {hi:g}")
+    else:
+        texts = sorted(str(v) for v in values)
+        parts.append(f"min {_cell(texts[0])}, max {_cell(texts[-1])}")
+    counts = Counter(str(v) for v in values)
+    parts.append(f"{len(counts)} distinct")
+    if 1 < len(counts) <= _TOP_VALUES_MAX_DISTINCT:
+        parts.append("top " + ", ".join(f"{_cell(v)} ({n})" for v, n in counts.most_common(5)))
+    return f"{column}: " + "; ".join(parts)
+
+
+def render_table(rows: list[dict], columns: list[str]) -> list[str]:
+    lines = [" | ".join(columns)]
+    lines += [" | ".join(_cell(r.get(c)) for c in columns) for r in rows]
+    return lines
+
+
+def store_result(raw: str) -> str:
+    """Save a full tool result; returns its id. Keeps the newest AGENT_RESULT_KEEP results."""
+    global _seq
+    _seq += 1
+    result_id = f"r{time.strftime('%Y%m%d_%H%M%S')}_{_seq}"
+    os.makedirs(AGENT_RESULT_DIR, exist_ok=True)
+    with open(os.path.join(AGENT_RESULT_DIR, f"{result_id}.json"), "w", encoding="utf-8") as f:
+        f.write(raw)
+    stored = sorted(
+        (os.path.join(AGENT_RESULT_DIR, name) for name in os.listdir(AGENT_RESULT_DIR) if name.endswith(".json")),
+        key=os.path.getmtime,
+    )
+    for path in stored[:-AGENT_RESULT_KEEP]:
+        os.remove(path)
+    return result_id
+
+
+def compact_result(raw: str, max_rows: int = AGENT_RESULT_MAX_ROWS) -> tuple[str, dict]:
+    """
+    Compact form of a tool result for the model. Returns (text, info) where
+    info has rows, columns, raw_chars, tokens, truncated and result_id (None
+    when nothing was stored). Small results, and results that aren't flat row
+    sets (errors, scalars, describe_table output), pass through unchanged.
+    """
+    rows = mcp_client.parse_rows(raw)
+    info = {"rows": len(rows), "columns": 0, "raw_chars": len(raw), "truncated": False, "result_id": None}
+    flat = all(isinstance(r, dict) and not any(isinstance(v, (dict, list)) for v in r.values()) for r in rows)
+    small = len(rows) <= max_rows and len(raw) <= _PASSTHROUGH_CHARS
+    if not rows or not flat or small:
+        info["tokens"] = estimate_tokens(raw)
+        return raw, info
+
+    columns = list(dict.fromkeys(c for r in rows for c in r))
+    info["columns"] = len(columns)
+    info["result_id"] = store_result(raw)
+    shown = rows[:max_rows]
+    lines = [f"{len(rows)} row(s) x {len(columns)} column(s)"
+             + (f"; first {len(shown)} shown" if len(rows) > len(shown) else "")]
+    lines += render_table(shown, columns)
+    if len(rows) > len(shown):
+        info["truncated"] = True
+        lines.append(f"... {len(rows) - len(shown)} more rows (full result saved as {info['result_id']})")
+        lines.append("Column stats (all rows):")
+        lines += [f"  {column_stats(rows, c)}" for c in columns]
+    text = "\n".join(lines)
+    info["tokens"] = estimate_tokens(text)
+    return text, info
+
+
+def export_csv(result_id: str, path: str | None = None) -> str:
+    """Write a stored result to CSV (default: <result_id>.csv in the working directory). Returns the path."""
+    with open(os.path.join(AGENT_RESULT_DIR, f"{result_id}.json"), encoding="utf-8") as f:
+        rows = mcp_client.parse_rows(f.read())
+    path = path or f"{result_id}.csv"
+    columns = list(dict.fromkeys(c for r in rows for c in r))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
@@ -0,0 +1,157 @@
+"""
+tracing.py — Opt-in span tracing and profiling for audit.py and investigate.py.
+
+Off by default; turn it on with --trace / --profile on either script, or with
+TRACE=1 / TRACE_PROFILE=1. While on, the pipeline stages and every MCP and
+Ollama call record a span (name, category, start, duration, a few args):
+    audit.py        connectivity ping, Step 1a, Step 1b, per-row diagnose,
+                    workbook write, history record
+    investigate.py  connectivity ping, per-row evidence stage, each evidence
+                    tier, fast-path (fast-path/playbook/learned rules), LLM
+                    stage, workbook write, history record
+    mcp_client.py   every call_tool (database and the start of the query)
+    llm_pool.py     every Ollama chat attempt per backend, warm-up/unload
+At the end the spans are written as a Chrome trace (traces/<script>_<time>.json).
+Open it in https://ui.perfetto.dev or chrome://tracing. Each asyncio task gets
+its own track, so concurrent rows and queries show side by side. --profile
+also runs the whole script under cProfile and dumps traces/<script>_<time>.prof
+for snakeviz, flameprof or pstats.
+
+When tracing is off, span() returns a shared no-op context manager, so the
+instrumented code pays one global check per call.
+"""
+
+import asyncio
+import contextlib
+import cProfile
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TRACE = os.getenv("TRACE", "0") == "1"
+TRACE_PROFILE = os.getenv("TRACE_PROFILE", "0") == "1"
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(PROJECT_DIR, "traces"))
+
+# Longest string kept in a span's args (queries, prompts)
+_ARG_CHARS = 300
+
+_events: list[dict] | None = None    # None while tracing is off
+_origin = 0.0
+_tracks: dict[int, int] = {}
+_profiler: cProfile.Profile | None = None
+_paths: dict[str, str] = {}
+_NOOP = contextlib.nullcontext({})
+
+
+def enabled() -> bool:
+    return _events is not None
+
+
+def start(script: str, trace: bool | None = None, profile: bool | None = None):
+    """
+    Begin tracing and/or profiling for this process. trace/profile default to
+    TRACE / TRACE_PROFILE. Output paths are fixed here and written by stop().
+    """
+    global _events, _origin, _profiler
+    trace = TRACE if trace is None else trace
+    profile = TRACE_PROFILE if profile is None else profile
+    stem = os.path.join(TRACE_DIR, f"{script}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    if trace:
+        _events, _origin = [], time.perf_counter()
+        _tracks.clear()
+        _paths["trace"] = stem + ".json"
+    if profile:
+        _profiler = cProfile.Profile()
+        _paths["profile"] = stem + ".prof"
+        _profiler.enable()
+
+
+def _track() -> int:
+    """Chrome-trace thread id of the current asyncio task (one track per task)."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    key = id(task) if task is not None else 0
+    if key not in _tracks:
+        _tracks[key] = len(_tracks) + 1
+        name = task.get_name() if task is not None else "main"
+        _events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": _tracks[key], "args": {"name": name}})
+    return _tracks[key]
+
+
+def _arg(value):
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = str(value)
+    return text if len(text) <= _ARG_CHARS else text[:_ARG_CHARS - 3] + "..."
+
+
+@contextlib.contextmanager
+def _span(name: str, cat: str, args: dict):
+    tid = _track()
+    begin = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if _events is not None:
+            _events.append({
+                "ph": "X", "name": name, "cat": cat, "pid": 1, "tid": tid,
+                "ts": round((begin - _origin) * 1e6, 1),
+                "dur": round((time.perf_counter() - begin) * 1e6, 1),
+                "args": {k: _arg(v) for k, v in args.items()},
+            })
+
+
+def span(name: str, cat: str = "stage", **args):
+    """
+    Context manager timing one span. Yields the args dict, so the body can add
+    results (row counts, tokens) that end up in the trace:
+        with tracing.span("Step 1a", rows=None) as s:
+            rows = await ...
+            s["rows"] = len(rows)
+    """
+    if _events is None:
+        return _NOOP
+    return _span(name, cat, args)
+
+
+def stop(log=print) -> dict[str, str]:
+    """Write the trace and profile (whichever were started). Returns {"trace"/"profile": path}."""
+    global _events, _profiler
+    written = {}
+    if _profiler is not None:
+        _profiler.disable()
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        _profiler.dump_stats(_paths["profile"])
+        written["profile"] = _paths["profile"]
+        _profiler = None
+    if _events is not None:
+        events, _events = _events, None
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        with open(_paths["trace"], "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        written["trace"] = _paths["trace"]
+        totals: dict[str, list[float]] = defaultdict(list)
+        for e in events:
+            if e["ph"] == "X":
+                totals[e["name"]].append(e["dur"])
+        top = sorted(totals.items(), key=lambda kv: -sum(kv[1]))[:8]
+        log(f"\n[TRACE] {sum(len(d) for d in totals.values())} span(s) -> {written['trace']}")
+        for name, durations in top:
+            log(f"[TRACE]   {name:<24} {len(durations):>5} x  {sum(durations) / 1000:>10.0f} ms total  "
+                f"{max(durations) / 1000:>8.0f} ms max")
+    if "profile" in written:
+        log(f"[TRACE] cProfile -> {written['profile']}")
+    return written